@@ -0,0 +1,3 @@
+from .broker import UnixSocketBroker
+from .sharded import ShardedChannelLayer
+from .transports import BaseTransport, RedisTransport, UnixSocketTransport
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from .transports import (
+    OP_ACK,
+    OP_MESSAGE,
+    OP_PUBLISH,
+    OP_SUBSCRIBE,
+    OP_UNSUBSCRIBE,
+    encode_frame,
+    read_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UnixSocketBroker:
+    """
+    Minimal pub/sub broker on a Unix socket.
+
+    Stands in for Redis when several ASGI workers run on one machine, in
+    development and in tests. Start it with ``manage.py run_channel_broker``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.subscribers = defaultdict(set)
+        self.server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f"Channel broker listening on {self.path}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        topics = set()
+        try:
+            while True:
+                op, topic, payload = await read_frame(reader)
+                if op == OP_SUBSCRIBE:
+                    self.subscribers[topic].add(writer)
+                    topics.add(topic)
+                    writer.write(encode_frame(OP_ACK, topic))
+                elif op == OP_UNSUBSCRIBE:
+                    self._unsubscribe(topic, writer)
+                    topics.discard(topic)
+                    writer.write(encode_frame(OP_ACK, topic))
+                elif op == OP_PUBLISH:
+                    frame = encode_frame(OP_MESSAGE, topic, payload)
+                    for subscriber in list(self.subscribers.get(topic, ())):
+                        subscriber.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for topic in topics:
+                self._unsubscribe(topic, writer)
+            writer.close()
+
+    def _unsubscribe(self, topic, writer):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(writer)
+        if not subscribers:
+            del self.subscribers[topic]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
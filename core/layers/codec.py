@@ -0,0 +1,40 @@
+import base64
+import json
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is an optional speedup
+    msgpack = None
+
+_BYTES_KEY = "__bytes__"
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {_BYTES_KEY: base64.b64encode(value).decode("ascii")}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode_object(value):
+    if len(value) == 1 and _BYTES_KEY in value:
+        return base64.b64decode(value[_BYTES_KEY])
+    return value
+
+
+def dumps(message):
+    """
+    Serializes a channel layer message, keeping bytes values as bytes.
+    """
+    if msgpack is not None:
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(_encode(message), separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data, object_hook=_decode_object)
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+import uuid
+import zlib
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.utils.module_loading import import_string
+from . import codec
+from .transports import TRANSPORTS
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedChannelLayer(BaseChannelLayer):
+    """
+    Channel layer for several ASGI processes on top of a pub/sub transport.
+
+    Channels and group memberships live in the process that owns them; only
+    messages for other processes go through the transport. Every group maps
+    to one pub/sub topic, placed on a shard by a stable hash of the group
+    name, so document groups (``document_<doc_uuid>``) spread over the shards
+    by document. A process subscribes to a group topic only while it has
+    local members in that group.
+
+    Config:
+        shards (List[str]): Transport URLs, e.g. ``redis://redis:6379/3`` or ``unix:///tmp/broker.sock``.
+        transport (str, optional): Dotted path of a BaseTransport subclass used for every shard instead of picking one by URL scheme.
+        prefix (str): Prefix of the pub/sub topics.
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(
+        self,
+        shards,
+        transport=None,
+        prefix="asgi",
+        expiry=60,
+        capacity=100,
+        channel_capacity=None,
+        **kwargs,
+    ):
+        super().__init__(
+            expiry=expiry, capacity=capacity, channel_capacity=channel_capacity
+        )
+        if not shards:
+            raise ValueError("ShardedChannelLayer needs at least one shard")
+        self.shard_urls = list(shards)
+        self.transport_class = import_string(transport) if transport else None
+        self.prefix = prefix
+        self.client_prefix = uuid.uuid4().hex
+        self.channels = {}
+        self.groups = {}
+        self.transports = None
+        self._subscriptions = set()
+        self._loop = None
+        self._ready = None
+
+    # Topology
+
+    def _shard_index(self, key):
+        return zlib.crc32(key.encode("utf-8")) % len(self.shard_urls)
+
+    def _group_topic(self, group):
+        return f"{self.prefix}.group.{group}"
+
+    def _process_topic(self, client_prefix):
+        return f"{self.prefix}.process.{client_prefix}"
+
+    def _topic_shard(self, topic):
+        # Topics are "<prefix>.<kind>.<key>", sharded on the key
+        key = topic[len(self.prefix) + 1 :].split(".", 1)[1]
+        return self.transports[self._shard_index(key)]
+
+    def _owner(self, channel):
+        if "!" not in channel:
+            return None
+        return channel.split("!", 1)[0].rsplit(".", 1)[-1]
+
+    def _make_transport(self, url):
+        transport_class = self.transport_class or TRANSPORTS[url.split("://", 1)[0]]
+        return transport_class(url, self._on_message)
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            await self._ready.wait()
+            if self.transports is None:
+                raise ConnectionError("Channel layer transports are not connected")
+            return
+        self._loop = loop
+        self._ready = asyncio.Event()
+        try:
+            transports = [self._make_transport(url) for url in self.shard_urls]
+            for transport in transports:
+                await transport.connect()
+            self.transports = transports
+            # Restore subscriptions made on a previous event loop
+            subscriptions, self._subscriptions = self._subscriptions, set()
+            subscriptions.add(self._process_topic(self.client_prefix))
+            for topic in subscriptions:
+                await self._subscribe(topic)
+        except Exception:
+            self._loop = None
+            self.transports = None
+            raise
+        finally:
+            self._ready.set()
+
+    async def _subscribe(self, topic):
+        if topic not in self._subscriptions:
+            self._subscriptions.add(topic)
+            await self._topic_shard(topic).subscribe(topic)
+
+    async def _unsubscribe(self, topic):
+        if topic in self._subscriptions:
+            self._subscriptions.discard(topic)
+            await self._topic_shard(topic).unsubscribe(topic)
+
+    async def _publish(self, topic, envelope):
+        await self._topic_shard(topic).publish(topic, codec.dumps(envelope))
+
+    def _on_message(self, topic, payload):
+        try:
+            envelope = codec.loads(payload)
+        except Exception as e:
+            logger.error(f"Dropping undecodable message on {topic}: {e}")
+            return
+        if envelope.get("group") is not None:
+            if envelope["origin"] == self.client_prefix:
+                return  # Local members were served by group_send itself
+            for channel in list(self.groups.get(envelope["group"], ())):
+                self._deliver(channel, dict(envelope["message"]))
+        else:
+            self._deliver(envelope["channel"], envelope["message"])
+
+    def _deliver(self, channel, message):
+        queue = self.channels.setdefault(channel, asyncio.Queue())
+        if queue.qsize() >= self.get_capacity(channel):
+            logger.warning(f"Channel {channel} is full, dropping message.")
+            return False
+        queue.put_nowait((time.time() + self.expiry, message))
+        return True
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        await self._connect()
+        owner = self._owner(channel)
+        if owner == self.client_prefix:
+            if not self._deliver(channel, message):
+                raise ChannelFull(channel)
+            return
+        topic = (
+            self._process_topic(owner)
+            if owner
+            else f"{self.prefix}.channel.{channel}"
+        )
+        await self._publish(
+            topic,
+            {"origin": self.client_prefix, "channel": channel, "message": message},
+        )
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        await self._connect()
+        if self._owner(channel) is None:
+            await self._subscribe(f"{self.prefix}.channel.{channel}")
+        queue = self.channels.setdefault(channel, asyncio.Queue())
+        while True:
+            try:
+                expires, message = await queue.get()
+            finally:
+                if queue.empty() and self.channels.get(channel) is queue:
+                    del self.channels[channel]
+            if expires >= time.time():
+                return message
+            queue = self.channels.setdefault(channel, asyncio.Queue())
+
+    async def new_channel(self, prefix="specific."):
+        await self._connect()
+        return f"{prefix}{self.client_prefix}!{uuid.uuid4().hex}"
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        await self._connect()
+        self.groups.setdefault(group, set()).add(channel)
+        await self._subscribe(self._group_topic(group))
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        members = self.groups.get(group)
+        if members is None:
+            return
+        members.discard(channel)
+        if not members:
+            del self.groups[group]
+            await self._connect()
+            await self._unsubscribe(self._group_topic(group))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Group name not valid"
+        await self._connect()
+        for channel in list(self.groups.get(group, ())):
+            self._deliver(channel, dict(message))
+        await self._publish(
+            self._group_topic(group),
+            {"origin": self.client_prefix, "group": group, "message": message},
+        )
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+        if self._loop is not None:
+            for topic in list(self._subscriptions):
+                if topic != self._process_topic(self.client_prefix):
+                    await self._unsubscribe(topic)
+
+    async def close(self):
+        if self.transports is not None:
+            for transport in self.transports:
+                await transport.close()
+        self.transports = None
+        self._loop = None
@@ -0,0 +1,172 @@
+import asyncio
+import collections
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+# Frame of the Unix socket broker protocol: op, topic length, payload length.
+FRAME_HEADER = struct.Struct(">BHI")
+OP_SUBSCRIBE = 1
+OP_UNSUBSCRIBE = 2
+OP_PUBLISH = 3
+OP_MESSAGE = 4
+OP_ACK = 5
+
+
+def encode_frame(op, topic, payload=b""):
+    topic = topic.encode("utf-8")
+    return FRAME_HEADER.pack(op, len(topic), len(payload)) + topic + payload
+
+
+async def read_frame(reader):
+    op, topic_length, payload_length = FRAME_HEADER.unpack(
+        await reader.readexactly(FRAME_HEADER.size)
+    )
+    topic = await reader.readexactly(topic_length)
+    payload = await reader.readexactly(payload_length)
+    return op, topic.decode("utf-8"), payload
+
+
+class BaseTransport:
+    """
+    Publish/subscribe connection to one shard of a ShardedChannelLayer.
+
+    Subclasses deliver every message published on a subscribed topic by
+    calling ``on_message(topic, payload)``.
+    """
+
+    def __init__(self, url, on_message):
+        self.url = url
+        self.on_message = on_message
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def subscribe(self, topic):
+        raise NotImplementedError
+
+    async def unsubscribe(self, topic):
+        raise NotImplementedError
+
+    async def publish(self, topic, payload):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+
+class RedisTransport(BaseTransport):
+    """
+    Transport over Redis pub/sub, for production deployments.
+    """
+
+    async def connect(self):
+        import redis.asyncio as aioredis
+
+        self.client = aioredis.from_url(self.url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._subscribed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._listen())
+
+    async def _listen(self):
+        # get_message fails until the pub/sub connection exists
+        await self._subscribed.wait()
+        while True:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading from {self.url}: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message and message["type"] == "message":
+                self.on_message(message["channel"].decode("utf-8"), message["data"])
+
+    async def subscribe(self, topic):
+        await self.pubsub.subscribe(topic)
+        self._subscribed.set()
+
+    async def unsubscribe(self, topic):
+        await self.pubsub.unsubscribe(topic)
+
+    async def publish(self, topic, payload):
+        await self.client.publish(topic, payload)
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class UnixSocketTransport(BaseTransport):
+    """
+    Transport to a local UnixSocketBroker, for development and tests.
+
+    The url has the form ``unix:///path/to/broker.sock``.
+    """
+
+    async def connect(self):
+        path = self.url[len("unix://") :]
+        self.reader, self.writer = await asyncio.open_unix_connection(path)
+        # Acknowledgements come back in the order the requests were sent
+        self._pending_acks = collections.deque()
+        self._task = asyncio.ensure_future(self._listen())
+
+    async def _listen(self):
+        try:
+            while True:
+                op, topic, payload = await read_frame(self.reader)
+                if op == OP_MESSAGE:
+                    self.on_message(topic, payload)
+                elif op == OP_ACK and self._pending_acks:
+                    ack = self._pending_acks.popleft()
+                    if not ack.done():
+                        ack.set_result(None)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.error(f"Connection to channel broker {self.url} lost.")
+
+    async def _write(self, frame):
+        self.writer.write(frame)
+        await self.writer.drain()
+
+    async def _request(self, frame):
+        # Wait until the broker applied the (un)subscription, so messages
+        # published right after it are routed accordingly.
+        ack = asyncio.get_running_loop().create_future()
+        self._pending_acks.append(ack)
+        await self._write(frame)
+        await ack
+
+    async def subscribe(self, topic):
+        await self._request(encode_frame(OP_SUBSCRIBE, topic))
+
+    async def unsubscribe(self, topic):
+        await self._request(encode_frame(OP_UNSUBSCRIBE, topic))
+
+    async def publish(self, topic, payload):
+        await self._write(encode_frame(OP_PUBLISH, topic, payload))
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+TRANSPORTS = {
+    "redis": RedisTransport,
+    "rediss": RedisTransport,
+    "unix": UnixSocketTransport,
+}
@@ -0,0 +1,18 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from core.layers import UnixSocketBroker
+
+
+class Command(BaseCommand):
+    help = "Runs the local pub/sub broker used by ShardedChannelLayer unix:// shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the Unix socket to listen on.")
+
+    def handle(self, *args, **options):
+        broker = UnixSocketBroker(options["path"])
+        self.stdout.write(f"Channel broker listening on {options['path']}")
+        try:
+            asyncio.run(broker.serve_forever())
+        except KeyboardInterrupt:
+            pass
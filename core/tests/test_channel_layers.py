@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from core.layers import ShardedChannelLayer, UnixSocketBroker
+
+
+@pytest_asyncio.fixture
+async def broker(tmp_path):
+    broker = UnixSocketBroker(str(tmp_path / "broker.sock"))
+    await broker.start()
+    yield broker
+    await broker.close()
+
+
+@pytest_asyncio.fixture
+async def layers(broker):
+    layers = [
+        ShardedChannelLayer(shards=[f"unix://{broker.path}"]) for _ in range(2)
+    ]
+    yield layers
+    for layer in layers:
+        await layer.close()
+
+
+async def receive(layer, channel):
+    return await asyncio.wait_for(layer.receive(channel), timeout=2)
+
+
+@pytest.mark.asyncio
+class TestShardedChannelLayer:
+    async def test_send_reaches_channel_of_other_process(self, layers):
+        first, second = layers
+        channel = await second.new_channel()
+
+        await first.send(channel, {"type": "test.message", "bytes": b"\x00\x01"})
+
+        assert await receive(second, channel) == {
+            "type": "test.message",
+            "bytes": b"\x00\x01",
+        }
+
+    async def test_group_send_reaches_local_and_remote_members(self, layers):
+        first, second = layers
+        local = await first.new_channel()
+        remote = await second.new_channel()
+        await first.group_add("document_abc", local)
+        await second.group_add("document_abc", remote)
+
+        await first.group_send("document_abc", {"type": "yjs_update", "bytes": b"x"})
+
+        assert (await receive(first, local))["bytes"] == b"x"
+        assert (await receive(second, remote))["bytes"] == b"x"
+        # The sender is not delivered its own message twice through the transport
+        await asyncio.sleep(0.05)
+        assert local not in first.channels
+
+    async def test_group_discard_stops_delivery(self, layers):
+        first, second = layers
+        remote = await second.new_channel()
+        await second.group_add("document_abc", remote)
+        await second.group_discard("document_abc", remote)
+
+        await first.group_send("document_abc", {"type": "yjs_update"})
+
+        await asyncio.sleep(0.05)
+        assert remote not in second.channels
+
+
+def test_groups_are_sharded_by_stable_hash():
+    layer = ShardedChannelLayer(shards=["unix:///a", "unix:///b", "unix:///c"])
+    other = ShardedChannelLayer(shards=["unix:///a", "unix:///b", "unix:///c"])
+    indexes = {layer._shard_index(f"document_{i}") for i in range(100)}
+
+    assert indexes == {0, 1, 2}
+    assert all(
+        layer._shard_index(f"document_{i}") == other._shard_index(f"document_{i}")
+        for i in range(100)
+    )
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import AccessLevel, Document
+
+DocumentAccess = namedtuple(
+    "DocumentAccess", ["owner_id", "public_premission_access", "default_access_level"]
+)
+
+# Cached for a user without an AccessLevel row on a document.
+NO_ROW = -1
+
+
+class LocalCache:
+    """
+    Per-process LRU in front of the Django cache.
+
+    Entries expire after ``ttl`` seconds, which bounds how long a change made
+    by another process, that only clears its own LRU, can go unseen here.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache(
+    settings.DOCUMENT_ACCESS_CACHE_SIZE,
+    settings.DOCUMENT_ACCESS_LOCAL_TTL.total_seconds(),
+)
+
+
+def get_document_key(document_id):
+    return f"document_access:{document_id}"
+
+
+def get_row_key(user_id, document_id):
+    return f"document_access:{document_id}:{user_id}"
+
+
+def _get_cached(key, load):
+    value = local_cache.get(key)
+    if value is not None:
+        return value
+    # A per-process Django cache is not cleared by the other processes
+    shared = settings.DOCUMENT_ACCESS_CACHE_SHARED
+    value = cache.get(key) if shared else None
+    if value is None:
+        value = load()
+        if value is None:
+            return None
+        if shared:
+            cache.set(key, value, settings.DOCUMENT_ACCESS_CACHE_TIMEOUT.total_seconds())
+    local_cache.set(key, value)
+    return value
+
+
+def get_document_access(document_id):
+    """
+    Returns the access settings of a document, None if it does not exist.
+    """
+
+    def load():
+        row = (
+            Document.objects.filter(pk=document_id)
+            .values_list("owner_id", "public_premission_access", "default_access_level")
+            .first()
+        )
+        return DocumentAccess(*row) if row else None
+
+    return _get_cached(get_document_key(document_id), load)
+
+
+def _get_row_level(user, document_id, document):
+    def load():
+        level = (
+            AccessLevel.objects.filter(user_id=user.id, document_id=document_id)
+            .values_list("access_level", flat=True)
+            .first()
+        )
+        if user.id == document.owner_id and level != AccessLevel.PERMISSION_MAP["Owner"]:
+            # Repairs the owner's row, only on a cache miss
+            AccessLevel.objects.update_or_create(
+                user_id=user.id,
+                document_id=document_id,
+                defaults={"access_level": AccessLevel.PERMISSION_MAP["Owner"]},
+            )
+            level = AccessLevel.PERMISSION_MAP["Owner"]
+        return NO_ROW if level is None else level
+
+    return _get_cached(get_row_key(user.id, document_id), load)
+
+
+def get_access_level(user, document):
+    """
+    Resolves the access level of a user on a document.
+
+    The owner is always Owner, then the user's AccessLevel row counts, then
+    the document's default level.
+
+    Args:
+        user (User): The user, anonymous ones only get the default level.
+        document (Document | int): The document or its ID.
+
+    Returns:
+        int | None: The level, None if the document does not exist.
+    """
+    document_id = int(getattr(document, "pk", document))
+    access = get_document_access(document_id)
+    if access is None:
+        return None
+    if user.id is None:
+        return access.default_access_level
+    level = _get_row_level(user, document_id, access)
+    if user.id == access.owner_id:
+        return AccessLevel.PERMISSION_MAP["Owner"]
+    return access.default_access_level if level == NO_ROW else level
+
+
+def has_access(user, document, required_level):
+    level = get_access_level(user, document)
+    return level is not None and level >= required_level
+
+
+def can_manage_permissions(user, document):
+    """
+    Whether a user may change who has access to a document.
+    """
+    document_id = int(getattr(document, "pk", document))
+    access = get_document_access(document_id)
+    if access is None:
+        return False
+    return access.public_premission_access or has_access(
+        user, document_id, AccessLevel.PERMISSION_MAP["Admin"]
+    )
+
+
+def _delete(*keys):
+    for key in keys:
+        local_cache.delete(key)
+    cache.delete_many(keys)
+
+
+def invalidate(*keys):
+    """
+    Drops cache entries now and again once the transaction commits, so a
+    request racing the commit cannot put the old value back.
+    """
+    _delete(*keys)
+    transaction.on_commit(lambda: _delete(*keys))
+
+
+def invalidate_document(document_id):
+    invalidate(get_document_key(document_id))
+
+
+def invalidate_access(user_id, document_id):
+    invalidate(get_row_key(user_id, document_id))
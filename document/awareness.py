@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from django.conf import settings
+from ypy_websocket.yutils import Decoder, YMessageType, read_message, write_var_uint
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Awareness state of a client that went away, as encoded by y-protocols.
+REMOVED_STATE = "null"
+
+
+def decode_awareness_update(message):
+    """
+    Reads the entries of an awareness frame.
+
+    Returns:
+        List[Tuple[int, int, Optional[str]]]: ``(client_id, clock, state)`` per
+        client, the state being the raw JSON text or None once removed.
+    """
+    decoder = Decoder(read_message(message[1:]))
+    entries = []
+    for _ in range(decoder.read_var_uint()):
+        client_id = decoder.read_var_uint()
+        clock = decoder.read_var_uint()
+        state = decoder.read_var_string()
+        entries.append((client_id, clock, None if state in ("", REMOVED_STATE) else state))
+    return entries
+
+
+def encode_awareness_update(entries):
+    body = [write_var_uint(len(entries))]
+    for client_id, clock, state in entries:
+        state = (REMOVED_STATE if state is None else state).encode("utf-8")
+        body += [write_var_uint(client_id), write_var_uint(clock)]
+        body += [write_var_uint(len(state)), state]
+    body = b"".join(body)
+    return bytes([YMessageType.AWARENESS]) + write_var_uint(len(body)) + body
+
+
+class RoomAwareness:
+    """
+    Ephemeral awareness state (cursors, selections, user info) of a room.
+
+    Kept in memory only and never persisted. Stale and duplicate entries are
+    dropped, and each client's changes are forwarded at most once per
+    interval, the latest state winning, while removals go out right away.
+    """
+
+    def __init__(self, room, interval=None):
+        self.room = room
+        interval = settings.DOCUMENT_AWARENESS_INTERVAL if interval is None else interval
+        self.interval = interval.total_seconds()
+        self.states = {}
+        # Client ids announced through each local connection
+        self.clients = {}
+        self.last_sent = {}
+        self.pending = {}
+        self._timer = None
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self.states)
+
+    def apply(self, entries, channel_name=None):
+        """
+        Merges awareness entries into the room state.
+
+        Returns:
+            list: The entries that changed something.
+        """
+        changed = []
+        for client_id, clock, state in entries:
+            current = self.states.get(client_id)
+            if current is not None and (
+                clock < current[0] or (clock == current[0] and state == current[1])
+            ):
+                metrics.incr("awareness.dropped")
+                continue
+            if current is None and state is None:
+                continue  # Removal of a client this room never saw
+            if state is None:
+                del self.states[client_id]
+                self.last_sent.pop(client_id, None)
+            else:
+                self.states[client_id] = (clock, state)
+            if channel_name is not None:
+                clients = self.clients.setdefault(channel_name, set())
+                if state is None:
+                    clients.discard(client_id)
+                else:
+                    clients.add(client_id)
+            changed.append((client_id, clock, state))
+        return changed
+
+    async def receive(self, message, channel_name):
+        """
+        Handles an awareness frame sent by a local connection.
+        """
+        metrics.incr("awareness.frames")
+        try:
+            entries = decode_awareness_update(message)
+        except Exception as e:
+            logger.error(f"Invalid awareness message from {channel_name}: {e}")
+            metrics.incr("awareness.rejected")
+            return
+        now = time.monotonic()
+        due = []
+        for entry in self.apply(entries, channel_name):
+            client_id, _, state = entry
+            last_sent = self.last_sent.get(client_id)
+            if state is None or last_sent is None or now - last_sent >= self.interval:
+                self.pending.pop(client_id, None)
+                if state is not None:
+                    self.last_sent[client_id] = now
+                due.append(entry)
+            else:
+                self.pending[client_id] = (entry, channel_name)
+                metrics.incr("awareness.throttled")
+        if self.pending and self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.interval, self._spawn_flush)
+        if due:
+            await self.publish(due, channel_name)
+
+    def _spawn_flush(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """
+        Forwards the latest throttled state of every client.
+        """
+        pending, self.pending = self.pending, {}
+        now = time.monotonic()
+        by_channel = {}
+        for client_id, (entry, channel_name) in pending.items():
+            self.last_sent[client_id] = now
+            by_channel.setdefault(channel_name, []).append(entry)
+        for channel_name, entries in by_channel.items():
+            await self.publish(entries, channel_name)
+
+    async def publish(self, entries, sender_channel):
+        metrics.incr("awareness.forwarded", len(entries))
+        await self.room.publish(
+            {
+                "type": "awareness_update",
+                "bytes": encode_awareness_update(entries),
+                "sender_channel": sender_channel,
+            },
+            sender_channel=sender_channel,
+        )
+
+    def snapshot(self):
+        """
+        Encodes the state of every known client as one frame, for joiners.
+
+        Returns:
+            Optional[bytes]: The awareness frame, None when nobody is present.
+        """
+        if not self.states:
+            return None
+        return encode_awareness_update(
+            [(client_id, clock, state) for client_id, (clock, state) in self.states.items()]
+        )
+
+    async def disconnect(self, channel_name):
+        """
+        Removes the clients of a closed connection and tells the peers.
+        """
+        client_ids = self.clients.pop(channel_name, set())
+        entries = [
+            (client_id, self.states[client_id][0] + 1, None)
+            for client_id in client_ids
+            if client_id in self.states
+        ]
+        for client_id, _, _ in entries:
+            self.pending.pop(client_id, None)
+        if self.apply(entries):
+            await self.publish(entries, channel_name)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,83 @@
+import hashlib
+import mmap
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from django.conf import settings
+from . import metrics
+
+
+class FileSystemBlobStore:
+    """
+    Content-addressed payload files on local disk.
+
+    A payload is stored once under the SHA-256 of its content, so identical
+    payloads share a file, and is read back memory-mapped.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, key):
+        return self.root / key[:2] / key[2:4] / key
+
+    def put(self, data):
+        """
+        Stores a payload unless a file with the same content exists.
+
+        Returns:
+            str: The content address of the payload.
+        """
+        key = hashlib.sha256(data).hexdigest()
+        path = self.path(key)
+        if path.exists():
+            # Refreshed so collect_document_blobs keeps it for the new row
+            os.utime(path)
+            metrics.incr("blobs.deduplicated")
+            return key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        metrics.incr("blobs.written")
+        metrics.incr("blobs.bytes_written", len(data))
+        return key
+
+    def open(self, key):
+        """
+        Maps a payload into memory.
+
+        Returns:
+            memoryview: A read-only view of the file, valid while referenced.
+        """
+        with open(self.path(key), "rb") as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def delete(self, key):
+        self.path(key).unlink(missing_ok=True)
+
+    def keys(self):
+        for path in self.root.glob("??/??/*"):
+            if not path.name.startswith(".tmp-"):
+                yield path.name, path.stat().st_mtime
+
+
+@lru_cache(maxsize=None)
+def _get_store(root):
+    return FileSystemBlobStore(root)
+
+
+def get_blob_store():
+    """
+    Returns the configured blob store, None when DOCUMENT_BLOB_STORE_DIR is unset.
+    """
+    root = settings.DOCUMENT_BLOB_STORE_DIR
+    return _get_store(str(root)) if root else None
@@ -0,0 +1,104 @@
+import lzma
+import zlib
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .blobs import get_blob_store
+
+RAW = "raw"
+# Payload kept in the blob store, the stored bytes being b"<sha256>:<length>"
+BLOB = "blob"
+
+# name -> (compress, decompress)
+CODECS = {
+    RAW: (bytes, bytes),
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def register_codec(name, compress, decompress):
+    """
+    Makes a codec available to DocumentUpdate payloads.
+
+    Args:
+        name (str): Stored in ``DocumentUpdate.codec``, at most 16 characters.
+        compress (Callable[[bytes], bytes]): Encodes a payload.
+        decompress (Callable[[bytes], bytes]): Restores a payload encoded by ``compress``.
+    """
+    if len(name) > 16:
+        raise ValueError(f"Codec name {name!r} is longer than 16 characters")
+    CODECS[name] = (compress, decompress)
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown document update codec {name!r}")
+
+
+def encode(data, codec=None, min_size=None):
+    """
+    Compresses a payload with ``codec`` (DOCUMENT_UPDATE_CODEC by default).
+
+    Payloads of DOCUMENT_BLOB_THRESHOLD bytes or more go to the blob store when
+    one is configured, uncompressed so they can be read memory-mapped. Payloads
+    under ``min_size`` bytes, or that do not get smaller, are kept raw.
+
+    Returns:
+        Tuple[str, bytes]: The codec actually used and the stored bytes.
+    """
+    codec = codec or settings.DOCUMENT_UPDATE_CODEC
+    if min_size is None:
+        min_size = settings.DOCUMENT_UPDATE_COMPRESS_MIN_SIZE
+    data = bytes(data)
+    store = get_blob_store()
+    if codec == BLOB or (
+        store is not None and len(data) >= settings.DOCUMENT_BLOB_THRESHOLD
+    ):
+        if store is None:
+            raise ImproperlyConfigured("DOCUMENT_BLOB_STORE_DIR is not set")
+        return BLOB, f"{store.put(data)}:{len(data)}".encode()
+    if codec == RAW or len(data) < min_size:
+        return RAW, data
+    compressed = get_codec(codec)[0](data)
+    if len(compressed) >= len(data):
+        return RAW, data
+    return codec, compressed
+
+
+def decode(codec, data):
+    """
+    Restores a stored payload to the original Yjs update bytes.
+
+    Blob payloads are returned as a memoryview of the mapped file, which
+    ``apply_update`` accepts as is. y_py still copies it into its own buffer,
+    the mapping only spares reading the file into a Python bytes object.
+    """
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    if codec == RAW or not codec:
+        return data
+    if codec == BLOB:
+        return read_blob(data)
+    return get_codec(codec)[1](data)
+
+
+def read_blob(reference):
+    store = get_blob_store()
+    if store is None:
+        raise ImproperlyConfigured("DOCUMENT_BLOB_STORE_DIR is not set")
+    key, length = bytes(reference).decode().split(":")
+    data = store.open(key)
+    if len(data) != int(length):
+        raise ValueError(f"Blob {key} has {len(data)} bytes, expected {length}")
+    return data
+
+
+def get_blob_key(codec, data):
+    """
+    Returns the content address of a stored payload, None when not in a blob.
+    """
+    if codec != BLOB:
+        return None
+    return bytes(data).decode().split(":")[0]
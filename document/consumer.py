@@ -6,13 +6,17 @@ django.setup()
 from django.utils import timezone
 from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
-from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
+from y_py import YDoc, encode_state_as_update, encode_state_vector
 from asgiref.sync import sync_to_async
 from django.core.exceptions import ObjectDoesNotExist
-from .models import Document, DocumentUpdate, DocumentView
+from .models import Document, DocumentView
+from .protocol import TextMessageDispatcher
+from .rooms import room_registry
+from .snapshots import get_document_payloads
 from ypy_websocket.yutils import (
     create_sync_step1_message,
     create_sync_step2_message,
+    create_update_message,
     YMessageType,
     YSyncMessageType,
     read_message,
@@ -24,6 +28,28 @@ logger = logging.getLogger(__name__)
 GROQ_API_KEY = settings.GROQ_API_KEY
 
 
+COMMENT_SYNC_TYPES = [
+    "comment_created",
+    "comment_updated",
+    "comment_deleted",
+    "reply_created",
+    "reply_updated",
+    "reply_deleted",
+]
+
+# Events whose handlers ignore the sender are not even queued for it.
+SENDER_EXCLUDED_EVENTS = {"yjs_update", "comment_commentreply_sync"}
+
+text_dispatcher = TextMessageDispatcher(
+    handlers={
+        "SpellCheck": "handle_spell_check",
+        "GrammarCheck": "handle_spell_check",
+        **{message_type: "handle_comment_sync" for message_type in COMMENT_SYNC_TYPES},
+    },
+    default="handle_default_text",
+)
+
+
 class DocumentConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         # Check if the document UUID is valid
@@ -39,8 +65,6 @@ class DocumentConsumer(AsyncWebsocketConsumer):
             logger.error(f"Document with UUID {self.doc_uuid} does not exist.")
             await self.close()
             return
-        self.room_group_name = f"document_{self.doc_uuid}"
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
 
         self.last_seen = await DocumentView.objects.acreate(
@@ -50,57 +74,44 @@ class DocumentConsumer(AsyncWebsocketConsumer):
             f"Document viewed by user: {self.user} for document {self.document.doc_uuid}"
         )
 
-        self.ydoc = YDoc()
-
-        document_updates = sync_to_async(
-            lambda: list(
-                DocumentUpdate.objects.filter(document=self.document)
-                .order_by("created_at")
-                .all()
-            )
+        self.room = await room_registry.join(
+            self.doc_uuid, self.document.id, self, self.fetch_updates
         )
-        document_updates = await document_updates()
-        for document_update in document_updates:
-            update_data = (
-                bytes(document_update.update_data)
-                if isinstance(document_update.update_data, memoryview)
-                else document_update.update_data
-            )
-            if not isinstance(update_data, bytes):
-                logger.error(
-                    f"Invalid update_data type: {type(update_data)}, value: {update_data}"
-                )
-                continue
-            try:
-                apply_update(self.ydoc, update_data)
-            except Exception as e:
-                logger.error(f"Error applying update: {e}")
 
-        state = encode_state_vector(self.ydoc)
+        state = encode_state_vector(self.room.ydoc)
         msg = create_sync_step1_message(state)
         await self.send(bytes_data=msg)
+        awareness = self.room.awareness.snapshot()
+        if awareness is not None:
+            await self.send(bytes_data=awareness)
         AI_MODEL = "llama-3.3-70b-versatile"
         self.spellgrammarcheck = SpellGrammarChecker(GROQ_API_KEY, AI_MODEL)
 
+    async def fetch_updates(self):
+        return await sync_to_async(get_document_payloads)(self.document.id)
+
     async def send_message(self, type: str, text_data=None, bytes_data=None):
+        # Local peers get the event object itself, other processes get it
+        # through the channel layer.
+        exclude = self.channel_name if type in SENDER_EXCLUDED_EVENTS else None
         if text_data:
-            await self.channel_layer.group_send(
-                self.room_group_name,
+            await self.room.publish(
                 {
                     "type": type,
                     "text_data": text_data,
                     "sender_channel": self.channel_name,
                 },
+                sender_channel=exclude,
             )
 
         if bytes_data:
-            await self.channel_layer.group_send(
-                self.room_group_name,
+            await self.room.publish(
                 {
                     "type": type,
                     "bytes": bytes_data,
                     "sender_channel": self.channel_name,
                 },
+                sender_channel=exclude,
             )
 
     async def spell_check(self, event):
@@ -114,7 +125,13 @@ class DocumentConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=event["text_data"])
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if getattr(self, "room", None) is not None:
+            await self.room.awareness.disconnect(self.channel_name)
+            try:
+                await self.room.buffer.flush()
+            finally:
+                # A failed flush keeps the updates buffered for the room close
+                await room_registry.leave(self.doc_uuid, self.channel_name)
         # update the last seen time for the user by self.last_seen
         if self.last_seen:
             self.last_seen.created_at = timezone.now()
@@ -127,69 +144,75 @@ class DocumentConsumer(AsyncWebsocketConsumer):
 
     async def receive(self, text_data=None, bytes_data=None):
         if text_data:
-            if eval(text_data)["type"] in ["SpellCheck", "GrammarCheck"]:
-                ydoc_text = " ".join(self.ydoc.get_array("root"))
-                logger.info(ydoc_text)
-                spell_checked_data = self.spellgrammarcheck.spell_check(ydoc_text)
-                grammar_checked_data = self.spellgrammarcheck.grammar_check(ydoc_text)
-                merged_data = (
-                    "{"
-                    + f'"Spell":{await spell_checked_data},'
-                    + f'"Grammar":{await grammar_checked_data}'
-                    + "}"
-                )
-                await self.send_message(type="spell_check", text_data=merged_data)
-            elif eval(text_data)["type"] in [
-                "comment_created",
-                "comment_updated",
-                "comment_deleted",
-                "reply_created",
-                "reply_updated",
-                "reply_deleted",
-            ]:
-                await self.send_message(
-                    type="comment_commentreply_sync", text_data=text_data
-                )
-            else:
-                await self.send_message(type="default_send", text_data=text_data)
+            await text_dispatcher.dispatch(self, text_data)
 
         if bytes_data:
-            await self.send_message(type="default_send", bytes_data=bytes_data)
-            update = await self.process_message(bytes_data, self.ydoc)
-            # Save update to Database
-            if update:
-                document_update = await DocumentUpdate.objects.acreate(
-                    document=self.document,
-                    update_data=update,
-                    author=self.user,
-                )
-                await sync_to_async(document_update.save)()
+            await self.process_message(bytes_data, self.room.ydoc)
+
+    async def handle_spell_check(self, message, text_data):
+        ydoc_text = " ".join(self.room.ydoc.get_array("root"))
+        logger.info(ydoc_text)
+        spell_checked_data = self.spellgrammarcheck.spell_check(ydoc_text)
+        grammar_checked_data = self.spellgrammarcheck.grammar_check(ydoc_text)
+        merged_data = (
+            "{"
+            + f'"Spell":{await spell_checked_data},'
+            + f'"Grammar":{await grammar_checked_data}'
+            + "}"
+        )
+        await self.send_message(type="spell_check", text_data=merged_data)
+
+    async def handle_comment_sync(self, message, text_data):
+        await self.send_message(type="comment_commentreply_sync", text_data=text_data)
+
+    async def handle_default_text(self, message, text_data):
+        await self.send_message(type="default_send", text_data=text_data)
 
     async def process_message(self, message: bytes, ydoc: YDoc):
-        if message[0] == YMessageType.SYNC:
-            message_type = message[1]
-            msg = message[2:]
-            if message_type == YSyncMessageType.SYNC_STEP1:
-                state = read_message(msg)
-                update = encode_state_as_update(ydoc, state)
-                reply = create_sync_step2_message(update)
-                await self.send_message(type="yjs_update", bytes_data=reply)
-            elif message_type in (
-                YSyncMessageType.SYNC_STEP2,
-                YSyncMessageType.SYNC_UPDATE,
-            ):
-                update = read_message(msg)
-                apply_update(ydoc, update)
-                return update
+        if message[0] == YMessageType.AWARENESS:
+            # Ephemeral, kept by the room and never persisted
+            await self.room.awareness.receive(message, self.channel_name)
+            return None
+        if message[0] != YMessageType.SYNC:
+            await self.send_message(type="default_send", bytes_data=message)
+            return None
+        message_type = message[1]
+        msg = message[2:]
+        if message_type == YSyncMessageType.SYNC_STEP1:
+            # Only the requesting client is missing this diff
+            state = read_message(msg)
+            update = encode_state_as_update(ydoc, state)
+            reply = create_sync_step2_message(update)
+            await self.send(bytes_data=reply)
+        elif message_type in (
+            YSyncMessageType.SYNC_STEP2,
+            YSyncMessageType.SYNC_UPDATE,
+        ):
+            update = read_message(msg)
+            # Ignore empty updates (see https://github.com/y-crdt/ypy/issues/98)
+            if update == b"\x00\x00":
+                return None
+            # Persisted in batches by the room's write-behind buffer
+            self.room.apply_update(update, self.user.id)
+            if message_type == YSyncMessageType.SYNC_STEP2:
+                message = create_update_message(update)
+            await self.room.coalescer.add(message, self.channel_name)
+            return update
 
     async def yjs_update(self, event):
-        # if event["sender_channel"] == self.channel_name:
-        #     return  # Ignore updates sent by the sender
+        if event.get("sender_channel") == self.channel_name:
+            return  # Ignore updates sent by the sender
+
+        await self.send(bytes_data=event["bytes"])
+
+    async def awareness_update(self, event):
+        if event.get("sender_channel") == self.channel_name:
+            return
 
         await self.send(bytes_data=event["bytes"])
 
     async def default_send(self, event):
-        if event["text_data"] is not None:
+        if event.get("text_data") is not None:
             await self.send(text_data=event["text_data"])
-        elif event["bytes"] is not None:
+        elif event.get("bytes") is not None:
             await self.send(bytes_data=event["bytes"])
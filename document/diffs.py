@@ -0,0 +1,175 @@
+import difflib
+from bisect import bisect_left
+from django.conf import settings
+from django.core.cache import cache
+from y_py import YXmlElement, YXmlText
+from .snapshots import load_version_ydoc
+
+
+def is_xml_root():
+    return settings.DOCUMENT_TEXT_ROOT_TYPE == "xml"
+
+
+def get_root(ydoc):
+    if is_xml_root():
+        return ydoc.get_xml_element(settings.DOCUMENT_TEXT_ROOT)
+    return ydoc.get_text(settings.DOCUMENT_TEXT_ROOT)
+
+
+def get_node_text(node):
+    if isinstance(node, YXmlText):
+        return str(node)
+    if isinstance(node, YXmlElement):
+        return "".join(str(n) for n in node.tree_walker() if isinstance(n, YXmlText))
+    return node if isinstance(node, str) else ""
+
+
+def get_document_text(ydoc):
+    """
+    Reads the text of a document as lines.
+
+    The root shared type is DOCUMENT_TEXT_ROOT, a Y.Text or, with
+    DOCUMENT_TEXT_ROOT_TYPE = "xml", a Y.XmlElement whose top-level children
+    are the lines.
+    """
+    root = get_root(ydoc)
+    if is_xml_root():
+        lines = []
+        child = root.first_child
+        while child is not None:
+            lines.append(get_node_text(child))
+            child = child.next_sibling
+        return lines
+    return str(root).split("\n")
+
+
+class ChangeCounter:
+    """
+    Counts the text changes applied to a YDoc while the block runs.
+
+    Inserted characters are read from the change events, deleted ones from
+    the text length before and after, and blocks are the top-level elements
+    (lines for a Y.Text) the changes landed in.
+    """
+
+    def __init__(self, ydoc):
+        self.ydoc = ydoc
+        self.root = get_root(ydoc)
+        self.inserted = 0
+        self.deleted = 0
+        self.blocks = set()
+
+    def __enter__(self):
+        self.length = self.get_length()
+        self.subscription = self.root.observe_deep(self.observe)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.root.unobserve(self.subscription)
+        self.deleted = max(self.inserted - (self.get_length() - self.length), 0)
+
+    def get_length(self):
+        if is_xml_root():
+            return sum(map(len, get_document_text(self.ydoc)))
+        return len(str(self.root))
+
+    def observe(self, events):
+        for event in events:
+            path = event.path()
+            if path:
+                self.blocks.add(path[0])
+                for change in event.delta:
+                    if "insert" in change:
+                        self.inserted += self.get_inserted_length(change["insert"])
+                continue
+            # A change of the root itself, its positions are blocks or text
+            line_of = self.get_line_index(event)
+            position = 0
+            for change in event.delta:
+                if "retain" in change:
+                    position += change["retain"]
+                elif "delete" in change:
+                    self.blocks.add(line_of(position))
+                else:
+                    length = self.get_inserted_length(change["insert"])
+                    self.inserted += length
+                    # Y.Text positions are UTF-8 bytes in y_py
+                    size = len(get_node_text(change["insert"]).encode("utf-8"))
+                    if is_xml_root():
+                        size = len(change["insert"]) if isinstance(change["insert"], list) else 1
+                    self.blocks.update(
+                        range(line_of(position), line_of(position + max(size - 1, 0)) + 1)
+                    )
+                    position += size
+
+    def get_inserted_length(self, inserted):
+        if isinstance(inserted, list):
+            return sum(len(get_node_text(node)) for node in inserted)
+        return len(get_node_text(inserted))
+
+    def get_line_index(self, event):
+        if is_xml_root():
+            return lambda position: position
+        text = str(event.target).encode("utf-8")
+        newlines = [i for i, byte in enumerate(text) if byte == ord("\n")]
+        return lambda position: bisect_left(newlines, position)
+
+    def as_dict(self):
+        return {
+            "chars_inserted": self.inserted,
+            "chars_deleted": self.deleted,
+            "blocks_touched": len(self.blocks),
+        }
+
+
+def get_version_text(update):
+    """
+    Rebuilds the text of a document right after a compacted update.
+    """
+    return get_document_text(load_version_ydoc(update))
+
+
+def diff_lines(a, b):
+    """
+    Compares two versions of a text line by line.
+
+    Returns:
+        dict: The changed hunks, each with its start line in ``a`` and ``b``
+        and the lines it removed and added, and the total of both.
+    """
+    hunks = []
+    stats = {"removed": 0, "added": 0}
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for op, a_start, a_end, b_start, b_end in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        hunks.append(
+            {
+                "a": a_start,
+                "b": b_start,
+                "removed": a[a_start:a_end],
+                "added": b[b_start:b_end],
+            }
+        )
+        stats["removed"] += a_end - a_start
+        stats["added"] += b_end - b_start
+    return {"stats": stats, "hunks": hunks}
+
+
+def get_diff_key(version_a, version_b):
+    return f"document_diff:{version_a.id}:{version_b.id}"
+
+
+def get_version_diff(version_a, version_b):
+    """
+    Diffs the text of two compacted updates, cached by their IDs.
+
+    A compacted update never changes once written, so neither does the diff.
+    """
+    key = get_diff_key(version_a, version_b)
+    diff = cache.get(key)
+    if diff is None:
+        diff = diff_lines(get_version_text(version_a), get_version_text(version_b))
+        diff = {"from": version_a.id, "to": version_b.id, **diff}
+        cache.set(key, diff, settings.DOCUMENT_DIFF_CACHE_TIMEOUT.total_seconds())
+    return diff
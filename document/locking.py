@@ -0,0 +1,47 @@
+import threading
+from contextlib import contextmanager
+from django.db import connection, transaction
+from .models import Document
+
+# First key of the PostgreSQL advisory locks taken on documents.
+ADVISORY_LOCK_NAMESPACE = 7310
+
+# Fallback for databases without row locks (SQLite), only guarding the
+# threads of this process.
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _get_local_lock(document_id):
+    with _local_locks_guard:
+        return _local_locks.setdefault(document_id, threading.Lock())
+
+
+@contextmanager
+def document_lock(document_id):
+    """
+    Runs the block in a transaction holding an exclusive lock on a document.
+
+    PostgreSQL uses a transaction-scoped advisory lock, other databases with
+    row locks lock the document row, and the rest fall back to a lock local
+    to this process.
+    """
+    if connection.vendor != "postgresql" and not connection.features.has_select_for_update:
+        # Held until after the commit, so the next holder sees its writes
+        with _get_local_lock(document_id), transaction.atomic():
+            yield
+        return
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(%s, %s)",
+                    [ADVISORY_LOCK_NAMESPACE, document_id],
+                )
+        else:
+            list(
+                Document.objects.select_for_update()
+                .filter(id=document_id)
+                .values_list("id", flat=True)
+            )
+        yield
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from document import codecs
+from document.models import DocumentUpdate
+
+
+class Command(BaseCommand):
+    help = "Compares the bytes saved and the CPU time of each codec on stored updates."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sample", type=int, default=1000, help="Most recent updates to measure."
+        )
+
+    def handle(self, *args, **options):
+        updates = DocumentUpdate.objects.order_by("-id").only("update_data", "codec")
+        payloads = [update.payload for update in updates[: options["sample"]]]
+        total = sum(map(len, payloads))
+        if not total:
+            self.stdout.write("No updates to measure.")
+            return
+        self.stdout.write(f"{len(payloads)} updates, {total} bytes")
+        self.stdout.write(
+            f"{'codec':<16}{'bytes':>12}{'saved':>9}{'compress ms':>14}{'decompress ms':>16}"
+        )
+        for name, (compress, decompress) in codecs.CODECS.items():
+            start = time.process_time()
+            encoded = [compress(payload) for payload in payloads]
+            compress_time = time.process_time() - start
+            start = time.process_time()
+            for data in encoded:
+                decompress(data)
+            decompress_time = time.process_time() - start
+            size = sum(map(len, encoded))
+            self.stdout.write(
+                f"{name:<16}{size:>12}{1 - size / total:>9.1%}"
+                f"{compress_time * 1000:>14.1f}{decompress_time * 1000:>16.1f}"
+            )
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from y_py import YDoc
+from document.models import DocumentCheckpoint, DocumentUpdate
+from document.snapshots import apply_updates, create_checkpoint, iter_payloads
+
+
+class Command(BaseCommand):
+    help = "Builds the version history checkpoints of documents compacted before they existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "document_ids", nargs="*", type=int, help="Documents to build, all by default."
+        )
+        parser.add_argument("--interval", type=int, default=None)
+
+    def handle(self, *args, **options):
+        interval = options["interval"] or settings.DOCUMENT_CHECKPOINT_INTERVAL
+        document_ids = options["document_ids"] or (
+            DocumentUpdate.objects.filter(is_compacted=True)
+            .exclude(document__checkpoints__isnull=False)
+            .order_by("document_id")
+            .values_list("document_id", flat=True)
+            .distinct()
+        )
+        for document_id in document_ids:
+            updates = list(
+                DocumentUpdate.objects.filter(document_id=document_id, is_compacted=True)
+                .order_by("created_at", "id")
+                .only("id", "created_at")
+            )
+            DocumentCheckpoint.objects.filter(document_id=document_id).delete()
+            ydoc = YDoc()
+            checkpoints = 0
+            for start in range(0, len(updates) - interval + 1, interval):
+                chunk = updates[start : start + interval]
+                apply_updates(ydoc, (p for p in iter_payloads(chunk) if p is not None))
+                create_checkpoint(document_id, ydoc, chunk[-1])
+                checkpoints += 1
+            self.stdout.write(
+                f"Built {checkpoints} checkpoints over {len(updates)} updates of document ID: {document_id}"
+            )
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from document import codecs
+from document.blobs import get_blob_store
+from document.models import DocumentCheckpoint, DocumentSnapshot, DocumentUpdate
+
+
+class Command(BaseCommand):
+    help = "Deletes blob store files no update, snapshot or checkpoint refers to anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=3600,
+            help="Seconds a file must be old to be deleted, so payloads whose "
+            "rows are not committed yet are kept.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        store = get_blob_store()
+        if store is None:
+            raise CommandError("DOCUMENT_BLOB_STORE_DIR is not set")
+        cutoff = time.time() - options["min_age"]
+        referenced = set()
+        for model, field in [
+            (DocumentUpdate, "update_data"),
+            (DocumentSnapshot, "state"),
+            (DocumentCheckpoint, "state"),
+        ]:
+            references = (
+                model.objects.filter(codec=codecs.BLOB)
+                .values_list(field, flat=True)
+                .iterator()
+            )
+            referenced.update(codecs.get_blob_key(codecs.BLOB, r) for r in references)
+        deleted = 0
+        for key, mtime in list(store.keys()):
+            if key in referenced or mtime > cutoff:
+                continue
+            if not options["dry_run"]:
+                store.delete(key)
+            deleted += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would delete' if options['dry_run'] else 'Deleted'} {deleted} "
+                f"unreferenced blobs, {len(referenced)} in use"
+            )
+        )
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from document import codecs
+from document.blobs import get_blob_store
+from document.models import DocumentUpdate
+
+
+class Command(BaseCommand):
+    help = "Re-encodes stored DocumentUpdate payloads with a codec, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--codec",
+            default=None,
+            choices=[*codecs.CODECS, codecs.BLOB],
+            help="Codec to store payloads with, DOCUMENT_UPDATE_CODEC by default. "
+            "blob moves every payload to the blob store.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        codec = options["codec"] or settings.DOCUMENT_UPDATE_CODEC
+        store = get_blob_store()
+        if codec == codecs.BLOB:
+            if store is None:
+                raise CommandError("DOCUMENT_BLOB_STORE_DIR is not set")
+        else:
+            codecs.get_codec(codec)
+        # Rows already in the target codec may still belong in the blob store
+        stale = {"codec": codecs.BLOB if store is not None else codec}
+        batch_size = options["batch_size"]
+        rows = bytes_before = bytes_after = 0
+        last_id = 0
+        while True:
+            batch = list(
+                DocumentUpdate.objects.filter(id__gt=last_id)
+                .exclude(**stale)
+                .order_by("id")
+                .only("id", "update_data", "codec")[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            changed = []
+            for update in batch:
+                size = len(update.update_data)
+                stored_codec, stored = codecs.encode(update.payload, codec)
+                if stored_codec == update.codec:
+                    continue  # Kept raw, too small or incompressible
+                update.codec, update.update_data = stored_codec, stored
+                changed.append(update)
+                bytes_before += size
+                bytes_after += len(stored)
+            DocumentUpdate.objects.bulk_update(changed, ["update_data", "codec"])
+            rows += len(changed)
+            self.stdout.write(f"Re-encoded {rows} updates up to ID {last_id}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Re-encoded {rows} updates with {codec}: "
+                f"{bytes_before} bytes -> {bytes_after} bytes"
+            )
+        )
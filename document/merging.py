@@ -0,0 +1,149 @@
+import logging
+from datetime import timedelta
+from itertools import groupby
+from django.utils import timezone
+from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
+from .diffs import ChangeCounter
+from .locking import document_lock
+from .models import DocumentCheckpoint, DocumentSnapshot, DocumentUpdate
+from .snapshots import iter_payloads
+
+logger = logging.getLogger(__name__)
+
+# (tier, minimum age) from the coarsest down. Compacted updates older than the
+# age are merged per period of the tier: calendar day, ISO week or month.
+TIER_AGES = [
+    (DocumentUpdate.MONTHLY, timedelta(days=30)),
+    (DocumentUpdate.WEEKLY, timedelta(weeks=1)),
+    (DocumentUpdate.DAILY, timedelta(days=1)),
+]
+
+
+def get_period(tier, created_at):
+    created_at = timezone.localtime(created_at)
+    if tier == DocumentUpdate.DAILY:
+        return created_at.date()
+    if tier == DocumentUpdate.WEEKLY:
+        return created_at.isocalendar()[:2]
+    return (created_at.year, created_at.month)
+
+
+def get_bucket(update, now):
+    """
+    Returns the (tier, period) an update merges into, None to keep it as is.
+    """
+    if update.is_named:
+        return None  # Named versions stay in the history
+    for tier, age in TIER_AGES:
+        if update.created_at < now - age:
+            if tier < update.tier:
+                return None
+            return (tier, get_period(tier, update.created_at))
+    return None
+
+
+def merge_document_updates(document_id, now=None):
+    """
+    Merges the compacted updates of a document into tiers, LSM style.
+
+    Sessions older than a day fold into daily updates, those into weekly and
+    then monthly ones, so the rows a full replay reads stay bounded while
+    recent history keeps its granularity. The history is replayed once: a
+    bucket of consecutive updates becomes the delta between the state before
+    its first update and after its last one.
+
+    Returns:
+        dict: Rows and bytes of the merged updates before and after.
+    """
+    now = now or timezone.now()
+    updates = list(
+        DocumentUpdate.objects.filter(document_id=document_id, is_compacted=True)
+        .order_by("created_at", "id")
+        .only("id", "document_id", "is_named", "tier", "created_at")
+    )
+    stats = {
+        "document_id": document_id,
+        "rows_before": 0,
+        "rows_after": 0,
+        "bytes_before": 0,
+        "bytes_after": 0,
+    }
+    ydoc = YDoc()
+    for bucket, group in groupby(updates, key=lambda u: get_bucket(u, now)):
+        group = list(group)
+        mergeable = bucket is not None and (
+            len(group) > 1 or group[0].tier != bucket[0]
+        )
+        base_sv = encode_state_vector(ydoc)
+        size = 0
+        with ChangeCounter(ydoc) as changes:
+            for update_data in iter_payloads(group):
+                if update_data is None:
+                    continue
+                size += len(update_data)
+                try:
+                    apply_update(ydoc, update_data)
+                except Exception as e:
+                    logger.error(f"Error applying update: {e}")
+        if not mergeable:
+            continue
+        if len(group) == 1:
+            # Nothing to merge with, it only moves up a tier
+            DocumentUpdate.objects.filter(id=group[0].id).update(tier=bucket[0])
+            continue
+        merged = encode_state_as_update(ydoc, base_sv)
+        if replace_updates(group, merged, bucket[0], changes.as_dict()) is None:
+            continue
+        stats["rows_before"] += len(group)
+        stats["rows_after"] += 1
+        stats["bytes_before"] += size
+        stats["bytes_after"] += len(merged)
+    if stats["rows_before"]:
+        logger.info(
+            f"Merged {stats['rows_before']} updates ({stats['bytes_before']} bytes) into "
+            f"{stats['rows_after']} ({stats['bytes_after']} bytes) for document ID: {document_id}"
+        )
+    return stats
+
+
+def replace_updates(group, update_data, tier, stats=None):
+    ids = [u.id for u in group]
+    authors = (
+        DocumentUpdate.authors.through.objects.filter(documentupdate_id__in=ids)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+    with document_lock(group[0].document_id):
+        if DocumentUpdate.objects.filter(id__in=ids).count() != len(ids):
+            return None  # Changed by someone else since it was read
+        merged = DocumentUpdate.objects.create(
+            document_id=group[0].document_id,
+            title=DocumentUpdate.get_default_title(group[-1].created_at),
+            payload=update_data,
+            is_compacted=True,
+            processed=True,
+            tier=tier,
+            payload_size=len(update_data),
+            **(stats or {}),
+        )
+        # Takes the place of the last update, so history reads "before" it
+        # still see the state before the whole bucket.
+        DocumentUpdate.objects.filter(id=merged.id).update(
+            created_at=group[-1].created_at
+        )
+        merged.authors.set(list(authors))
+        DocumentSnapshot.objects.filter(last_update_id__in=ids).update(
+            last_update_id=merged.id
+        )
+        # A checkpoint inside the bucket holds part of it, which no read
+        # before the merged update may see anymore.
+        DocumentCheckpoint.objects.filter(
+            document_id=group[0].document_id,
+            last_update_at__gte=group[0].created_at,
+            last_update_at__lt=group[-1].created_at,
+        ).delete()
+        DocumentCheckpoint.objects.filter(last_update_id=group[-1].id).update(
+            last_update_id=merged.id
+        )
+        DocumentUpdate.objects.filter(id__in=ids).only("id").delete()
+    return merged
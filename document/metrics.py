@@ -0,0 +1,67 @@
+import resource
+import sys
+from collections import Counter, defaultdict
+
+# Process-wide counters of the realtime document stack.
+counters = Counter()
+
+
+class Observation:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.last = value
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "last": self.last,
+            "avg": self.total / self.count if self.count else 0.0,
+        }
+
+
+observations = defaultdict(Observation)
+
+
+def incr(name, value=1):
+    counters[name] += value
+
+
+def observe(name, value):
+    observations[name].add(value)
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in KiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def get_metrics():
+    """
+    Returns a plain dict copy of every counter and observation.
+    """
+    return {
+        "counters": dict(counters),
+        "observations": {
+            name: observation.as_dict()
+            for name, observation in observations.items()
+        },
+    }
+
+
+def reset():
+    counters.clear()
+    observations.clear()
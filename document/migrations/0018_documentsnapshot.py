@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0017_remove_documentupdate_page'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.BinaryField()),
+                ('state_vector', models.BinaryField()),
+                ('last_update_id', models.BigIntegerField()),
+                ('last_update_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='document.document')),
+            ],
+        ),
+    ]
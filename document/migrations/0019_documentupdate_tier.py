@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0018_documentsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentupdate',
+            name='tier',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Session'), (1, 'Daily'), (2, 'Weekly'), (3, 'Monthly')], default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0019_documentupdate_tier'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentupdate',
+            name='source_first_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentupdate',
+            name='source_last_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='documentupdate',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_first_id__isnull', False)), fields=('document', 'source_first_id', 'source_last_id'), name='unique_compacted_source_range'),
+        ),
+    ]
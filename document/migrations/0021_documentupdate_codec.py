@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0020_documentupdate_source_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentupdate',
+            name='codec',
+            field=models.CharField(default='raw', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0021_documentupdate_codec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentsnapshot',
+            name='codec',
+            field=models.CharField(default='raw', max_length=16),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0022_documentsnapshot_codec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.BinaryField()),
+                ('codec', models.CharField(default='raw', max_length=16)),
+                ('last_update_id', models.BigIntegerField()),
+                ('last_update_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='document.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['document', 'last_update_at'], name='document_do_documen_59ae24_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0023_documentcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentupdate',
+            index=models.Index(fields=['document', 'is_compacted', 'created_at', 'id'], name='document_do_documen_e61307_idx'),
+        ),
+    ]
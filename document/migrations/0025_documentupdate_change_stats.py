@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0024_documentupdate_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentupdate',
+            name='blocks_touched',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentupdate',
+            name='chars_deleted',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentupdate',
+            name='chars_inserted',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentupdate',
+            name='payload_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:50
+
+from datetime import datetime
+from django.db import migrations, models
+
+
+def mark_named_versions(apps, schema_editor):
+    # Titles not in the automatic "%d %B %Y, %H:%M" format were set by users
+    DocumentUpdate = apps.get_model("document", "DocumentUpdate")
+    named = []
+    titled = (
+        DocumentUpdate.objects.filter(is_compacted=True, title__isnull=False)
+        .exclude(title="")
+        .values_list("id", "title")
+        .iterator()
+    )
+    for id, title in titled:
+        try:
+            datetime.strptime(title, "%d %B %Y, %H:%M")
+        except ValueError:
+            named.append(id)
+    DocumentUpdate.objects.filter(id__in=named).update(is_named=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0025_documentupdate_change_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentupdate',
+            name='is_named',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_named_versions, migrations.RunPython.noop),
+    ]
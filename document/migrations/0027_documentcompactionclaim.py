@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0026_documentupdate_is_named'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentCompactionClaim',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='document.document')),
+                ('claimed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
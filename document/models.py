@@ -1,5 +1,6 @@
 from django.db import models
 import uuid
+from . import codecs
 from .utility import link_generator
 from django.utils import timezone
 
@@ -47,7 +48,20 @@ class DocumentView(models.Model):
 
 
 class DocumentUpdate(models.Model):
+    # Granularity of a compacted update; older history is merged into coarser tiers.
+    SESSION = 0
+    DAILY = 1
+    WEEKLY = 2
+    MONTHLY = 3
+    TIERS = {
+        SESSION: "Session",
+        DAILY: "Daily",
+        WEEKLY: "Weekly",
+        MONTHLY: "Monthly",
+    }
     title = models.CharField(max_length=255, null=True, blank=True)
+    # Titled by a user, kept out of tier merging
+    is_named = models.BooleanField(default=False)
     document = models.ForeignKey(
         Document, on_delete=models.CASCADE, related_name="updates"
     )
@@ -67,23 +81,128 @@ class DocumentUpdate(models.Model):
     )
     processed = models.BooleanField(default=False)
     is_compacted = models.BooleanField(default=False)
+    tier = models.PositiveSmallIntegerField(choices=TIERS, default=SESSION)
+    # ids of the first and last raw update a compacted session was built from
+    source_first_id = models.BigIntegerField(null=True, blank=True)
+    source_last_id = models.BigIntegerField(null=True, blank=True)
+    # Change stats of a compacted update, null for those compacted before
+    chars_inserted = models.PositiveIntegerField(null=True, blank=True)
+    chars_deleted = models.PositiveIntegerField(null=True, blank=True)
+    blocks_touched = models.PositiveIntegerField(null=True, blank=True)
+    payload_size = models.PositiveIntegerField(null=True, blank=True)
     
     
     update_data = models.BinaryField()  # Stores the Yjs update as binary data
+    # Compression of update_data, read and written through ``payload``
+    codec = models.CharField(max_length=16, default=codecs.RAW)
     created_at = models.DateTimeField(
         auto_now_add=True
     )  # Timestamp for when the update was created
 
+    class Meta:
+        constraints = [
+            # A session is compacted at most once, whoever commits first wins
+            models.UniqueConstraint(
+                fields=["document", "source_first_id", "source_last_id"],
+                condition=models.Q(source_first_id__isnull=False),
+                name="unique_compacted_source_range",
+            ),
+        ]
+        indexes = [
+            # Keyset pagination of the version history
+            models.Index(fields=["document", "is_compacted", "created_at", "id"]),
+        ]
+
     def __str__(self):
         if self.title:
             return self.title
         else:
             return f"Unknown - {self.created_at}"
 
+    @property
+    def payload(self):
+        """
+        The Yjs update bytes, decompressed.
+        """
+        return codecs.decode(self.codec, self.update_data)
+
+    @payload.setter
+    def payload(self, data):
+        self.codec, self.update_data = codecs.encode(data)
+
+    @staticmethod
+    def get_default_title(created_at):
+        return created_at.strftime("%d %B %Y, %H:%M")
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
         if self.is_compacted and not self.title:
-            self.title = f"{self.created_at.strftime('%d %B %Y, %H:%M')}"
+            # Set before the insert, created_at is only filled by it
+            self.title = self.get_default_title(self.created_at or timezone.now())
+        super().save(*args, **kwargs)
+
+
+class DocumentSnapshot(models.Model):
+    """
+    Materialized state of every compacted update of a document.
+
+    Cold loads read this row and only the updates after ``last_update_at``
+    instead of replaying the whole update log.
+    """
+
+    document = models.OneToOneField(
+        Document, on_delete=models.CASCADE, related_name="snapshot"
+    )
+    state = models.BinaryField()  # encode_state_as_update of the covered updates
+    codec = models.CharField(max_length=16, default=codecs.RAW)  # Of state
+    state_vector = models.BinaryField()
+    last_update_id = models.BigIntegerField()
+    last_update_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot of {self.document} at {self.last_update_at}"
+
+
+class DocumentCheckpoint(models.Model):
+    """
+    State of a document's compacted history at some point in the past.
+
+    Saved every DOCUMENT_CHECKPOINT_INTERVAL compacted updates, so the state
+    before a version is rebuilt from the nearest earlier checkpoint instead of
+    the start of the history.
+    """
+
+    document = models.ForeignKey(
+        Document, on_delete=models.CASCADE, related_name="checkpoints"
+    )
+    state = models.BinaryField()  # encode_state_as_update of the covered updates
+    codec = models.CharField(max_length=16, default=codecs.RAW)  # Of state
+    last_update_id = models.BigIntegerField()
+    last_update_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["document", "last_update_at"])]
+
+    def __str__(self):
+        return f"Checkpoint of {self.document} at {self.last_update_at}"
+
+
+class DocumentCompactionClaim(models.Model):
+    """
+    Marks a document as being compacted or merged by a task.
+
+    A row rather than a cache key, so every worker process sees it whatever
+    the cache backend.
+    """
+
+    document = models.OneToOneField(
+        Document, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    claimed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Compaction of {self.document_id} since {self.claimed_at}"
 
 
 class AccessLevel(models.Model):
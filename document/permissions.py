@@ -1,5 +1,6 @@
 from rest_framework.permissions import BasePermission
-from .models import Document, AccessLevel
+from .access import has_access
+from .models import AccessLevel
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -19,27 +20,7 @@ class HasAccessPermission(BasePermission):
         self.required_level = required_level
 
     def _check_access(self, user, document_id):
-        try:
-            document_instance = Document.objects.get(pk=document_id)
-        except Document.DoesNotExist:
-            return False
-        user_instance = user
-
-        if user_instance == document_instance.owner:
-            AccessLevel.objects.update_or_create(
-                user=user_instance,
-                document=document_instance,
-                defaults={"access_level": self.PERMISSION_MAP["Owner"]},
-            )
-            return True
-
-        try:
-            access_level = AccessLevel.objects.get(
-                user=user_instance, document=document_instance
-            )
-            return access_level.access_level >= self.required_level
-        except AccessLevel.DoesNotExist:
-            return document_instance.default_access_level >= self.required_level
+        return has_access(user, document_id, self.required_level)
 
     def has_permission(self, request, view):
         document = view.kwargs.get("document") or request.data.get("document")
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from y_py import encode_state_as_update, encode_state_vector
+from . import metrics
+from .models import DocumentUpdate
+from .tasks import schedule_compaction
+
+logger = logging.getLogger(__name__)
+
+# Seconds added to compaction countdowns against clock and commit skew.
+COMPACTION_SLACK = 1.0
+
+
+class UpdateBuffer:
+    """
+    Write-behind buffer for the incoming Yjs updates of one room.
+
+    Updates are applied to the room's YDoc right away but only written to the
+    database when the buffer is full or the durability window elapses, in a
+    single ``bulk_create``. When every pending update comes from the same
+    author and nothing else reached the room doc meanwhile, the batch is
+    stored as one merged update encoded from the room state, so a burst of
+    keystrokes becomes a single row.
+    """
+
+    def __init__(self, room, max_updates=None, max_bytes=None, window=None):
+        self.room = room
+        self.max_updates = max_updates or settings.DOCUMENT_UPDATE_BUFFER_SIZE
+        self.max_bytes = max_bytes or settings.DOCUMENT_UPDATE_BUFFER_BYTES
+        window = settings.DOCUMENT_UPDATE_DURABILITY_WINDOW if window is None else window
+        self.window = window.total_seconds()
+        self.pending = []
+        self.pending_bytes = 0
+        # State vector of the room doc when the last batch was taken, i.e.
+        # everything after it is in the buffer, None when it is not.
+        self.base_sv = None
+        self._timer = None
+        self._tasks = set()
+        # Batches taken but not written yet, which a failed write puts back
+        self._writing = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def mark_persisted(self):
+        self.base_sv = encode_state_vector(self.room.ydoc)
+
+    def mark_remote(self):
+        """
+        Records an update applied to the room doc but persisted elsewhere.
+
+        The room state then holds more than the buffered updates, so the
+        pending batch is stored update by update instead of merged.
+        """
+        if self.pending or self._writing:
+            self.base_sv = None
+        else:
+            self.mark_persisted()
+
+    def add(self, update, author_id):
+        """
+        Queues an update that has already been applied to the room doc.
+        """
+        self.pending.append((update, author_id))
+        self.pending_bytes += len(update)
+        if (
+            self.window <= 0
+            or len(self.pending) >= self.max_updates
+            or self.pending_bytes >= self.max_bytes
+        ):
+            self._spawn_flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.window, self._spawn_flush)
+
+    def _spawn_flush(self):
+        # The batch is taken right away so the buffer never grows past its limits
+        if not self.pending:
+            return
+        task = asyncio.ensure_future(self._write(*self._take_batch()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _take_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, base_sv = self.pending, self.base_sv
+        self.pending, self.pending_bytes = [], 0
+        self.mark_persisted()
+        self._writing += 1
+
+        authors = {author_id for _, author_id in pending}
+        if len(pending) > 1 and len(authors) == 1 and base_sv is not None:
+            rows = [(encode_state_as_update(self.room.ydoc, base_sv), authors.pop())]
+        else:
+            rows = pending
+        return pending, base_sv, rows
+
+    def _create_rows(self, rows):
+        # Off the event loop: encoding compresses or writes to the blob store
+        DocumentUpdate.objects.bulk_create(
+            [
+                DocumentUpdate(
+                    document_id=self.room.document_id, payload=update, author_id=author_id
+                )
+                for update, author_id in rows
+            ]
+        )
+
+    async def flush(self):
+        """
+        Writes every pending update to the database.
+
+        Returns:
+            int: The number of buffered updates written.
+        """
+        if not self.pending:
+            return 0
+        return await self._write(*self._take_batch())
+
+    async def _write(self, pending, base_sv, rows):
+        started = time.monotonic()
+        try:
+            await sync_to_async(self._create_rows)(rows)
+        except Exception as e:
+            self._writing -= 1
+            logger.error(
+                f"Error flushing {len(pending)} updates for document {self.room.doc_uuid}: {e}"
+            )
+            # Put the batch back in front of anything buffered meanwhile.
+            self.pending = pending + self.pending
+            self.pending_bytes += sum(len(update) for update, _ in pending)
+            if self.base_sv is not None:
+                # Unless a remote update came in meanwhile
+                self.base_sv = base_sv
+            if self._timer is None and self.window > 0:
+                loop = asyncio.get_running_loop()
+                self._timer = loop.call_later(self.window, self._spawn_flush)
+            metrics.incr("update_buffer.flush_errors")
+            raise
+        self._writing -= 1
+        latency = time.monotonic() - started
+        metrics.incr("update_buffer.flushes")
+        metrics.incr("update_buffer.updates", len(pending))
+        metrics.incr("update_buffer.rows", len(rows))
+        metrics.observe("update_buffer.flush_size", len(pending))
+        metrics.observe("update_buffer.flush_latency", latency)
+        logger.debug(
+            f"Flushed {len(pending)} updates as {len(rows)} rows for document {self.room.doc_uuid} in {latency:.4f}s"
+        )
+        return len(pending)
+
+    async def close(self):
+        """
+        Flushes whatever is left and waits for in-flight flushes.
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+
+class CompactionTrigger:
+    """
+    Schedules the compaction of a room's document once editing stops.
+
+    Compaction is queued when no update arrived for the compacting threshold,
+    or when the room closes with edits that were not compacted yet, so new
+    history shows up promptly without scanning every document periodically.
+    The countdown makes sure the last session is old enough to be compacted.
+    """
+
+    def __init__(self, room, idle_timeout=None):
+        self.room = room
+        idle_timeout = settings.UPDATE_COMPACTING_THRESHOLD if idle_timeout is None else idle_timeout
+        self.idle_timeout = idle_timeout.total_seconds()
+        self.enabled = settings.DOCUMENT_COMPACT_ON_IDLE
+        self.last_update_at = None
+        self.dirty = False
+        self._timer = None
+        self._tasks = set()
+
+    def touch(self):
+        """
+        Records an update that will need compaction.
+        """
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        self.last_update_at = loop.time()
+        self.dirty = True
+        if self._timer is None:
+            self._timer = loop.call_later(self.idle_timeout, self._check_idle)
+
+    def _check_idle(self):
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        remaining = self.last_update_at + self.idle_timeout - loop.time()
+        if remaining > 0:
+            self._timer = loop.call_later(remaining, self._check_idle)
+            return
+        task = asyncio.ensure_future(self.schedule())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def countdown(self):
+        elapsed = asyncio.get_running_loop().time() - self.last_update_at
+        # Rows are stamped when the buffer flushes, up to a window later
+        return (
+            max(0.0, self.idle_timeout - elapsed)
+            + self.room.buffer.window
+            + COMPACTION_SLACK
+        )
+
+    async def schedule(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        countdown = self.countdown()
+        try:
+            await self.room.buffer.flush()
+            await sync_to_async(schedule_compaction)(self.room.document_id, countdown)
+            metrics.incr("compaction.scheduled")
+        except Exception as e:
+            logger.error(
+                f"Error scheduling compaction of document {self.room.doc_uuid}: {e}"
+            )
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.schedule()
@@ -0,0 +1,71 @@
+import json
+import logging
+from django.conf import settings
+from . import metrics
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _DECODE_ERRORS = (orjson.JSONDecodeError,)
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    _loads = json.loads
+    _DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidMessage(ValueError):
+    pass
+
+
+class TextMessageDispatcher:
+    """
+    Routes JSON text frames of the document WebSocket to consumer handlers.
+
+    Each frame is parsed exactly once and dispatched on its ``type`` through
+    ``handlers``, a mapping of message type to consumer method name. Types
+    without a handler go to ``default``. Handlers are called with the parsed
+    message and the raw frame, so forwarding does not re-serialize it.
+    """
+
+    def __init__(self, handlers, default=None, max_size=None):
+        self.handlers = dict(handlers)
+        self.default = default
+        self.max_size = max_size or settings.DOCUMENT_MAX_TEXT_FRAME_SIZE
+
+    def parse(self, text_data):
+        """
+        Parses a text frame.
+
+        Raises:
+            InvalidMessage: If the frame is too large, is not JSON or has no string ``type``.
+        """
+        if len(text_data) > self.max_size:
+            raise InvalidMessage(f"frame of {len(text_data)} characters is too large")
+        try:
+            message = _loads(text_data)
+        except _DECODE_ERRORS as e:
+            raise InvalidMessage(f"malformed JSON: {e}")
+        if not isinstance(message, dict) or not isinstance(message.get("type"), str):
+            raise InvalidMessage("message has no type")
+        return message
+
+    async def dispatch(self, consumer, text_data):
+        try:
+            message = self.parse(text_data)
+        except InvalidMessage as e:
+            metrics.incr("text_frames.rejected")
+            logger.warning(f"Rejected text frame from {consumer.channel_name}: {e}")
+            return None
+
+        message_type = message["type"]
+        handler_name = self.handlers.get(message_type)
+        if handler_name is None:
+            handler_name = self.default
+            metrics.incr("text_frames.default")
+        else:
+            metrics.incr(f"text_frames.{message_type}")
+        if handler_name is None:
+            return None
+        return await getattr(consumer, handler_name)(message, text_data)
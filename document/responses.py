@@ -0,0 +1,33 @@
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+# Bytes per chunk of a streamed payload.
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """
+    Slices a payload without copying it, a memory-mapped blob included.
+    """
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start : start + chunk_size]
+
+
+def immutable_payload_response(request, etag, get_payload):
+    """
+    Streams a payload that never changes for its ETag as octet-stream.
+
+    ``get_payload`` is only called when the client does not hold the payload
+    already, so a matching If-None-Match costs no payload read.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        payload = get_payload()
+        response = StreamingHttpResponse(
+            iter_chunks(payload), content_type="application/octet-stream"
+        )
+        response["Content-Length"] = len(payload)
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, max_age=365 * 24 * 3600, immutable=True)
+    return response
@@ -0,0 +1,122 @@
+import difflib
+from y_py import YXmlText, encode_state_as_update, encode_state_vector
+from .diffs import get_root, is_xml_root
+from .snapshots import load_version_ydoc, load_ydoc
+
+# What encode_state_as_update returns when nothing changed.
+EMPTY_UPDATE = b"\x00\x00"
+
+
+def utf8_length(text):
+    return len(text.encode("utf-8"))
+
+
+def get_text_edits(current, target):
+    """
+    Lists the edits turning one string into another.
+
+    Lines are matched first and only the changed runs are compared character
+    by character, which keeps large documents cheap.
+
+    Returns:
+        List[Tuple[int, int, str]]: ``(start, end, replacement)`` ranges of
+        ``current`` in characters, in order.
+    """
+    current_lines = current.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    current_offsets = [0]
+    for line in current_lines:
+        current_offsets.append(current_offsets[-1] + len(line))
+    target_offsets = [0]
+    for line in target_lines:
+        target_offsets.append(target_offsets[-1] + len(line))
+
+    edits = []
+    matcher = difflib.SequenceMatcher(None, current_lines, target_lines, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        start, end = current_offsets[i1], current_offsets[i2]
+        old, new = current[start:end], target[target_offsets[j1] : target_offsets[j2]]
+        chars = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        for char_op, a1, a2, b1, b2 in chars.get_opcodes():
+            if char_op != "equal":
+                edits.append((start + a1, start + a2, new[b1:b2]))
+    return edits
+
+
+def copy_xml_node(txn, parent, index, node):
+    if isinstance(node, YXmlText):
+        copy = parent.insert_xml_text(txn, index)
+        copy.push(txn, str(node))
+    else:
+        copy = parent.insert_xml_element(txn, index, node.name)
+        child = node.first_child
+        position = 0
+        while child is not None:
+            copy_xml_node(txn, copy, position, child)
+            position += 1
+            child = child.next_sibling
+    for name, value in node.attributes():
+        copy.set_attribute(txn, name, value)
+
+
+def get_children(element):
+    children = []
+    child = element.first_child
+    while child is not None:
+        children.append(child)
+        child = child.next_sibling
+    return children
+
+
+def restore_content(ydoc, target):
+    """
+    Edits ``ydoc`` in place so its content matches ``target``.
+
+    Unchanged text and blocks are kept, so the edit only carries what differs.
+    Replaced text is inserted without formatting.
+    """
+    root = get_root(ydoc)
+    with ydoc.begin_transaction() as txn:
+        if is_xml_root():
+            current = get_children(root)
+            wanted = get_children(get_root(target))
+            matcher = difflib.SequenceMatcher(
+                None, [str(n) for n in current], [str(n) for n in wanted], autojunk=False
+            )
+            # From the end, so the earlier indexes stay valid
+            for op, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+                if op == "equal":
+                    continue
+                if i2 > i1:
+                    root.delete(txn, i1, i2 - i1)
+                for offset, node in enumerate(wanted[j1:j2]):
+                    copy_xml_node(txn, root, i1 + offset, node)
+        else:
+            current = str(root)
+            for start, end, replacement in reversed(
+                get_text_edits(current, str(get_root(target)))
+            ):
+                # y_py counts text positions in UTF-8 bytes
+                offset = utf8_length(current[:start])
+                if end > start:
+                    root.delete_range(txn, offset, utf8_length(current[start:end]))
+                if replacement:
+                    root.insert(txn, offset, replacement)
+
+
+def build_restore_update(version):
+    """
+    Computes the forward update bringing a document back to a version.
+
+    The version state is rebuilt from the nearest checkpoint and the current
+    state from the snapshot, pending updates included.
+
+    Returns:
+        bytes: The Yjs update to apply on top of the current state.
+    """
+    ydoc = load_ydoc(version.document_id)
+    state_vector = encode_state_vector(ydoc)
+    restore_content(ydoc, load_version_ydoc(version))
+    return encode_state_as_update(ydoc, state_vector)
@@ -0,0 +1,566 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import deque
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
+from ypy_websocket.yutils import (
+    Decoder,
+    YMessageType,
+    YSyncMessageType,
+    create_update_message,
+    read_message,
+    write_var_uint,
+)
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from . import metrics
+from .awareness import RoomAwareness, decode_awareness_update
+from .persistence import CompactionTrigger, UpdateBuffer
+
+logger = logging.getLogger(__name__)
+
+_process_id = (None, None)
+
+
+def get_process_id():
+    """
+    Tags channel layer events published by this process, so the relay can tell
+    them apart from events of peers in other processes. Regenerated after a
+    fork, since pre-forking servers import this module before forking.
+    """
+    global _process_id
+    pid = os.getpid()
+    if _process_id[0] != pid:
+        _process_id = (pid, uuid.uuid4().hex)
+    return _process_id[1]
+
+
+def get_group_name(doc_uuid):
+    return f"document_{doc_uuid}"
+
+
+async def publish_update(doc_uuid, update, channel_layer=None):
+    """
+    Sends an update made outside of a room, by a view or a task, to the live
+    rooms of the document. They apply and forward it without persisting it.
+    """
+    channel_layer = channel_layer or get_channel_layer()
+    if channel_layer is None:
+        return
+    await channel_layer.group_send(
+        get_group_name(doc_uuid),
+        {
+            "type": "yjs_update",
+            "bytes": create_update_message(update),
+            "sender_channel": None,
+        },
+    )
+
+
+# Close code telling a client to reconnect and sync from scratch.
+RESYNC_CLOSE_CODE = 4008
+
+OUTBOX_POLICIES = ("coalesce", "disconnect")
+
+
+def merge_state_vectors(state_vectors):
+    """
+    Element-wise minimum of encoded state vectors, i.e. the state every one
+    of them includes.
+    """
+    merged = None
+    for state_vector in state_vectors:
+        decoder = Decoder(state_vector)
+        clocks = {}
+        for _ in range(decoder.read_var_uint()):
+            client_id = decoder.read_var_uint()
+            clocks[client_id] = decoder.read_var_uint()
+        if merged is None:
+            merged = clocks
+        else:
+            merged = {
+                client_id: min(clock, clocks[client_id])
+                for client_id, clock in merged.items()
+                if client_id in clocks
+            }
+    body = [write_var_uint(len(merged))]
+    for client_id, clock in merged.items():
+        body += [write_var_uint(client_id), write_var_uint(clock)]
+    return b"".join(body)
+
+
+class Outbox:
+    """
+    Outgoing events of one connection, delivered in order by a writer task.
+
+    Broadcasting only enqueues, so a slow socket never holds up the sender or
+    the other peers of the room. The queue is bounded: when it is full, the
+    "coalesce" policy replaces the pending Yjs updates with one update encoded
+    from the room doc and the pending awareness frames with a snapshot, and
+    the "disconnect" policy, or a queue still full after coalescing, closes
+    the connection with RESYNC_CLOSE_CODE so the client reconnects and syncs.
+    """
+
+    def __init__(self, consumer, room=None, max_size=None, policy=None):
+        self.consumer = consumer
+        self.room = room
+        self.max_size = max_size or settings.DOCUMENT_OUTBOX_SIZE
+        self.policy = policy or settings.DOCUMENT_OUTBOX_POLICY
+        if self.policy not in OUTBOX_POLICIES:
+            raise ImproperlyConfigured(f"Unknown outbox policy {self.policy!r}")
+        self.events = deque()
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def put(self, event):
+        if self.closed:
+            return
+        if len(self.events) >= self.max_size:
+            metrics.incr("outbox.overflows")
+            if self.policy == "coalesce" and self.room is not None:
+                self._coalesce()
+            if len(self.events) >= self.max_size:
+                self._disconnect()
+                return
+        self.events.append(event)
+        self._wakeup.set()
+        metrics.observe("outbox.depth", len(self.events))
+
+    def _coalesce(self):
+        merged = {}
+        updates = [e for e in self.events if e["type"] == "yjs_update"]
+        if len(updates) > 1:
+            state_vectors = [e.get("state_vector") for e in updates]
+            if None in state_vectors:
+                # Where some update started is unknown, so send the whole state
+                update = encode_state_as_update(self.room.ydoc)
+            else:
+                update = encode_state_as_update(
+                    self.room.ydoc, merge_state_vectors(state_vectors)
+                )
+            merged["yjs_update"] = {
+                "type": "yjs_update",
+                "bytes": create_update_message(update),
+                "sender_channel": None,
+            }
+        awareness = [e for e in self.events if e["type"] == "awareness_update"]
+        snapshot = self.room.awareness.snapshot() if len(awareness) > 1 else None
+        if snapshot is not None:
+            merged["awareness_update"] = {
+                "type": "awareness_update",
+                "bytes": snapshot,
+                "sender_channel": None,
+            }
+        # Each merged event takes the place of the first event it replaces
+        events = deque()
+        for event in self.events:
+            kind = event["type"]
+            if kind not in merged:
+                events.append(event)
+            elif merged[kind] is not None:
+                events.append(merged[kind])
+                merged[kind] = None
+        metrics.incr("outbox.coalesced", len(self.events) - len(events))
+        self.events = events
+
+    def _disconnect(self):
+        logger.warning(
+            f"Outbox of {self.consumer.channel_name} is full, closing the connection."
+        )
+        metrics.incr("outbox.disconnects")
+        self.closed = True
+        self.events.clear()
+        asyncio.ensure_future(self.consumer.close(code=RESYNC_CLOSE_CODE))
+
+    async def _run(self):
+        while True:
+            while not self.events:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            event = self.events.popleft()
+            try:
+                await self.consumer.dispatch(event)
+            except Exception as e:
+                logger.error(
+                    f"Error sending {event.get('type')} to {self.consumer.channel_name}: {e}"
+                )
+
+    async def close(self):
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class UpdateCoalescer:
+    """
+    Merges the Yjs updates a room receives within a short window into a
+    single ``yjs_update`` event before fanning it out.
+
+    Fast typing produces dozens of tiny updates per second; with a window of
+    a few tens of milliseconds every peer gets one frame per window instead.
+    The merged update is encoded from the room doc against its state vector
+    at the start of the window, so it is exactly what changed meanwhile.
+    """
+
+    def __init__(self, room, window=None):
+        self.room = room
+        window = settings.DOCUMENT_UPDATE_COALESCE_WINDOW if window is None else window
+        self.window = window.total_seconds()
+        self.base_sv = None
+        self.messages = []
+        self.senders = set()
+        self._timer = None
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def begin(self):
+        """
+        Opens a window, if none is open, before an update is applied to the room doc.
+        """
+        if self.base_sv is None:
+            self.base_sv = encode_state_vector(self.room.ydoc)
+
+    async def add(self, message, sender_channel):
+        """
+        Fans out an update message that has already been applied to the room
+        doc, right away or when the window closes.
+        """
+        if self.window <= 0:
+            base_sv, self.base_sv = self.base_sv, None
+            await self.room.publish(
+                {
+                    "type": "yjs_update",
+                    "bytes": message,
+                    "sender_channel": sender_channel,
+                    "state_vector": base_sv,
+                },
+                sender_channel=sender_channel,
+            )
+            return
+        self.messages.append(message)
+        self.senders.add(sender_channel)
+        if self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.window, self._spawn_flush)
+
+    def _spawn_flush(self):
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        messages, senders, base_sv = self.messages, self.senders, self.base_sv
+        self.messages, self.senders, self.base_sv = [], set(), None
+        if not messages:
+            return
+        if len(messages) == 1:
+            message = messages[0]
+        else:
+            message = create_update_message(
+                encode_state_as_update(self.room.ydoc, base_sv)
+            )
+        # Peers echo back updates they already have harmlessly, so only a
+        # window with a single sender skips it.
+        sender_channel = senders.pop() if len(senders) == 1 else None
+        metrics.incr("coalesce.updates", len(messages))
+        metrics.incr("coalesce.messages")
+        metrics.incr("coalesce.messages_saved", len(messages) - 1)
+        metrics.observe("coalesce.batch_size", len(messages))
+        await self.room.publish(
+            {
+                "type": "yjs_update",
+                "bytes": message,
+                "sender_channel": sender_channel,
+                # Lets a backed up outbox merge this update with later ones
+                "state_vector": base_sv,
+            },
+            sender_channel=sender_channel,
+        )
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+
+class DocumentRoom:
+    """
+    Holds the single authoritative YDoc of an open document for this process.
+
+    Every DocumentConsumer connected to the same document attaches to the same
+    room, so the CRDT is loaded and kept in memory only once no matter how many
+    people are editing it. Events are handed to local peers directly, as the
+    same object, and the channel layer is only used to reach peers connected
+    to other processes.
+    """
+
+    def __init__(self, doc_uuid, document_id, channel_layer=None):
+        self.doc_uuid = doc_uuid
+        self.document_id = document_id
+        self.group_name = get_group_name(doc_uuid)
+        self.channel_layer = channel_layer
+        # With the in-memory layer every peer lives in this process.
+        self.local_only = channel_layer is None or isinstance(
+            channel_layer, InMemoryChannelLayer
+        )
+        self.ydoc = YDoc()
+        self.connections = {}
+        self.loaded = False
+        self.buffer = UpdateBuffer(self)
+        self.coalescer = UpdateCoalescer(self)
+        self.awareness = RoomAwareness(self)
+        self.compaction = CompactionTrigger(self)
+        self.relay_channel = None
+        self._relay_task = None
+        self._load_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.connections)
+
+    async def load(self, fetch_updates):
+        """
+        Builds the room state once, the first time a connection attaches.
+
+        Args:
+            fetch_updates (Callable): Coroutine function returning the stored update payloads in order.
+        """
+        async with self._load_lock:
+            if self.loaded:
+                return
+            # YDoc objects are bound to the thread that created them, so the
+            # payloads are fetched off-loop but applied here.
+            for update_data in await fetch_updates():
+                try:
+                    apply_update(self.ydoc, update_data)
+                except Exception as e:
+                    logger.error(f"Error applying update: {e}")
+            self.buffer.mark_persisted()
+            await self.start_relay()
+            self.loaded = True
+            logger.info(f"Room for document {self.doc_uuid} loaded.")
+
+    def attach(self, consumer):
+        outbox = Outbox(consumer, self)
+        outbox.start()
+        self.connections[consumer.channel_name] = outbox
+
+    async def detach(self, channel_name):
+        outbox = self.connections.pop(channel_name, None)
+        if outbox is not None:
+            await outbox.close()
+
+    def apply_update(self, update, author_id=None):
+        """
+        Applies a client update to the room doc and queues it for persistence.
+        """
+        self.coalescer.begin()
+        apply_update(self.ydoc, update)
+        self.buffer.add(update, author_id)
+        self.compaction.touch()
+
+    def broadcast(self, event, exclude=None):
+        """
+        Hands an event to every local connection except ``exclude``.
+        """
+        for channel_name, outbox in self.connections.items():
+            if channel_name != exclude:
+                outbox.put(event)
+
+    async def publish(self, event, sender_channel=None):
+        """
+        Sends an event to every peer of the document, local or remote.
+        """
+        self.broadcast(event, exclude=sender_channel)
+        if not self.local_only:
+            await self.channel_layer.group_send(
+                self.group_name, {**event, "origin": get_process_id()}
+            )
+
+    async def start_relay(self):
+        """
+        Subscribes one channel per process to the document group, through
+        which events published by other processes, views and tasks arrive.
+        """
+        if self.channel_layer is None or self._relay_task is not None:
+            return
+        self.relay_channel = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.group_name, self.relay_channel)
+        self._relay_task = asyncio.ensure_future(self._relay())
+        if not self.local_only:
+            # Ask rooms of other processes for edits not in the database yet
+            await self.channel_layer.group_send(
+                self.group_name,
+                {
+                    "type": "room.sync_request",
+                    "state_vector": encode_state_vector(self.ydoc),
+                    "origin": get_process_id(),
+                },
+            )
+
+    async def _relay(self):
+        while True:
+            event = await self.channel_layer.receive(self.relay_channel)
+            if event.get("origin") == get_process_id():
+                continue  # Already delivered locally
+            try:
+                await self.receive_remote(event)
+            except Exception as e:
+                logger.error(f"Error relaying {event.get('type')}: {e}")
+
+    async def receive_remote(self, event):
+        """
+        Handles an event published by another process, a view or a task.
+
+        Remote edits are applied to the room doc, which stays authoritative
+        for this process, but not persisted again.
+        """
+        if event["type"] == "room.sync_request":
+            update = encode_state_as_update(self.ydoc, event["state_vector"])
+            if update != b"\x00\x00":
+                await self.channel_layer.group_send(
+                    self.group_name,
+                    {"type": "room.sync", "update": update, "origin": get_process_id()},
+                )
+            snapshot = self.awareness.snapshot()
+            if snapshot is not None:
+                await self.channel_layer.group_send(
+                    self.group_name,
+                    {
+                        "type": "awareness_update",
+                        "bytes": snapshot,
+                        "sender_channel": None,
+                        "origin": get_process_id(),
+                    },
+                )
+            return
+        if event["type"] == "room.sync":
+            state_vector = encode_state_vector(self.ydoc)
+            apply_update(self.ydoc, event["update"])
+            self.buffer.mark_remote()
+            event = {
+                "type": "yjs_update",
+                "bytes": create_update_message(event["update"]),
+                "sender_channel": None,
+                "state_vector": state_vector,
+            }
+        elif event["type"] == "yjs_update":
+            # Where the update starts in this process' doc, not the sender's
+            event["state_vector"] = encode_state_vector(self.ydoc)
+            self.apply_frame(event["bytes"])
+            self.buffer.mark_remote()
+        elif event["type"] == "awareness_update":
+            # Remote clients are throttled by the process they are connected to
+            if not self.awareness.apply(decode_awareness_update(event["bytes"])):
+                return
+        self.broadcast(event)
+
+    def apply_frame(self, message):
+        if message[0] == YMessageType.SYNC and message[1] in (
+            YSyncMessageType.SYNC_STEP2,
+            YSyncMessageType.SYNC_UPDATE,
+        ):
+            apply_update(self.ydoc, read_message(message[2:]))
+
+    async def stop_relay(self):
+        if self._relay_task is None:
+            return
+        self._relay_task.cancel()
+        try:
+            await self._relay_task
+        except asyncio.CancelledError:
+            pass
+        self._relay_task = None
+        await self.channel_layer.group_discard(self.group_name, self.relay_channel)
+
+    async def close(self):
+        try:
+            # Peers in other processes still wait for the last window
+            await self.coalescer.close()
+        except Exception as e:
+            logger.error(f"Error publishing coalesced updates: {e}")
+        await self.awareness.close()
+        await self.stop_relay()
+        await self.buffer.close()
+        await self.compaction.close()
+
+
+class RoomRegistry:
+    """
+    Process-wide registry of open document rooms keyed by document UUID.
+
+    Rooms are reference counted by the channel names attached to them and are
+    dropped as soon as the last connection leaves.
+    """
+
+    def __init__(self):
+        self._rooms = {}
+        self._closing = {}
+
+    def __contains__(self, doc_uuid):
+        return doc_uuid in self._rooms
+
+    def get(self, doc_uuid):
+        return self._rooms.get(doc_uuid)
+
+    async def join(self, doc_uuid, document_id, consumer, fetch_updates):
+        closing = self._closing.get(doc_uuid)
+        if closing is not None:
+            # Let the previous room finish writing before the state is reloaded.
+            await asyncio.wait([closing])
+        room = self._rooms.get(doc_uuid)
+        if room is None:
+            room = DocumentRoom(doc_uuid, document_id, consumer.channel_layer)
+            self._rooms[doc_uuid] = room
+        room.attach(consumer)
+        try:
+            await room.load(fetch_updates)
+        except Exception:
+            await self.leave(doc_uuid, consumer.channel_name)
+            raise
+        return room
+
+    async def leave(self, doc_uuid, channel_name):
+        room = self._rooms.get(doc_uuid)
+        if room is None:
+            return None
+        await room.detach(channel_name)
+        if not room.connections and self._rooms.get(doc_uuid) is room:
+            del self._rooms[doc_uuid]
+            closing = asyncio.ensure_future(room.close())
+            self._closing[doc_uuid] = closing
+            try:
+                await closing
+            finally:
+                if self._closing.get(doc_uuid) is closing:
+                    del self._closing[doc_uuid]
+            logger.info(f"Room for document {doc_uuid} closed.")
+        return room
+
+    async def close_all(self):
+        """
+        Flushes every open room, used on server shutdown.
+        """
+        rooms = list(self._rooms.values())
+        await asyncio.gather(*(room.close() for room in rooms), return_exceptions=True)
+
+
+room_registry = RoomRegistry()
@@ -5,7 +5,9 @@ from .models import *
 from .utility import *
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import NotFound, PermissionDenied
-from y_py import YDoc, apply_update, encode_state_as_update
+from y_py import encode_state_as_update
+from .access import can_manage_permissions, get_access_level
+from .snapshots import load_ydoc
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -109,17 +111,7 @@ class DocumentSetPermissionSerializer(serializers.Serializer):
         changer = self.context["changer"]
 
         # Verify changer has permission to modify this document
-        if not (
-            doc.public_premission_access
-            or (
-                changer == doc.owner
-                or AccessLevel.objects.filter(
-                    user=changer,
-                    document=doc,
-                    access_level__gte=AccessLevel.PERMISSION_MAP["Admin"],
-                ).exists()
-            )
-        ):
+        if not can_manage_permissions(changer, doc):
             raise PermissionDenied(
                 "You don't have permission to modify permissions for this document"
             )
@@ -139,11 +131,7 @@ class DocumentSetPermissionSerializer(serializers.Serializer):
                 attrs.pop(permission)
                 continue
             # Prevent setting permissions higher than your own
-            changer_level = (
-                UserPermissionSerializer.PERMISSION_MAP["Owner"]
-                if changer == doc.owner
-                else AccessLevel.objects.get(user=changer, document=doc).access_level
-            )
+            changer_level = get_access_level(changer, doc)
             if perm_level > changer_level:
                 raise PermissionDenied(
                     f"Cannot set permission level higher than your own (permission level {changer_level} , requested change level{perm_level})"
@@ -342,6 +330,10 @@ class CompactedDocumentUpdateSerializer(serializers.ModelSerializer):
             "processed",
             "is_compacted",
             "created_at",
+            "chars_inserted",
+            "chars_deleted",
+            "blocks_touched",
+            "payload_size",
         ]
         read_only_fields = [
             "id",
@@ -350,8 +342,17 @@ class CompactedDocumentUpdateSerializer(serializers.ModelSerializer):
             "processed",
             "is_compacted",
             "created_at",
+            "chars_inserted",
+            "chars_deleted",
+            "blocks_touched",
+            "payload_size",
         ]
 
+    def update(self, instance, validated_data):
+        if "title" in validated_data:
+            instance.is_named = bool(validated_data["title"])
+        return super().update(instance, validated_data)
+
 
 class CompactedDocumentUpdateSerializerRetrieve(serializers.ModelSerializer):
     authors = AuthorInfoSerializer(many=True, read_only=True)
@@ -383,35 +384,9 @@ class CompactedDocumentUpdateSerializerRetrieve(serializers.ModelSerializer):
         ]
 
     def get_before_update(self, obj):
-        updates = DocumentUpdate.objects.filter(
-            document=obj.document,
-            created_at__lt=obj.created_at,
-            is_compacted=True,
-        ).order_by("created_at")
-        ydoc = YDoc()
-        for update in updates:
-            update_bytes = (
-                bytes(update.update_data)
-                if isinstance(update.update_data, memoryview)
-                else update.update_data
-            )
-            if not isinstance(update_bytes, bytes):
-                logger.error(
-                    f"Invalid update_data type: {type(update_bytes)}, value: {update_bytes}"
-                )
-                continue
-            try:
-                apply_update(ydoc, update_bytes)
-            except Exception as e:
-                logger.error(f"Error applying update: {e}")
-                continue
+        ydoc = load_ydoc(obj.document_id, pending=False, before=obj.created_at)
         update_bytes = encode_state_as_update(ydoc)
         return base64.b64encode(update_bytes).decode("utf-8")
     
     def get_delta(self, obj):
-        byte_data = (
-            bytes(obj.update_data)
-            if isinstance(obj.update_data, memoryview)
-            else obj.update_data
-        )
-        return base64.b64encode(byte_data).decode("utf-8")
+        return base64.b64encode(obj.payload).decode("utf-8")
@@ -1,5 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .access import invalidate_access, invalidate_document
 from .models import *
 @receiver(post_save, sender=Document)
 def handle_new_model_creation(sender, instance, created, **kwargs):
@@ -14,4 +15,16 @@ def handle_new_model_creation(sender, instance, created, **kwargs):
             user=instance.owner,
             document=instance,
             access_level=AccessLevel.PERMISSION_MAP["Owner"],
-        )
\ No newline at end of file
+        )
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_document_access(sender, instance, **kwargs):
+    invalidate_document(instance.id)
+
+
+@receiver(post_save, sender=AccessLevel)
+@receiver(post_delete, sender=AccessLevel)
+def invalidate_user_access(sender, instance, **kwargs):
+    invalidate_access(instance.user_id, instance.document_id)
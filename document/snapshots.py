@@ -0,0 +1,206 @@
+import logging
+from django.conf import settings
+from django.db.models import Q
+from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
+from . import codecs
+from .models import DocumentCheckpoint, DocumentSnapshot, DocumentUpdate
+
+logger = logging.getLogger(__name__)
+
+
+def as_bytes(update_data, codec=codecs.RAW):
+    """
+    Normalizes a stored BinaryField value to the Yjs update bytes.
+
+    Returns:
+        bytes | memoryview | None: The payload, a memoryview when read from the
+        blob store, or None if it is not binary data.
+    """
+    if isinstance(update_data, memoryview):
+        update_data = bytes(update_data)
+    if not isinstance(update_data, bytes):
+        logger.error(
+            f"Invalid update_data type: {type(update_data)}, value: {update_data}"
+        )
+        return None
+    try:
+        return codecs.decode(codec, update_data)
+    except Exception as e:
+        logger.error(f"Error decoding {codec} update_data: {e}")
+        return None
+
+
+def apply_updates(ydoc, payloads):
+    """
+    Applies update payloads to a YDoc in order, skipping the broken ones.
+    """
+    for update_data in payloads:
+        try:
+            apply_update(ydoc, update_data)
+        except Exception as e:
+            logger.error(f"Error applying update: {e}")
+    return ydoc
+
+
+def iter_payloads(updates, chunk_size=None):
+    """
+    Yields the payloads of a list of updates in order.
+
+    Updates loaded without their payload (``update_data`` deferred) are read
+    in chunks, so at most ``chunk_size`` payloads are held in memory at once.
+    """
+    if "update_data" not in updates[0].get_deferred_fields():
+        for document_update in updates:
+            yield as_bytes(document_update.update_data, document_update.codec)
+        return
+    chunk_size = chunk_size or settings.DOCUMENT_COMPACTION_CHUNK_SIZE
+    for start in range(0, len(updates), chunk_size):
+        ids = [u.id for u in updates[start : start + chunk_size]]
+        payloads = {
+            update_id: (update_data, codec)
+            for update_id, update_data, codec in DocumentUpdate.objects.filter(
+                id__in=ids
+            ).values_list("id", "update_data", "codec")
+        }
+        for update_id in ids:
+            if update_id in payloads:
+                yield as_bytes(*payloads.pop(update_id))
+
+
+def get_document_payloads(document_id, pending=True, before=None):
+    """
+    Returns the payloads needed to rebuild a document state.
+
+    The latest snapshot is used as the base when it is usable, otherwise the
+    nearest checkpoint before ``before``, so only the compacted updates after
+    it are read from the update log.
+
+    Args:
+        document_id (int): The ID of the document.
+        pending (bool): Whether to include updates that are not compacted yet.
+        before (datetime, optional): Only rebuild the compacted history strictly before this time.
+
+    Returns:
+        List[bytes]: Payloads to apply in order.
+    """
+    payloads = []  # (update_data, codec)
+    compacted = Q(is_compacted=True)
+    if before is not None:
+        compacted &= Q(created_at__lt=before)
+
+    snapshot = (
+        DocumentSnapshot.objects.filter(document_id=document_id)
+        .only("state", "codec", "last_update_at")
+        .first()
+    )
+    if before is not None and (snapshot is None or snapshot.last_update_at >= before):
+        snapshot = (
+            DocumentCheckpoint.objects.filter(
+                document_id=document_id, last_update_at__lt=before
+            )
+            .order_by("-last_update_at")
+            .only("state", "codec", "last_update_at")
+            .first()
+        )
+    if snapshot:
+        payloads.append((snapshot.state, snapshot.codec))
+        compacted &= Q(created_at__gt=snapshot.last_update_at)
+
+    tail = compacted
+    if pending:
+        tail |= Q(is_compacted=False, processed=False)
+    payloads.extend(
+        DocumentUpdate.objects.filter(tail, document_id=document_id)
+        .order_by("created_at", "id")
+        .values_list("update_data", "codec")
+    )
+    return [p for p in (as_bytes(*payload) for payload in payloads) if p is not None]
+
+
+def load_ydoc(document_id, pending=True, before=None):
+    """
+    Builds a new YDoc from the snapshot and the update log tail.
+
+    Returns:
+        YDoc: A new YDoc instance with the document state applied.
+    """
+    return apply_updates(
+        YDoc(), get_document_payloads(document_id, pending=pending, before=before)
+    )
+
+
+def load_version_ydoc(update):
+    """
+    Builds a new YDoc holding the compacted history up to and including a
+    compacted update.
+    """
+    ydoc = load_ydoc(update.document_id, pending=False, before=update.created_at)
+    apply_update(ydoc, update.payload)
+    return ydoc
+
+
+def save_snapshot(document_id, ydoc, last_update):
+    """
+    Stores the state of ``ydoc`` as the snapshot of the document.
+
+    Args:
+        document_id (int): The ID of the document.
+        ydoc (YDoc): A doc holding exactly the compacted history up to ``last_update``.
+        last_update (DocumentUpdate): The newest compacted update covered by the state.
+    """
+    codec, state = codecs.encode(encode_state_as_update(ydoc))
+    snapshot, _ = DocumentSnapshot.objects.update_or_create(
+        document_id=document_id,
+        defaults={
+            "state": state,
+            "codec": codec,
+            "state_vector": encode_state_vector(ydoc),
+            "last_update_id": last_update.id,
+            "last_update_at": last_update.created_at,
+        },
+    )
+    return snapshot
+
+
+def save_checkpoint(document_id, ydoc, last_update, interval=None):
+    """
+    Stores the state of ``ydoc`` as a checkpoint when enough compacted updates
+    went by since the previous one.
+
+    Args:
+        document_id (int): The ID of the document.
+        ydoc (YDoc): A doc holding exactly the compacted history up to ``last_update``.
+        last_update (DocumentUpdate): The newest compacted update covered by the state.
+        interval (int, optional): Compacted updates between checkpoints,
+            DOCUMENT_CHECKPOINT_INTERVAL by default.
+
+    Returns:
+        DocumentCheckpoint | None: The new checkpoint, None when not due yet.
+    """
+    interval = interval or settings.DOCUMENT_CHECKPOINT_INTERVAL
+    since = Q(document_id=document_id, is_compacted=True)
+    since &= Q(created_at__lte=last_update.created_at)
+    previous = (
+        DocumentCheckpoint.objects.filter(
+            document_id=document_id, last_update_at__lte=last_update.created_at
+        )
+        .order_by("-last_update_at")
+        .values_list("last_update_at", flat=True)
+        .first()
+    )
+    if previous is not None:
+        since &= Q(created_at__gt=previous)
+    if DocumentUpdate.objects.filter(since).count() < interval:
+        return None
+    return create_checkpoint(document_id, ydoc, last_update)
+
+
+def create_checkpoint(document_id, ydoc, last_update):
+    codec, state = codecs.encode(encode_state_as_update(ydoc))
+    return DocumentCheckpoint.objects.create(
+        document_id=document_id,
+        state=state,
+        codec=codec,
+        last_update_id=last_update.id,
+        last_update_at=last_update.created_at,
+    )
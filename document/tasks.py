@@ -1,12 +1,16 @@
 import logging
 from datetime import timedelta
-from itertools import groupby
 from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from celery import shared_task
-from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
-from .models import DocumentUpdate
+from django.db import IntegrityError, transaction
+from celery import chord, shared_task
+from y_py import apply_update, encode_state_as_update, encode_state_vector
+from . import metrics
+from .locking import document_lock
+from .merging import merge_document_updates
+from .models import DocumentCompactionClaim, DocumentSnapshot, DocumentUpdate
+from .diffs import ChangeCounter
+from .snapshots import iter_payloads, load_ydoc, save_checkpoint, save_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -57,7 +61,7 @@ def split_updates_by_time_gap(updates, time_threshold=TIME_THRESHOLD):
 
 def get_ydoc(document_id):
     """
-    Retrieves the YDoc updates and apply them to a new YDoc instance.
+    Retrieves the compacted state of a document, starting from its snapshot.
     
     Args:
         document_id (int): The ID of the document to retrieve updates for.
@@ -65,94 +69,311 @@ def get_ydoc(document_id):
     Returns:
         YDoc: A new YDoc instance with the applied updates.
     """
-    ydoc = YDoc()
-    updates = DocumentUpdate.objects.filter(document_id=document_id, processed=True)
-    for update in updates:
-        update_bytes = (
-            bytes(update.update_data)
-            if isinstance(update.update_data, memoryview)
-            else update.update_data
-        )
-        if not isinstance(update_bytes, bytes):
-            logger.error(
-                f"Invalid update_data type: {type(update_bytes)}, value: {update_bytes}"
-            )
-            continue
-        try:
-            apply_update(ydoc, update_bytes)
-        except Exception as e: 
-            logger.error(f"Error applying update: {e}")
-            continue
-    return ydoc
+    return load_ydoc(document_id, pending=False)
 
 
-def process_session(session):
+def process_session(session, ydoc=None):
     """
     Processes a session of updates. This function should contain the logic to handle the updates.
 
     Args:
         session (List): A list of update objects representing a session.
+        ydoc (YDoc, optional): The compacted state of the document before the session. It is
+            advanced in place, so consecutive sessions of a document share one base state. When
+            omitted, the state is loaded and the snapshot saved by this call.
+
+    Returns:
+        DocumentUpdate: The compacted update, None for an empty session.
     """
     if not session:
-        return
+        return None
     logger.info(
         f"! Processing session with {len(session)} updates for document ID: {session[0].document_id}"
     )
-    local_doc = get_ydoc(session[0].document_id)
-    local_sv = encode_state_vector(local_doc)
-    
-    remote_doc = get_ydoc(session[0].document_id)
-    
-    authors = set(u.author for u in session if u.author)
-    
-    for document_update in session:
-        update_data = (
-            bytes(document_update.update_data)
-            if isinstance(document_update.update_data, memoryview)
-            else document_update.update_data
-        )
-        if not isinstance(update_data, bytes):
-            logger.error(
-                f"Invalid update_data type: {type(update_data)}, value: {update_data}"
+    save = ydoc is None
+    if save:
+        ydoc = get_ydoc(session[0].document_id)
+    local_sv = encode_state_vector(ydoc)
+
+    authors = set(u.author_id for u in session if u.author_id)
+
+    with ChangeCounter(ydoc) as changes:
+        for update_data in iter_payloads(session):
+            if update_data is None:
+                continue
+            try:
+                apply_update(ydoc, update_data)
+            except Exception as e:
+                logger.error(f"Error applying update: {e}")
+                continue
+    compacted_delta = encode_state_as_update(ydoc, local_sv)
+    session_update_ids = [u.id for u in session]
+
+    # Another compactor may have read the same session meanwhile; the first one
+    # to take the lock commits it and the others find its updates gone.
+    with document_lock(session[0].document_id):
+        remaining = DocumentUpdate.objects.filter(
+            id__in=session_update_ids, is_compacted=False
+        ).count()
+        if remaining != len(session_update_ids):
+            logger.info(
+                f"Session {session_update_ids[0]}-{session_update_ids[-1]} of document ID: {session[0].document_id} was already compacted, skipping."
             )
-            continue
+            metrics.incr("compaction.skipped_sessions")
+            return None
         try:
-            apply_update(remote_doc, update_data)
-        except Exception as e:
-            logger.error(f"Error applying update: {e}")
-            continue
-    compacted_delta = encode_state_as_update(remote_doc, local_sv)
-
-    with transaction.atomic():
-        compacted = DocumentUpdate.objects.create(
-            document_id=session[0].document_id,
-            update_data=compacted_delta,
-            is_compacted=True,
-            processed=True,
-            created_at= session[-1].created_at + timedelta(seconds=1),
-        )
+            with transaction.atomic():
+                compacted = DocumentUpdate.objects.create(
+                    document_id=session[0].document_id,
+                    payload=compacted_delta,
+                    is_compacted=True,
+                    processed=True,
+                    created_at= session[-1].created_at + timedelta(seconds=1),
+                    source_first_id=min(session_update_ids),
+                    source_last_id=max(session_update_ids),
+                    payload_size=len(compacted_delta),
+                    **changes.as_dict(),
+                )
+        except IntegrityError:
+            metrics.incr("compaction.skipped_sessions")
+            return None
         compacted.authors.set(authors)
-        compacted.save()
-        session_update_ids = [u.id for u in session]
+        if save:
+            save_snapshot(session[0].document_id, ydoc, compacted)
+        save_checkpoint(session[0].document_id, ydoc, compacted)
         logger.info(
             f"Compacted {len(session)} updates into session ID: {compacted.id} for document ID: {session[0].document_id}"
         )
-        DocumentUpdate.objects.filter(id__in=session_update_ids).update(processed=True)
-        DocumentUpdate.objects.filter(id__in=session_update_ids).delete()
+        # Only ids are loaded to collect the rows, not their payloads
+        DocumentUpdate.objects.filter(id__in=session_update_ids).only("id").delete()
         logger.info(
             f"!- Deleted {len(session)} updates after compaction for document ID: {session[0].document_id}"
         )
+    return compacted
+
+
+def compact_document(document_id, updates):
+    """
+    Compacts the raw updates of one document session by session.
+
+    The compacted state is loaded once, from the snapshot, and every session is
+    applied on top of the same doc, so the cost follows the new updates rather
+    than the document history. The snapshot is saved once at the end. A
+    session already compacted by another run stops this one.
+
+    Args:
+        document_id (int): The ID of the document.
+        updates (Iterable): Raw updates of the document ordered by creation time.
+
+    Returns:
+        int: The number of sessions compacted.
+    """
+    ydoc = None
+    compacted = None
+    sessions = 0
+    # If a session fails, the doc holds its rolled back updates and no snapshot
+    # is saved; the sessions committed before are read from the update log.
+    for session in split_updates_by_time_gap(updates):
+        if ydoc is None:
+            ydoc = get_ydoc(document_id)
+        committed = process_session(session, ydoc)
+        if committed is not None:
+            compacted = committed
+            sessions += 1
+        else:
+            # Compacted elsewhere, maybe with other session boundaries, so the
+            # doc may hold raw updates the history does not and the next
+            # sessions could depend on them. Those are left to the next run,
+            # which reads them from the database again.
+            ydoc = None
+            break
+    if compacted is not None and ydoc is not None:
+        with document_lock(document_id):
+            # Never move the snapshot back behind a concurrent compactor's
+            last_update_at = (
+                DocumentSnapshot.objects.filter(document_id=document_id)
+                .values_list("last_update_at", flat=True)
+                .first()
+            )
+            if last_update_at is None or last_update_at <= compacted.created_at:
+                save_snapshot(document_id, ydoc, compacted)
+    return sessions
+
+def get_pending_document_ids():
+    """
+    Returns the IDs of the documents with raw updates waiting for compaction.
+    """
+    return list(
+        DocumentUpdate.objects.filter(processed=False, is_compacted=False)
+        .order_by("document_id")
+        .values_list("document_id", flat=True)
+        .distinct()
+    )
+
+
+def iter_raw_updates(document_id, chunk_size=None):
+    """
+    Streams the raw updates of a document without their payloads.
+    """
+    return (
+        DocumentUpdate.objects.filter(
+            document_id=document_id, processed=False, is_compacted=False
+        )
+        .order_by("created_at", "id")
+        .only("id", "document_id", "author_id", "created_at")
+        .iterator(chunk_size=chunk_size or settings.DOCUMENT_COMPACTION_CHUNK_SIZE)
+    )
+
+
+def claim_compaction(document_id):
+    """
+    Claims a document for a compaction or merge task.
+
+    A claim older than DOCUMENT_COMPACTION_CLAIM_TIMEOUT belongs to a task
+    that never finished and is taken over.
+
+    Returns:
+        bool: Whether the claim was taken, False while another task holds it.
+    """
+    expired = timezone.now() - settings.DOCUMENT_COMPACTION_CLAIM_TIMEOUT
+    DocumentCompactionClaim.objects.filter(
+        document_id=document_id, claimed_at__lt=expired
+    ).delete()
+    try:
+        with transaction.atomic():
+            DocumentCompactionClaim.objects.create(document_id=document_id)
+    except IntegrityError:
+        return False
+    return True
+
+
+def release_compaction(document_id):
+    DocumentCompactionClaim.objects.filter(document_id=document_id).delete()
+
 
 @shared_task
 def compact_document_updates():
-    updates = (
-        DocumentUpdate.objects
-        .filter(processed=False, is_compacted=False)
-        .order_by('document_id', 'created_at')
+    """
+    Dispatches one compaction task per document with raw updates.
+
+    A document is claimed until its task finishes, so it is
+    never queued or compacted twice at once, and the documents spread over
+    every worker. A callback logs the totals once all of them finished.
+
+    Returns:
+        dict: The number of documents dispatched and skipped as already claimed.
+    """
+    document_ids = get_pending_document_ids()
+    claimed = [doc_id for doc_id in document_ids if claim_compaction(doc_id)]
+    logger.info(
+        f"[][][] Dispatching compaction of {len(claimed)} documents, {len(document_ids) - len(claimed)} already claimed."
+    )
+    if claimed:
+        chord(compact_pending_document.s(doc_id) for doc_id in claimed)(
+            summarize_compaction.s()
+        )
+    return {"dispatched": len(claimed), "skipped": len(document_ids) - len(claimed)}
+
+
+@shared_task(bind=True, max_retries=5)
+def compact_pending_document(self, document_id, claimed=True):
+    """
+    Compacts the raw updates of one document and releases its claim.
+
+    Only update metadata is streamed to find the sessions, and payloads are
+    read in chunks per session, so memory stays bounded however large the
+    backlog is.
+
+    Args:
+        document_id (int): The ID of the document.
+        claimed (bool): Whether the dispatcher already claimed the document. Tasks scheduled
+            by an idle room claim it themselves and retry later while another one holds it.
+
+    Returns:
+        dict: The sessions compacted, the error if any, and the peak RSS of the worker in KiB.
+    """
+    if not claimed:
+        if not claim_compaction(document_id):
+            raise self.retry(countdown=60)
+    result = {"document_id": document_id, "sessions": 0, "error": None}
+    try:
+        result["sessions"] = compact_document(document_id, iter_raw_updates(document_id))
+    except Exception as e:
+        # Reported to the summary instead of failing the whole chord
+        logger.exception(f"Error compacting document ID: {document_id}")
+        result["error"] = str(e)
+    finally:
+        release_compaction(document_id)
+    result["peak_rss_kb"] = metrics.peak_rss()
+    metrics.observe("compaction.peak_rss_kb", result["peak_rss_kb"])
+    return result
+
+
+def schedule_compaction(document_id, countdown=0):
+    """
+    Queues the compaction of one document, used when its room goes idle.
+    """
+    compact_pending_document.apply_async(
+        args=[document_id], kwargs={"claimed": False}, countdown=countdown
+    )
+
+
+@shared_task
+def summarize_compaction(results):
+    """
+    Totals the results of a compaction run.
+    """
+    summary = {
+        "documents": len(results),
+        "sessions": sum(r["sessions"] for r in results),
+        "failed": [r["document_id"] for r in results if r["error"]],
+        "peak_rss_kb": max((r["peak_rss_kb"] for r in results), default=0),
+    }
+    logger.info(
+        f"Compacted {summary['sessions']} sessions of {summary['documents']} documents, "
+        f"{len(summary['failed'])} failed, peak worker RSS {summary['peak_rss_kb']} KiB."
+    )
+    return summary
+
+
+@shared_task
+def merge_compacted_updates():
+    """
+    Merges the compacted history of every document into coarser tiers.
+
+    Documents being compacted are skipped until the next run.
+
+    Returns:
+        dict: Totals of the rows and bytes before and after merging.
+    """
+    now = timezone.now()
+    document_ids = (
+        DocumentUpdate.objects.filter(
+            is_compacted=True,
+            is_named=False,
+            tier__lt=DocumentUpdate.MONTHLY,
+            created_at__lt=now - timedelta(days=1),
+        )
+        .order_by("document_id")
+        .values_list("document_id", flat=True)
+        .distinct()
+    )
+    totals = {"documents": 0, "rows_before": 0, "rows_after": 0, "bytes_before": 0, "bytes_after": 0}
+    for doc_id in list(document_ids):
+        if not claim_compaction(doc_id):
+            continue
+        try:
+            stats = merge_document_updates(doc_id, now)
+        except Exception:
+            logger.exception(f"Error merging updates of document ID: {doc_id}")
+            continue
+        finally:
+            release_compaction(doc_id)
+        totals["documents"] += 1
+        for key in ("rows_before", "rows_after", "bytes_before", "bytes_after"):
+            totals[key] += stats[key]
+    logger.info(
+        f"Merged {totals['rows_before']} updates into {totals['rows_after']} across "
+        f"{totals['documents']} documents, {totals['bytes_before'] - totals['bytes_after']} bytes saved."
     )
-    logger.info(f"[][][] Processing {len(updates)} document updates into sessions.")
-    for doc_id, doc_updates in groupby(updates, key=lambda u: u.document_id):
-        doc_updates_list = list(doc_updates)
-        logger.info(f"Processing document ID: {doc_id} with {len(doc_updates_list)} updates.")
-        for session in split_updates_by_time_gap(doc_updates_list):
-            process_session(session)
\ No newline at end of file
+    return totals
@@ -2,6 +2,8 @@ from pytest import fixture
 from authentication.models import User
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework.test import APIClient
+from django.core.cache import cache
+from document.access import local_cache
 
 
 
@@ -14,3 +16,17 @@ def user_token_tuple():
 @fixture
 def api_client():
     return APIClient()
+
+
+@fixture(autouse=True)
+def no_idle_compaction(settings):
+    # Rooms would queue Celery tasks whenever they go idle
+    settings.DOCUMENT_COMPACT_ON_IDLE = False
+
+
+@fixture(autouse=True)
+def clear_access_cache():
+    # Rolled back rows never send the signals that clear it
+    yield
+    local_cache.clear()
+    cache.clear()
@@ -0,0 +1,104 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from document import access
+from document.models import AccessLevel, Document
+
+
+User = get_user_model()
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(
+        username="owner", email="owner@example.com", password="testpass"
+    )
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(
+        username="testuser", email="testuser@example.com", password="testpass"
+    )
+
+
+@pytest.fixture
+def document(owner):
+    return Document.objects.create(title="Test Doc", owner=owner, default_access_level=1)
+
+
+@pytest.mark.django_db
+class TestAccessResolution:
+    def test_levels(self, owner, user, document):
+        assert access.get_access_level(owner, document) == 4
+        assert access.get_access_level(user, document) == 1
+        AccessLevel.objects.create(user=user, document=document, access_level=3)
+        assert access.get_access_level(user, document.id) == 3
+        assert access.get_access_level(user, 0) is None
+
+    def test_warm_cache_costs_no_queries(self, user, document, django_assert_num_queries):
+        access.has_access(user, document.id, 2)
+        with django_assert_num_queries(0):
+            assert not access.has_access(user, document.id, 2)
+            assert access.can_manage_permissions(user, document.id)
+
+    def test_shared_cache_behind_local(
+        self, user, document, settings, django_assert_num_queries
+    ):
+        settings.DOCUMENT_ACCESS_CACHE_SHARED = True
+        access.get_access_level(user, document)
+        access.local_cache.clear()
+        with django_assert_num_queries(0):
+            assert access.get_access_level(user, document) == 1
+
+    def test_process_local_cache_not_used(
+        self, user, document, settings, django_assert_num_queries
+    ):
+        settings.DOCUMENT_ACCESS_CACHE_SHARED = False
+        access.get_access_level(user, document)
+        access.local_cache.clear()
+        # Another process changing the level only clears its own caches
+        AccessLevel.objects.bulk_create(
+            [AccessLevel(user=user, document=document, access_level=0)]
+        )
+        with django_assert_num_queries(2):
+            assert access.get_access_level(user, document) == 0
+
+    def test_access_level_change_invalidates(self, user, document):
+        assert access.get_access_level(user, document) == 1
+        row = AccessLevel.objects.create(user=user, document=document, access_level=2)
+        assert access.get_access_level(user, document) == 2
+        row.access_level = 0
+        row.save()
+        assert access.get_access_level(user, document) == 0
+        row.delete()
+        assert access.get_access_level(user, document) == 1
+
+    def test_document_change_invalidates(self, user, document):
+        document_id = document.id
+        assert access.can_manage_permissions(user, document_id)
+        document.public_premission_access = False
+        document.save()
+        assert not access.can_manage_permissions(user, document_id)
+        document.default_access_level = 3
+        document.save()
+        assert access.can_manage_permissions(user, document_id)
+        document.delete()
+        assert access.get_access_level(user, document_id) is None
+
+    def test_owner_row_repaired(self, owner, document):
+        AccessLevel.objects.filter(user=owner, document=document).delete()
+        access.get_access_level(owner, document)
+        assert AccessLevel.objects.get(user=owner, document=document).access_level == 4
+
+
+@pytest.mark.django_db
+class TestPermissionEndpointsUseCache:
+    def test_get_user_permission(self, api_client, user, document, django_assert_num_queries):
+        api_client.force_authenticate(user=user)
+        url = reverse("permission-get-user-permission", kwargs={"document": document.id})
+        assert api_client.get(url).data["access_level"] == "ReadOnly"
+
+        with django_assert_num_queries(0):
+            response = api_client.get(url)
+        assert response.data == {"access_level": "ReadOnly", "can_write": False}
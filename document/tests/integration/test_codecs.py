@@ -0,0 +1,185 @@
+import os
+import pytest
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from y_py import YDoc
+from document.blobs import get_blob_store
+from document.models import Document, DocumentCheckpoint, DocumentSnapshot, DocumentUpdate
+from document.snapshots import load_ydoc
+from document.tasks import process_session
+from yjs_helpers import edit
+
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def document(user):
+    return Document.objects.create(title="Test Doc", owner=user)
+
+
+@pytest.fixture
+def compressing(settings):
+    settings.DOCUMENT_UPDATE_CODEC = "zlib"
+    settings.DOCUMENT_UPDATE_COMPRESS_MIN_SIZE = 0
+
+
+@pytest.mark.django_db
+class TestCompressedUpdates:
+    def test_load_mixed_codecs(self, user, document, compressing):
+        client_doc = YDoc()
+        DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, "Hello ")
+        )
+        DocumentUpdate.objects.create(
+            document=document, author=user, payload=edit(client_doc, "world " * 50)
+        )
+        assert set(DocumentUpdate.objects.values_list("codec", flat=True)) == {
+            "raw",
+            "zlib",
+        }
+
+        ydoc = load_ydoc(document.id)
+        assert str(ydoc.get_text("shared")) == str(client_doc.get_text("shared"))
+
+    def test_compaction_compresses(self, user, document, compressing):
+        client_doc = YDoc()
+        updates = [
+            DocumentUpdate.objects.create(
+                document=document, author=user, update_data=edit(client_doc, "word " * 50)
+            )
+            for _ in range(3)
+        ]
+        process_session(updates)
+
+        compacted = DocumentUpdate.objects.get(document=document, is_compacted=True)
+        assert compacted.codec == "zlib"
+        ydoc = load_ydoc(document.id)
+        assert str(ydoc.get_text("shared")) == str(client_doc.get_text("shared"))
+
+    def test_compress_command(self, user, document, compressing):
+        client_doc = YDoc()
+        for text in ["a" * 500, "b" * 500, "c" * 500]:
+            DocumentUpdate.objects.create(
+                document=document, author=user, update_data=edit(client_doc, text)
+            )
+        expected = str(client_doc.get_text("shared"))
+
+        out = StringIO()
+        call_command("compress_document_updates", "--batch-size", "2", stdout=out)
+        assert "Re-encoded 3 updates with zlib" in out.getvalue()
+        assert not DocumentUpdate.objects.filter(codec="raw").exists()
+        assert str(load_ydoc(document.id).get_text("shared")) == expected
+
+        call_command("compress_document_updates", "--codec", "raw", stdout=out)
+        assert not DocumentUpdate.objects.exclude(codec="raw").exists()
+        assert str(load_ydoc(document.id).get_text("shared")) == expected
+
+    def test_benchmark_command(self, user, document):
+        client_doc = YDoc()
+        DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, "x" * 500)
+        )
+        out = StringIO()
+        call_command("benchmark_update_codecs", stdout=out)
+        for name in ["raw", "zlib", "lzma"]:
+            assert name in out.getvalue()
+
+
+@pytest.fixture
+def blob_store(settings, tmp_path):
+    settings.DOCUMENT_BLOB_STORE_DIR = str(tmp_path)
+    settings.DOCUMENT_BLOB_THRESHOLD = 1024
+    return get_blob_store()
+
+
+@pytest.mark.django_db
+class TestBlobStoredUpdates:
+    def test_snapshot_and_updates_in_blobs(self, user, document, blob_store):
+        client_doc = YDoc()
+        updates = [
+            DocumentUpdate.objects.create(
+                document=document, author=user, payload=edit(client_doc, text)
+            )
+            for text in [os.urandom(1500).hex(), "small"]
+        ]
+        assert [u.codec for u in updates] == ["blob", "raw"]
+        assert len(bytes(updates[0].update_data)) < 100
+
+        process_session(updates)
+        snapshot = DocumentSnapshot.objects.get(document=document)
+        assert snapshot.codec == "blob"
+        ydoc = load_ydoc(document.id)
+        assert str(ydoc.get_text("shared")) == str(client_doc.get_text("shared"))
+
+    def test_identical_payloads_deduplicated(self, user, document, blob_store):
+        payload = edit(YDoc(), "x" * 2000)
+        for _ in range(2):
+            DocumentUpdate.objects.create(document=document, author=user, payload=payload)
+
+        assert len(set(DocumentUpdate.objects.values_list("update_data", flat=True))) == 1
+        assert len(list(blob_store.keys())) == 1
+
+    def test_compress_command_moves_large_rows(self, user, document, blob_store):
+        client_doc = YDoc()
+        DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, "y" * 2000)
+        )
+        call_command("compress_document_updates", stdout=StringIO())
+
+        assert DocumentUpdate.objects.get().codec == "blob"
+        assert str(load_ydoc(document.id).get_text("shared")) == "y" * 2000
+
+    def test_compress_command_blob_codec(self, user, document, blob_store):
+        client_doc = YDoc()
+        DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, "small")
+        )
+        call_command("compress_document_updates", "--codec", "blob", stdout=StringIO())
+
+        assert DocumentUpdate.objects.get().codec == "blob"
+        assert str(load_ydoc(document.id).get_text("shared")) == "small"
+
+    def test_collect_command(self, user, document, blob_store):
+        kept = DocumentUpdate.objects.create(
+            document=document, author=user, payload=edit(YDoc(), "a" * 2000)
+        )
+        orphan = blob_store.put(b"z" * 2000)
+
+        out = StringIO()
+        call_command("collect_document_blobs", stdout=out)
+        assert "Deleted 0" in out.getvalue()
+
+        call_command("collect_document_blobs", "--min-age", "-1", stdout=out)
+        assert "Deleted 1" in out.getvalue()
+        assert not blob_store.path(orphan).exists()
+        assert bytes(kept.payload) == bytes(
+            DocumentUpdate.objects.get(id=kept.id).payload
+        )
+
+    def test_collect_command_keeps_checkpoints(self, user, document, blob_store, settings):
+        settings.DOCUMENT_CHECKPOINT_INTERVAL = 2
+        client_doc = YDoc()
+        texts = [os.urandom(600).hex() for _ in range(3)]
+        compacted = [
+            process_session(
+                [
+                    DocumentUpdate.objects.create(
+                        document=document, author=user, payload=edit(client_doc, text)
+                    )
+                ]
+            )
+            for text in texts
+        ]
+        assert DocumentCheckpoint.objects.get().codec == "blob"
+
+        call_command("collect_document_blobs", "--min-age", "-1", stdout=StringIO())
+
+        ydoc = load_ydoc(document.id, pending=False, before=compacted[2].created_at)
+        assert str(ydoc.get_text("shared")) == "".join(texts[:2])
@@ -0,0 +1,219 @@
+import threading
+import pytest
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from y_py import YDoc, apply_update, encode_state_vector
+from document import tasks
+from document.models import (
+    Document,
+    DocumentCompactionClaim,
+    DocumentSnapshot,
+    DocumentUpdate,
+)
+from document.snapshots import load_ydoc
+from iransanad.celery import app
+from document.tasks import (
+    compact_document,
+    compact_document_updates,
+    claim_compaction,
+    compact_pending_document,
+    summarize_compaction,
+)
+from yjs_helpers import edit
+
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def eager_celery(monkeypatch):
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+
+
+@pytest.fixture
+def document(user):
+    return Document.objects.create(title="Test Doc", owner=user)
+
+
+def make_updates(document, user, client_doc, sessions):
+    """
+    Creates raw updates for ``sessions`` (lists of texts), an hour apart.
+    """
+    start = timezone.now() - timedelta(days=1)
+    for index, texts in enumerate(sessions):
+        for offset, text in enumerate(texts):
+            update = DocumentUpdate.objects.create(
+                document=document, author=user, update_data=edit(client_doc, text)
+            )
+            DocumentUpdate.objects.filter(id=update.id).update(
+                created_at=start + timedelta(hours=index, seconds=offset)
+            )
+    return list(
+        DocumentUpdate.objects.filter(document=document, is_compacted=False).order_by(
+            "created_at"
+        )
+    )
+
+
+@pytest.mark.django_db
+class TestCompaction:
+    def test_sessions_applied_on_one_base_state(self, user, document, monkeypatch):
+        client_doc = YDoc()
+        updates = make_updates(
+            document, user, client_doc, [["a", "b"], ["c"], ["d", "e", "f"]]
+        )
+        loads = []
+        get_ydoc = tasks.get_ydoc
+        monkeypatch.setattr(
+            tasks, "get_ydoc", lambda document_id: loads.append(document_id) or get_ydoc(document_id)
+        )
+
+        assert compact_document(document.id, updates) == 3
+
+        assert loads == [document.id]
+        compacted = DocumentUpdate.objects.filter(document=document, is_compacted=True)
+        assert compacted.count() == 3
+        assert not DocumentUpdate.objects.filter(is_compacted=False).exists()
+        snapshot = DocumentSnapshot.objects.get(document=document)
+        assert snapshot.last_update_id == compacted.order_by("-created_at").first().id
+        assert bytes(snapshot.state_vector) == encode_state_vector(client_doc)
+        assert str(load_ydoc(document.id).get_text("shared")) == "abcdef"
+        assert all(compacted.values_list("title", flat=True))
+
+    def test_session_compacted_elsewhere_reloads_state(self, user, document):
+        client_doc = YDoc()
+        updates = make_updates(document, user, client_doc, [["a", "b", "c"], ["d"]])
+        # Another compactor cut the first session short
+        other = tasks.process_session(updates[:2])
+
+        assert compact_document(document.id, updates) == 0
+        assert DocumentSnapshot.objects.get().last_update_id == other.id
+        assert compact_document(document.id, tasks.iter_raw_updates(document.id)) == 2
+
+        # Every update is in the compacted history, not only in the snapshot
+        history = YDoc()
+        for update in DocumentUpdate.objects.filter(document=document).order_by("created_at"):
+            apply_update(history, bytes(update.payload))
+        assert str(history.get_text("shared")) == "abcd"
+
+    def test_compact_document_updates_continues_from_snapshot(
+        self, user, document, eager_celery
+    ):
+        client_doc = YDoc()
+        make_updates(document, user, client_doc, [["one "]])
+        compact_document_updates()
+        make_updates(document, user, client_doc, [["two"]])
+
+        compact_document_updates()
+
+        assert DocumentUpdate.objects.filter(document=document).count() == 2
+        assert str(load_ydoc(document.id).get_text("shared")) == "one two"
+
+    def test_driver_streams_payloads_in_chunks(self, user, document, settings):
+        settings.DOCUMENT_COMPACTION_CHUNK_SIZE = 2
+        client_doc = YDoc()
+        make_updates(document, user, client_doc, [["a", "b", "c", "d", "e"], ["f"]])
+
+        with CaptureQueriesContext(connection) as queries:
+            result = compact_pending_document(document.id)
+
+        assert result["sessions"] == 2
+        assert result["peak_rss_kb"] > 0
+        assert str(load_ydoc(document.id).get_text("shared")) == "abcdef"
+        payload_reads = [
+            q["sql"]
+            for q in queries.captured_queries
+            if q["sql"].startswith("SELECT")
+            and '"document_documentupdate"."update_data"' in q["sql"]
+            and "is_compacted" not in q["sql"]  # The base state
+        ]
+        # Three chunks for the first session, one for the second, and the
+        # deletes never load payloads
+        assert len(payload_reads) == 4
+        assert all(" IN (" in sql for sql in payload_reads)
+
+    def test_dispatcher_fans_out_per_document_once(self, user, eager_celery, monkeypatch):
+        documents = [
+            Document.objects.create(title=f"Doc {i}", owner=user) for i in range(3)
+        ]
+        for document in documents:
+            make_updates(document, user, YDoc(), [["text"]])
+        # Still being compacted by an earlier run
+        claim_compaction(documents[0].id)
+        summaries = []
+        summarize = summarize_compaction.run
+        monkeypatch.setattr(
+            summarize_compaction, "run", lambda results: summaries.append(summarize(results))
+        )
+
+        assert compact_document_updates() == {"dispatched": 2, "skipped": 1}
+
+        assert summaries == [
+            {"documents": 2, "sessions": 2, "failed": [], "peak_rss_kb": summaries[0]["peak_rss_kb"]}
+        ]
+        assert DocumentUpdate.objects.filter(document=documents[0], is_compacted=False).exists()
+        assert not DocumentUpdate.objects.filter(
+            document__in=documents[1:], is_compacted=False
+        ).exists()
+        claims = DocumentCompactionClaim.objects.values_list("document_id", flat=True)
+        assert list(claims) == [documents[0].id]
+
+    def test_abandoned_claim_taken_over(self, document, settings):
+        assert claim_compaction(document.id)
+        assert not claim_compaction(document.id)
+
+        settings.DOCUMENT_COMPACTION_CLAIM_TIMEOUT = timedelta(0)
+        assert claim_compaction(document.id)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentCompaction:
+    def test_two_compactors_commit_each_session_once(self, user, document, monkeypatch):
+        client_doc = YDoc()
+        make_updates(document, user, client_doc, [["a", "b"], ["c"], ["d", "e"]])
+        # Both compactors read the same sessions before either commits
+        barrier = threading.Barrier(2, timeout=10)
+        get_ydoc = tasks.get_ydoc
+
+        def racing_get_ydoc(document_id):
+            ydoc = get_ydoc(document_id)
+            barrier.wait()
+            return ydoc
+
+        monkeypatch.setattr(tasks, "get_ydoc", racing_get_ydoc)
+        results, errors = [], []
+        # Payloads are read up front: an in-memory SQLite test database has no
+        # busy timeout for reads overlapping the other thread's commit
+        updates = list(
+            DocumentUpdate.objects.filter(document=document).order_by("created_at")
+        )
+
+        def compactor():
+            try:
+                results.append(compact_document(document.id, list(updates)))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=compactor) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        # The compactor finding a session done stops for that run
+        assert sorted(results) == [0, 3]
+        compacted = DocumentUpdate.objects.filter(document=document, is_compacted=True)
+        assert compacted.count() == 3
+        assert not DocumentUpdate.objects.filter(is_compacted=False).exists()
+        assert str(load_ydoc(document.id).get_text("shared")) == "abcde"
@@ -0,0 +1,112 @@
+import pytest
+from django.contrib.auth import get_user_model
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from model_bakery import baker
+from rest_framework_simplejwt.tokens import AccessToken
+from y_py import YDoc, encode_state_vector, apply_update
+from ypy_websocket.yutils import (
+    YSyncMessageType,
+    create_sync_step1_message,
+    create_update_message,
+    read_message,
+)
+from iransanad.asgi import application
+from document.awareness import decode_awareness_update, encode_awareness_update
+from document.models import Document, DocumentUpdate
+from document.rooms import room_registry
+from yjs_helpers import edit
+
+User = get_user_model()
+
+
+async def connect(doc, user):
+    token = str(await database_sync_to_async(AccessToken.for_user)(user))
+    communicator = WebsocketCommunicator(
+        application, f"/ws/docs/{doc.doc_uuid}/?Authorization={token}"
+    )
+    connected, _ = await communicator.connect()
+    assert connected
+    await communicator.receive_from()  # Init SYNC message
+    return communicator
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+class TestDocumentSync:
+    async def test_sync_step1_reply_goes_to_requester_only(self):
+        user1, user2 = await database_sync_to_async(baker.make)(User, _quantity=2)
+        doc = await Document.objects.acreate(owner=user1)
+        await DocumentUpdate.objects.acreate(
+            document=doc, update_data=edit(YDoc(), "stored text")
+        )
+        communicator1 = await connect(doc, user1)
+        communicator2 = await connect(doc, user2)
+
+        await communicator2.send_to(
+            bytes_data=create_sync_step1_message(encode_state_vector(YDoc()))
+        )
+        reply = await communicator2.receive_from()
+
+        assert reply[1] == YSyncMessageType.SYNC_STEP2
+        ydoc = YDoc()
+        apply_update(ydoc, read_message(reply[2:]))
+        assert str(ydoc.get_text("shared")) == "stored text"
+        assert await communicator1.receive_nothing()
+
+        await communicator1.disconnect()
+        await communicator2.disconnect()
+
+    async def test_update_fanned_out_to_peers_except_sender(self):
+        user1, user2 = await database_sync_to_async(baker.make)(User, _quantity=2)
+        doc = await Document.objects.acreate(owner=user1)
+        communicator1 = await connect(doc, user1)
+        communicator2 = await connect(doc, user2)
+
+        message = create_update_message(edit(YDoc(), "typed"))
+        await communicator1.send_to(bytes_data=message)
+
+        assert await communicator2.receive_from() == message
+        assert await communicator1.receive_nothing()
+
+        await communicator1.disconnect()
+        await communicator2.disconnect()
+        assert await DocumentUpdate.objects.filter(document=doc).acount() == 1
+
+    async def test_awareness_kept_in_memory_and_sent_to_joiners(self):
+        user1, user2 = await database_sync_to_async(baker.make)(User, _quantity=2)
+        doc = await Document.objects.acreate(owner=user1)
+        communicator1 = await connect(doc, user1)
+
+        await communicator1.send_to(
+            bytes_data=encode_awareness_update([(11, 1, '{"cursor":3}')])
+        )
+        communicator2 = await connect(doc, user2)
+        snapshot = await communicator2.receive_from()
+
+        assert decode_awareness_update(snapshot) == [(11, 1, '{"cursor":3}')]
+        assert await communicator1.receive_nothing()
+
+        await communicator1.disconnect()
+        removal = await communicator2.receive_from()
+        assert decode_awareness_update(removal) == [(11, 2, None)]
+        await communicator2.disconnect()
+        assert await DocumentUpdate.objects.filter(document=doc).acount() == 0
+
+    async def test_failed_flush_still_releases_room(self, monkeypatch):
+        user = await database_sync_to_async(baker.make)(User)
+        doc = await Document.objects.acreate(owner=user)
+        communicator = await connect(doc, user)
+        room = room_registry.get(doc.doc_uuid)
+        await communicator.send_to(bytes_data=create_update_message(edit(YDoc(), "a")))
+        await communicator.receive_nothing()
+
+        def bulk_create(rows):
+            raise RuntimeError("database is down")
+
+        monkeypatch.setattr(DocumentUpdate.objects, "bulk_create", bulk_create)
+        with pytest.raises(RuntimeError):
+            await communicator.disconnect()
+
+        assert doc.doc_uuid not in room_registry
+        assert not room.connections
@@ -0,0 +1,145 @@
+import pytest
+from datetime import datetime, timezone as dt_timezone
+from django.contrib.auth import get_user_model
+from y_py import YDoc, apply_update
+from document.merging import merge_document_updates
+from document.models import Document, DocumentCheckpoint, DocumentUpdate
+from document.snapshots import create_checkpoint, load_ydoc
+from document.tasks import merge_compacted_updates
+from yjs_helpers import edit
+
+
+User = get_user_model()
+
+NOW = datetime(2025, 6, 20, 12, tzinfo=dt_timezone.utc)
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def document(user):
+    return Document.objects.create(title="Test Doc", owner=user)
+
+
+def make_compacted(document, user, client_doc, text, created_at, title=None):
+    update = DocumentUpdate.objects.create(
+        document=document,
+        update_data=edit(client_doc, text),
+        is_compacted=True,
+        processed=True,
+        title=title,
+        is_named=title is not None,
+    )
+    update.authors.set([user])
+    DocumentUpdate.objects.filter(id=update.id).update(created_at=created_at)
+    return update
+
+
+@pytest.mark.django_db
+class TestTieredMerging:
+    def test_history_folds_into_tiers(self, user, document):
+        client_doc = YDoc()
+        history = [
+            ("a", datetime(2025, 4, 10, 12)),
+            ("b", datetime(2025, 4, 12, 12)),
+            ("named ", datetime(2025, 5, 1, 12)),
+            ("c", datetime(2025, 6, 10, 12)),
+            ("d", datetime(2025, 6, 11, 12)),
+            ("e", datetime(2025, 6, 18, 10)),
+            ("f", datetime(2025, 6, 18, 14)),
+            ("g", datetime(2025, 6, 20, 11)),
+        ]
+        for text, created_at in history:
+            make_compacted(
+                document,
+                user,
+                client_doc,
+                text,
+                created_at.replace(tzinfo=dt_timezone.utc),
+                title="Named" if text == "named " else None,
+            )
+
+        stats = merge_document_updates(document.id, now=NOW)
+
+        assert stats["rows_before"] == 6
+        assert stats["rows_after"] == 3
+        assert stats["bytes_before"] > stats["bytes_after"]
+        rows = DocumentUpdate.objects.filter(document=document).order_by("created_at")
+        assert [(u.tier, u.is_named) for u in rows] == [
+            (DocumentUpdate.MONTHLY, False),
+            (DocumentUpdate.SESSION, True),
+            (DocumentUpdate.WEEKLY, False),
+            (DocumentUpdate.DAILY, False),
+            (DocumentUpdate.SESSION, False),
+        ]
+        assert rows[1].title == "Named"
+        assert rows[3].title == "18 June 2025, 14:00"
+        assert list(rows[0].authors.all()) == [user]
+        assert str(load_ydoc(document.id).get_text("shared")) == "abnamed cdefg"
+        daily = rows[3]
+        before = load_ydoc(document.id, pending=False, before=daily.created_at)
+        assert str(before.get_text("shared")) == "abnamed cd"
+
+    def test_merging_again_changes_nothing(self, user, document):
+        client_doc = YDoc()
+        for day in (2, 3):
+            make_compacted(
+                document, user, client_doc, str(day),
+                datetime(2025, 6, day, 12, tzinfo=dt_timezone.utc),
+            )
+        merge_document_updates(document.id, now=NOW)
+
+        stats = merge_document_updates(document.id, now=NOW)
+
+        assert stats["rows_before"] == 0
+        merged = DocumentUpdate.objects.get(document=document)
+        assert (merged.chars_inserted, merged.chars_deleted) == (2, 0)
+        assert merged.payload_size == len(merged.payload)
+
+    def test_automatic_titles_do_not_keep_versions(self, user, document):
+        client_doc = YDoc()
+        for hour in (8, 14):
+            update = make_compacted(
+                document, user, client_doc, str(hour),
+                datetime(2025, 6, 18, hour, tzinfo=dt_timezone.utc),
+            )
+            DocumentUpdate.objects.filter(id=update.id).update(
+                title=f"18 June 2025, {hour:02}:00"
+            )
+
+        stats = merge_document_updates(document.id, now=NOW)
+
+        assert (stats["rows_before"], stats["rows_after"]) == (2, 1)
+
+    def test_named_versions_not_candidates(self, user, document):
+        make_compacted(
+            document, user, YDoc(), "named",
+            datetime(2025, 6, 2, 12, tzinfo=dt_timezone.utc), title="Named",
+        )
+
+        assert merge_compacted_updates()["documents"] == 0
+
+    def test_checkpoints_inside_merged_bucket_dropped(self, user, document):
+        client_doc = YDoc()
+        ydoc = YDoc()
+        updates = []
+        for hour, text in [(8, "a"), (10, "b"), (14, "c")]:
+            update = make_compacted(
+                document, user, client_doc, text,
+                datetime(2025, 6, 18, hour, tzinfo=dt_timezone.utc),
+            )
+            update.refresh_from_db()
+            apply_update(ydoc, bytes(update.update_data))
+            create_checkpoint(document.id, ydoc, update)
+            updates.append(update)
+
+        merge_document_updates(document.id, now=NOW)
+
+        merged = DocumentUpdate.objects.get(document=document)
+        checkpoint = DocumentCheckpoint.objects.get(document=document)
+        assert checkpoint.last_update_id == merged.id
+        before = load_ydoc(document.id, pending=False, before=merged.created_at)
+        assert str(before.get_text("shared")) == ""
@@ -0,0 +1,106 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from datetime import timedelta
+from y_py import encode_state_as_update, encode_state_vector
+from ypy_websocket.yutils import create_update_message
+from core.layers import ShardedChannelLayer, UnixSocketBroker
+from document.persistence import UpdateBuffer
+from document.rooms import DocumentRoom
+
+DOC_UUID = "9b2f6f0e-5d7c-4b8e-9a1d-3f2c1b0a9e8d"
+TIMEOUT = 10
+
+
+def run_broker(path):
+    asyncio.run(UnixSocketBroker(path).serve_forever())
+
+
+async def no_updates():
+    return []
+
+
+async def wait_for(predicate):
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+def get_text(room):
+    return str(room.ydoc.get_text("content"))
+
+
+async def edit(room, text):
+    ydoc = room.ydoc
+    state_vector = encode_state_vector(ydoc)
+    with ydoc.begin_transaction() as txn:
+        shared = ydoc.get_text("content")
+        shared.extend(txn, text)
+    update = encode_state_as_update(ydoc, state_vector)
+    room.buffer.add(update, None)
+    await room.publish({"type": "yjs_update", "bytes": create_update_message(update)})
+
+
+async def worker(path, name, wait_before_join, signal_after_edit, expected, results):
+    layer = ShardedChannelLayer(shards=[f"unix://{path}"])
+    room = DocumentRoom(DOC_UUID, 1, layer)
+    # Keep edits in memory, the workers have no database
+    room.buffer = UpdateBuffer(room, window=timedelta(hours=1))
+    await asyncio.get_running_loop().run_in_executor(None, wait_before_join.wait, TIMEOUT)
+    await room.load(no_updates)
+    if name == "second":
+        # Edits of the first worker are not in the database, only in its room
+        await wait_for(lambda: "alpha" in get_text(room))
+    await edit(room, f" {name}:{'alpha' if name == 'first' else 'beta'}")
+    signal_after_edit.set()
+    await wait_for(lambda: all(word in get_text(room) for word in expected))
+    results.put((name, get_text(room)))
+    await room.stop_relay()
+    await layer.close()
+
+
+def run_worker(*args):
+    asyncio.run(worker(*args))
+
+
+def test_rooms_in_two_workers_converge(tmp_path):
+    context = multiprocessing.get_context("fork")
+    path = str(tmp_path / "broker.sock")
+    broker = context.Process(target=run_broker, args=(path,), daemon=True)
+    broker.start()
+    deadline = time.monotonic() + TIMEOUT
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    start, first_edited, second_edited = (context.Event() for _ in range(3))
+    results = context.Queue()
+    expected = ("alpha", "beta")
+    workers = [
+        context.Process(
+            target=run_worker,
+            args=(path, "first", start, first_edited, expected, results),
+        ),
+        context.Process(
+            target=run_worker,
+            args=(path, "second", first_edited, second_edited, expected, results),
+        ),
+    ]
+    try:
+        for process in workers:
+            process.start()
+        start.set()
+        texts = dict(results.get(timeout=TIMEOUT) for _ in workers)
+        for process in workers:
+            process.join(TIMEOUT)
+    finally:
+        for process in (*workers, broker):
+            if process.is_alive():
+                process.terminate()
+
+    assert texts["first"] == texts["second"]
+    assert "first:alpha" in texts["first"]
+    assert "second:beta" in texts["first"]
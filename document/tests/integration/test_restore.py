@@ -0,0 +1,138 @@
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from y_py import YDoc
+from ypy_websocket.yutils import create_update_message
+from document.models import Document, DocumentUpdate
+from document.restore import get_text_edits, restore_content
+from document.rooms import get_group_name
+from document.snapshots import load_ydoc
+from document.tasks import process_session
+from yjs_helpers import edit
+
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def document(user):
+    return Document.objects.create(title="Test Doc", owner=user)
+
+
+@pytest.fixture
+def versions(user, document):
+    client_doc = YDoc()
+    versions = []
+    for text in ["hello\n", "world\n", "and more " * 50]:
+        update = DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, text)
+        )
+        versions.append(process_session([update]))
+    return versions
+
+
+def restore_url(document, version):
+    return reverse(
+        "document-update-restore",
+        kwargs={"doc_uuid": str(document.doc_uuid), "pk": version.id},
+    )
+
+
+class TestRestoreContent:
+    def test_text_edits(self):
+        current, target = "one\ntwo\nthree\n", "one\n2\nthree\nfour\n"
+        edits = get_text_edits(current, target)
+
+        for start, end, replacement in reversed(edits):
+            current = current[:start] + replacement + current[end:]
+        assert current == target
+
+    def test_text_root(self):
+        ydoc, target = YDoc(), YDoc()
+        for doc, text in [(ydoc, "keep this, drop that"), (target, "keep this!")]:
+            with doc.begin_transaction() as txn:
+                doc.get_text("shared").insert(txn, 0, text)
+
+        restore_content(ydoc, target)
+        assert str(ydoc.get_text("shared")) == "keep this!"
+
+    @pytest.mark.parametrize(
+        "current,target",
+        [
+            ("سلام دنیا\nخداحافظ", "سلام دنیای زیبا\nخداحافظ"),
+            ("سلام\nدنیا", "سلام\nدنیا!"),
+            ("یک\nدو\nسه", "یک\nسه"),
+            ("hi 😀 there\n👋", "hi 🎉 there\nبای 👋"),
+        ],
+    )
+    def test_text_root_non_ascii(self, current, target):
+        ydoc, target_doc = YDoc(), YDoc()
+        for doc, text in [(ydoc, current), (target_doc, target)]:
+            with doc.begin_transaction() as txn:
+                doc.get_text("shared").insert(txn, 0, text)
+
+        restore_content(ydoc, target_doc)
+        assert str(ydoc.get_text("shared")) == target
+
+    def test_xml_root(self, settings):
+        settings.DOCUMENT_TEXT_ROOT = "root"
+        settings.DOCUMENT_TEXT_ROOT_TYPE = "xml"
+        ydoc, target = YDoc(), YDoc()
+        for doc, texts in [(ydoc, ["a", "b", "c"]), (target, ["a", "x", "c"])]:
+            root = doc.get_xml_element("root")
+            with doc.begin_transaction() as txn:
+                for text in texts:
+                    paragraph = root.push_xml_element(txn, "paragraph")
+                    paragraph.set_attribute(txn, "align", "left")
+                    paragraph.push_xml_text(txn).push(txn, text)
+
+        restore_content(ydoc, target)
+        assert str(ydoc.get_xml_element("root")) == str(target.get_xml_element("root"))
+
+
+@pytest.mark.django_db
+class TestRestoreEndpoint:
+    def test_restore(self, api_client, user, document, versions):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(get_group_name(document.doc_uuid), channel)
+        api_client.force_authenticate(user=user)
+
+        response = api_client.post(restore_url(document, versions[1]))
+
+        assert response.status_code == 201
+        restored = DocumentUpdate.objects.get(id=response.data["update"])
+        assert (restored.is_compacted, restored.author) == (False, user)
+        assert str(load_ydoc(document.id).get_text("shared")) == "hello\nworld\n"
+        # Deletes the last version's text without copying the document
+        assert response.data["size"] < len(versions[2].payload)
+        event = async_to_sync(channel_layer.receive)(channel)
+        assert event["type"] == "yjs_update"
+        assert event["bytes"] == create_update_message(bytes(restored.payload))
+
+    def test_restore_current_content(self, api_client, user, document, versions):
+        api_client.force_authenticate(user=user)
+        response = api_client.post(restore_url(document, versions[2]))
+
+        assert response.status_code == 200
+        assert response.data["update"] is None
+
+    def test_restore_needs_write_access(self, api_client, document, versions):
+        reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="testpass"
+        )
+        document.default_access_level = 1
+        document.save()
+        api_client.force_authenticate(user=reader)
+
+        response = api_client.post(restore_url(document, versions[0]))
+
+        assert response.status_code == 403
+        assert DocumentUpdate.objects.filter(is_compacted=False).count() == 0
@@ -0,0 +1,134 @@
+import pytest
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+from y_py import YDoc, apply_update, encode_state_vector
+from document.models import Document, DocumentCheckpoint, DocumentSnapshot, DocumentUpdate
+from document.snapshots import get_document_payloads, load_ydoc
+from document.tasks import process_session
+from yjs_helpers import edit
+
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def document(user):
+    return Document.objects.create(title="Test Doc", owner=user)
+
+
+def make_session(document, user, client_doc, *texts):
+    session = [
+        DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, text)
+        )
+        for text in texts
+    ]
+    return list(
+        DocumentUpdate.objects.filter(id__in=[u.id for u in session]).order_by(
+            "created_at"
+        )
+    )
+
+
+@pytest.mark.django_db
+class TestDocumentSnapshot:
+    def test_process_session_saves_snapshot(self, user, document):
+        client_doc = YDoc()
+        process_session(make_session(document, user, client_doc, "Hello", " world"))
+
+        snapshot = DocumentSnapshot.objects.get(document=document)
+        compacted = DocumentUpdate.objects.get(document=document, is_compacted=True)
+        assert snapshot.last_update_id == compacted.id
+        assert bytes(snapshot.state_vector) == encode_state_vector(client_doc)
+
+        ydoc = YDoc()
+        apply_update(ydoc, bytes(snapshot.state))
+        assert str(ydoc.get_text("shared")) == "Hello world"
+
+    def test_cold_load_reads_snapshot_and_tail_only(self, user, document):
+        client_doc = YDoc()
+        for text in ["one ", "two ", "three "]:
+            process_session(make_session(document, user, client_doc, text))
+        DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, "four")
+        )
+
+        payloads = get_document_payloads(document.id)
+
+        # snapshot + one pending update, none of the compacted history
+        assert len(payloads) == 2
+        assert str(load_ydoc(document.id).get_text("shared")) == "one two three four"
+        assert str(load_ydoc(document.id, pending=False).get_text("shared")) == (
+            "one two three "
+        )
+
+    def test_before_snapshot_falls_back_to_history(self, user, document):
+        client_doc = YDoc()
+        process_session(make_session(document, user, client_doc, "first "))
+        first = DocumentUpdate.objects.get(document=document, is_compacted=True)
+        DocumentUpdate.objects.filter(id=first.id).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        process_session(make_session(document, user, client_doc, "second"))
+
+        ydoc = load_ydoc(document.id, pending=False, before=timezone.now())
+        assert str(ydoc.get_text("shared")) == "first second"
+        ydoc = load_ydoc(
+            document.id, pending=False, before=timezone.now() - timedelta(hours=1)
+        )
+        assert str(ydoc.get_text("shared")) == "first "
+
+
+@pytest.mark.django_db
+class TestDocumentCheckpoint:
+    def compact(self, document, user, texts):
+        client_doc = YDoc()
+        return [
+            process_session(make_session(document, user, client_doc, text))
+            for text in texts
+        ]
+
+    def test_checkpoint_every_interval(self, user, document, settings):
+        settings.DOCUMENT_CHECKPOINT_INTERVAL = 2
+        compacted = self.compact(document, user, ["a", "b", "c", "d", "e"])
+
+        checkpoints = DocumentCheckpoint.objects.filter(document=document).order_by(
+            "last_update_at"
+        )
+        assert [c.last_update_id for c in checkpoints] == [compacted[1].id, compacted[3].id]
+        ydoc = YDoc()
+        apply_update(ydoc, bytes(checkpoints[0].state))
+        assert str(ydoc.get_text("shared")) == "ab"
+
+    def test_before_reads_nearest_checkpoint(self, user, document, settings):
+        settings.DOCUMENT_CHECKPOINT_INTERVAL = 2
+        compacted = self.compact(document, user, ["a", "b", "c", "d", "e"])
+
+        payloads = get_document_payloads(
+            document.id, pending=False, before=compacted[3].created_at
+        )
+        # checkpoint after "b" and the update of "c"
+        assert len(payloads) == 2
+        for i, expected in enumerate(["", "a", "ab", "abc", "abcd"]):
+            ydoc = load_ydoc(document.id, pending=False, before=compacted[i].created_at)
+            assert str(ydoc.get_text("shared")) == expected
+
+    def test_build_command(self, user, document, settings):
+        settings.DOCUMENT_CHECKPOINT_INTERVAL = 100
+        compacted = self.compact(document, user, ["a", "b", "c", "d", "e"])
+        assert not DocumentCheckpoint.objects.exists()
+
+        call_command("build_document_checkpoints", "--interval", "2", stdout=StringIO())
+
+        checkpoints = DocumentCheckpoint.objects.order_by("last_update_at")
+        assert [c.last_update_id for c in checkpoints] == [compacted[1].id, compacted[3].id]
+        ydoc = load_ydoc(document.id, pending=False, before=compacted[4].created_at)
+        assert str(ydoc.get_text("shared")) == "abcd"
@@ -0,0 +1,120 @@
+import pytest
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from y_py import YDoc, apply_update
+from document.models import Document, DocumentUpdate
+from document.persistence import UpdateBuffer
+from document.rooms import DocumentRoom
+from document.snapshots import load_ydoc
+from yjs_helpers import edit
+
+
+User = get_user_model()
+
+
+async def make_room(**buffer_options):
+    user = await User.objects.acreate(username="testuser", email="test@example.com")
+    document = await Document.objects.acreate(owner=user)
+    room = DocumentRoom(document.doc_uuid, document.id)
+    room.buffer = UpdateBuffer(room, **buffer_options)
+
+    async def fetch_updates():
+        return []
+
+    await room.load(fetch_updates)
+    return room, user
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+class TestUpdateBuffer:
+    async def test_single_author_burst_is_merged(self):
+        room, user = await make_room(window=timedelta(seconds=60))
+        client_doc = YDoc()
+        for text in ["Hel", "lo ", "world"]:
+            room.apply_update(edit(client_doc, text), user.id)
+
+        assert await DocumentUpdate.objects.acount() == 0
+        assert await room.buffer.flush() == 3
+
+        rows = [u async for u in DocumentUpdate.objects.all()]
+        assert len(rows) == 1
+        assert rows[0].author_id == user.id
+        text = await database_sync_to_async(
+            lambda: str(load_ydoc(room.document_id).get_text("shared"))
+        )()
+        assert text == "Hello world"
+
+    async def test_remote_update_not_merged_into_batch(self):
+        room, user = await make_room(window=timedelta(seconds=60))
+        client_doc, remote_doc = YDoc(), YDoc()
+        room.apply_update(edit(client_doc, "a"), user.id)
+        await room.receive_remote(
+            {"type": "room.sync", "update": edit(remote_doc, "remote")}
+        )
+        room.apply_update(edit(client_doc, "b"), user.id)
+
+        assert await room.buffer.flush() == 2
+
+        rows = [u async for u in DocumentUpdate.objects.order_by("id")]
+        assert len(rows) == 2
+        # The remote edit is persisted by the process it came from
+        ydoc = YDoc()
+        for row in rows:
+            apply_update(ydoc, bytes(row.payload))
+        assert str(ydoc.get_text("shared")) == "ab"
+
+    async def test_remote_update_during_failed_write_not_merged(self, monkeypatch):
+        room, user = await make_room(window=timedelta(seconds=60))
+        client_doc = YDoc()
+        room.apply_update(edit(client_doc, "a"), user.id)
+        room.apply_update(edit(client_doc, "b"), user.id)
+
+        def bulk_create(rows):
+            async_to_sync(room.receive_remote)(
+                {"type": "room.sync", "update": edit(YDoc(), "remote")}
+            )
+            raise RuntimeError("database is down")
+
+        monkeypatch.setattr(DocumentUpdate.objects, "bulk_create", bulk_create)
+        with pytest.raises(RuntimeError):
+            await room.buffer.flush()
+        monkeypatch.undo()
+        assert await room.buffer.flush() == 2
+
+        ydoc = YDoc()
+        async for row in DocumentUpdate.objects.order_by("id"):
+            apply_update(ydoc, bytes(row.payload))
+        assert str(ydoc.get_text("shared")) == "ab"
+
+    async def test_multiple_authors_are_stored_separately(self):
+        room, user = await make_room(window=timedelta(seconds=60))
+        other = await User.objects.acreate(username="other", email="other@example.com")
+        doc1, doc2 = YDoc(), YDoc()
+        room.apply_update(edit(doc1, "a"), user.id)
+        room.apply_update(edit(doc2, "b"), other.id)
+
+        await room.buffer.flush()
+
+        assert await DocumentUpdate.objects.acount() == 2
+
+    async def test_size_trigger_flushes_without_waiting(self):
+        room, user = await make_room(max_updates=2, window=timedelta(seconds=60))
+        client_doc = YDoc()
+        room.apply_update(edit(client_doc, "a"), user.id)
+        room.apply_update(edit(client_doc, "b"), user.id)
+        assert len(room.buffer) == 0
+
+        await room.close()
+        assert await DocumentUpdate.objects.acount() == 1
+
+    async def test_close_flushes_pending_updates(self):
+        room, user = await make_room(window=timedelta(seconds=60))
+        room.apply_update(edit(YDoc(), "pending"), user.id)
+
+        await room.close()
+
+        assert len(room.buffer) == 0
+        assert await DocumentUpdate.objects.acount() == 1
@@ -0,0 +1,175 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
+from document import diffs
+from document.models import Document, DocumentUpdate
+from document.tasks import process_session
+from yjs_helpers import edit
+
+
+User = get_user_model()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def document(user):
+    return Document.objects.create(title="Test Doc", owner=user)
+
+
+@pytest.fixture
+def versions(user, document):
+    client_doc = YDoc()
+    versions = []
+    for text, index in [("one\ntwo\n", None), ("three\n", None), ("zero\n", 0)]:
+        update = DocumentUpdate.objects.create(
+            document=document, author=user, update_data=edit(client_doc, text, index)
+        )
+        versions.append(process_session([update]))
+    return versions
+
+
+def diff_url(document, version, other):
+    return reverse(
+        "document-update-diff",
+        kwargs={"doc_uuid": str(document.doc_uuid), "pk": version.id, "other": other.id},
+    )
+
+
+class TestDiffLines:
+    def test_hunks(self):
+        diff = diffs.diff_lines(["a", "b", "c"], ["a", "x", "c", "d"])
+
+        assert diff["stats"] == {"removed": 1, "added": 2}
+        assert diff["hunks"] == [
+            {"a": 1, "b": 1, "removed": ["b"], "added": ["x"]},
+            {"a": 3, "b": 3, "removed": [], "added": ["d"]},
+        ]
+
+    def test_same_text(self):
+        assert diffs.diff_lines(["a"], ["a"])["hunks"] == []
+
+    def test_xml_root(self, settings):
+        settings.DOCUMENT_TEXT_ROOT = "root"
+        settings.DOCUMENT_TEXT_ROOT_TYPE = "xml"
+        ydoc = YDoc()
+        with ydoc.begin_transaction() as txn:
+            root = ydoc.get_xml_element("root")
+            for text in ["first", "second"]:
+                root.push_xml_element(txn, "paragraph").push_xml_text(txn).push(txn, text)
+
+        assert diffs.get_document_text(ydoc) == ["first", "second"]
+
+
+class TestChangeCounter:
+    def test_text_changes(self):
+        client_doc = YDoc()
+        base = edit(client_doc, "one\ntwo\nthree")
+        sv = encode_state_vector(client_doc)
+        with client_doc.begin_transaction() as txn:
+            ytext = client_doc.get_text("shared")
+            ytext.delete_range(txn, 0, 2)
+            ytext.insert(txn, len(str(ytext)), "!!")
+        change = encode_state_as_update(client_doc, sv)
+        ydoc = YDoc()
+        apply_update(ydoc, base)
+
+        with diffs.ChangeCounter(ydoc) as changes:
+            apply_update(ydoc, change)
+
+        assert changes.as_dict() == {
+            "chars_inserted": 2,
+            "chars_deleted": 2,
+            "blocks_touched": 2,
+        }
+
+    def test_non_ascii_text_changes(self):
+        client_doc = YDoc()
+        base = edit(client_doc, "سلام\nدنیا\nخداحافظ")
+        sv = encode_state_vector(client_doc)
+        with client_doc.begin_transaction() as txn:
+            # After "سلام\nدنیا", positions are UTF-8 bytes in y_py
+            client_doc.get_text("shared").insert(txn, len("سلام\nدنیا".encode()), "ی 😀")
+        change = encode_state_as_update(client_doc, sv)
+        ydoc = YDoc()
+        apply_update(ydoc, base)
+
+        with diffs.ChangeCounter(ydoc) as changes:
+            apply_update(ydoc, change)
+
+        assert str(ydoc.get_text("shared")) == "سلام\nدنیای 😀\nخداحافظ"
+        assert changes.as_dict() == {
+            "chars_inserted": 3,
+            "chars_deleted": 0,
+            "blocks_touched": 1,
+        }
+
+    def test_xml_changes(self, settings):
+        settings.DOCUMENT_TEXT_ROOT = "root"
+        settings.DOCUMENT_TEXT_ROOT_TYPE = "xml"
+        client_doc = YDoc()
+        root = client_doc.get_xml_element("root")
+        with client_doc.begin_transaction() as txn:
+            for text in ["first", "second", "third"]:
+                root.push_xml_element(txn, "paragraph").push_xml_text(txn).push(txn, text)
+        base = encode_state_as_update(client_doc)
+        sv = encode_state_vector(client_doc)
+        with client_doc.begin_transaction() as txn:
+            root.first_child.next_sibling.first_child.insert(txn, 0, "the ")
+            root.delete(txn, 2, 1)
+        change = encode_state_as_update(client_doc, sv)
+        ydoc = YDoc()
+        apply_update(ydoc, base)
+
+        with diffs.ChangeCounter(ydoc) as changes:
+            apply_update(ydoc, change)
+
+        assert changes.as_dict() == {
+            "chars_inserted": 4,
+            "chars_deleted": 5,
+            "blocks_touched": 2,
+        }
+
+
+@pytest.mark.django_db
+class TestVersionDiffEndpoint:
+    def test_diff(self, api_client, user, document, versions):
+        api_client.force_authenticate(user=user)
+        response = api_client.get(diff_url(document, versions[0], versions[2]))
+
+        assert response.status_code == 200
+        assert response.data["from"] == versions[0].id
+        assert response.data["to"] == versions[2].id
+        assert response.data["hunks"] == [
+            {"a": 0, "b": 0, "removed": [], "added": ["zero"]},
+            {"a": 2, "b": 3, "removed": [], "added": ["three"]},
+        ]
+
+    def test_diff_is_cached(self, api_client, user, document, versions, monkeypatch):
+        api_client.force_authenticate(user=user)
+        api_client.get(diff_url(document, versions[0], versions[1]))
+        monkeypatch.setattr(diffs, "get_version_text", None)
+
+        response = api_client.get(diff_url(document, versions[0], versions[1]))
+        assert response.status_code == 200
+        assert response.data["stats"] == {"removed": 0, "added": 1}
+
+    def test_other_document_version(self, api_client, user, document, versions):
+        other_document = Document.objects.create(title="Other", owner=user)
+        other = DocumentUpdate.objects.create(
+            document=other_document, update_data=b"", is_compacted=True, processed=True
+        )
+        api_client.force_authenticate(user=user)
+
+        response = api_client.get(diff_url(document, versions[0], other))
+        assert response.status_code == 404
@@ -0,0 +1,172 @@
+import pytest
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
+from document.models import Document, DocumentUpdate
+from document.tasks import process_session
+
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def document(user):
+    return Document.objects.create(title="Test Doc", owner=user)
+
+
+@pytest.fixture
+def history(user, document):
+    now = timezone.now()
+    updates = []
+    for i in range(5):
+        update = DocumentUpdate.objects.create(
+            document=document, update_data=b"x" * 100, is_compacted=True, processed=True
+        )
+        update.authors.set([user])
+        # Two rows share a timestamp, ordered by id
+        created_at = now - timedelta(minutes=min(i, 3))
+        DocumentUpdate.objects.filter(id=update.id).update(created_at=created_at)
+        updates.append(update)
+    DocumentUpdate.objects.create(document=document, update_data=b"raw")
+    return updates
+
+
+def list_url(document):
+    return reverse("document-update-list", kwargs={"doc_uuid": str(document.doc_uuid)})
+
+
+@pytest.mark.django_db
+class TestVersionHistoryList:
+    def test_pages_newest_first(self, api_client, user, document, history):
+        api_client.force_authenticate(user=user)
+
+        ids = []
+        url = list_url(document) + "?page_size=2"
+        while url:
+            response = api_client.get(url)
+            assert response.status_code == 200
+            assert len(response.data["results"]) <= 2
+            ids += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+
+        assert ids == [u.id for u in [history[0], history[1], history[2], history[4], history[3]]]
+
+    def test_list_never_loads_payloads(self, api_client, user, document, history):
+        api_client.force_authenticate(user=user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(list_url(document))
+
+        assert response.status_code == 200
+        assert response.data["next"] is None
+        assert response.data["results"][0]["authors"][0]["username"] == "testuser"
+        assert not any("update_data" in q["sql"] for q in queries.captured_queries)
+
+    def test_invalid_cursor(self, api_client, user, document, history):
+        api_client.force_authenticate(user=user)
+        response = api_client.get(list_url(document) + "?cursor=nope")
+        assert response.status_code == 404
+
+    def test_patch_title_names_version(self, api_client, user, document, history):
+        api_client.force_authenticate(user=user)
+        url = reverse(
+            "document-update-detail",
+            kwargs={"doc_uuid": str(document.doc_uuid), "pk": history[0].id},
+        )
+
+        response = api_client.patch(url, {"title": "Draft"}, format="json")
+        assert response.status_code == 200
+        history[0].refresh_from_db()
+        assert (history[0].title, history[0].is_named) == ("Draft", True)
+
+        api_client.patch(url, {"title": ""}, format="json")
+        history[0].refresh_from_db()
+        assert not history[0].is_named
+
+    def test_list_shows_change_stats(self, api_client, user, document):
+        client_doc = YDoc()
+        sv = encode_state_vector(client_doc)
+        with client_doc.begin_transaction() as txn:
+            client_doc.get_text("shared").insert(txn, 0, "hello\nworld")
+        update = DocumentUpdate.objects.create(
+            document=document,
+            author=user,
+            update_data=encode_state_as_update(client_doc, sv),
+        )
+        compacted = process_session([update])
+        api_client.force_authenticate(user=user)
+
+        response = api_client.get(list_url(document))
+
+        row = response.data["results"][0]
+        assert row["chars_inserted"] == 11
+        assert row["chars_deleted"] == 0
+        assert row["blocks_touched"] == 2
+        assert row["payload_size"] == len(compacted.payload)
+
+
+def payload_url(document, version, kind):
+    return reverse(
+        f"document-update-{kind}",
+        kwargs={"doc_uuid": str(document.doc_uuid), "pk": version.id},
+    )
+
+
+@pytest.mark.django_db
+class TestVersionPayloadEndpoints:
+    @pytest.fixture
+    def versions(self, user, document):
+        client_doc = YDoc()
+        versions = []
+        for text in ["hello ", "world"]:
+            sv = encode_state_vector(client_doc)
+            with client_doc.begin_transaction() as txn:
+                ytext = client_doc.get_text("shared")
+                ytext.insert(txn, len(str(ytext)), text)
+            update = DocumentUpdate.objects.create(
+                document=document,
+                author=user,
+                update_data=encode_state_as_update(client_doc, sv),
+            )
+            versions.append(process_session([update]))
+        return versions
+
+    def test_delta(self, api_client, user, document, versions):
+        api_client.force_authenticate(user=user)
+        response = api_client.get(payload_url(document, versions[1], "delta"))
+
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/octet-stream"
+        assert response["ETag"] == f'"{versions[1].id}-delta"'
+        assert "immutable" in response["Cache-Control"]
+        assert b"".join(response.streaming_content) == bytes(versions[1].payload)
+
+    def test_state(self, api_client, user, document, versions):
+        api_client.force_authenticate(user=user)
+        response = api_client.get(payload_url(document, versions[1], "state"))
+
+        assert response.status_code == 200
+        ydoc = YDoc()
+        apply_update(ydoc, b"".join(response.streaming_content))
+        assert str(ydoc.get_text("shared")) == "hello world"
+
+    def test_matching_etag_skips_payload(self, api_client, user, document, versions):
+        api_client.force_authenticate(user=user)
+        url = payload_url(document, versions[0], "state")
+        etag = api_client.get(url)["ETag"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert not any("update_data" in q["sql"] for q in queries.captured_queries)
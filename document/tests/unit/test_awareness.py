@@ -0,0 +1,81 @@
+import asyncio
+from datetime import timedelta
+import pytest
+from document import metrics
+from document.awareness import (
+    RoomAwareness,
+    decode_awareness_update,
+    encode_awareness_update,
+)
+
+
+class FakeRoom:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, event, sender_channel=None):
+        self.published.append((decode_awareness_update(event["bytes"]), sender_channel))
+
+
+def cursor(client_id, clock, index):
+    return encode_awareness_update([(client_id, clock, f'{{"cursor":{index}}}')])
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+
+
+def test_encode_decode_roundtrip():
+    entries = [(1, 3, '{"user":"a"}'), (2, 7, None)]
+
+    assert decode_awareness_update(encode_awareness_update(entries)) == entries
+
+
+@pytest.mark.asyncio
+class TestRoomAwareness:
+    async def test_stale_and_duplicate_entries_dropped(self):
+        room = FakeRoom()
+        awareness = RoomAwareness(room, interval=timedelta(0))
+
+        await awareness.receive(cursor(1, 2, 5), "channel-1")
+        await awareness.receive(cursor(1, 2, 5), "channel-1")
+        await awareness.receive(cursor(1, 1, 4), "channel-1")
+
+        assert room.published == [([(1, 2, '{"cursor":5}')], "channel-1")]
+        assert metrics.counters["awareness.dropped"] == 2
+
+    async def test_updates_throttled_per_client_latest_wins(self):
+        room = FakeRoom()
+        awareness = RoomAwareness(room, interval=timedelta(milliseconds=20))
+
+        for clock in range(1, 6):
+            await awareness.receive(cursor(1, clock, clock), "channel-1")
+        await awareness.receive(cursor(2, 1, 0), "channel-2")
+        assert [entries for entries, _ in room.published] == [
+            [(1, 1, '{"cursor":1}')],
+            [(2, 1, '{"cursor":0}')],
+        ]
+
+        await asyncio.sleep(0.05)
+
+        assert room.published[-1] == ([(1, 5, '{"cursor":5}')], "channel-1")
+        assert metrics.counters["awareness.throttled"] == 4
+
+    async def test_snapshot_and_disconnect(self):
+        room = FakeRoom()
+        awareness = RoomAwareness(room, interval=timedelta(0))
+        await awareness.receive(cursor(1, 1, 0), "channel-1")
+        await awareness.receive(cursor(2, 4, 9), "channel-2")
+
+        assert sorted(decode_awareness_update(awareness.snapshot())) == [
+            (1, 1, '{"cursor":0}'),
+            (2, 4, '{"cursor":9}'),
+        ]
+
+        await awareness.disconnect("channel-2")
+
+        assert room.published[-1] == ([(2, 5, None)], "channel-2")
+        assert decode_awareness_update(awareness.snapshot()) == [(1, 1, '{"cursor":0}')]
+        await awareness.disconnect("channel-1")
+        assert awareness.snapshot() is None
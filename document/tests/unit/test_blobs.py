@@ -0,0 +1,75 @@
+import os
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from y_py import YDoc, apply_update, encode_state_as_update
+from document import codecs
+from document.blobs import FileSystemBlobStore
+
+
+@pytest.fixture
+def blob_store(settings, tmp_path):
+    settings.DOCUMENT_BLOB_STORE_DIR = str(tmp_path)
+    settings.DOCUMENT_BLOB_THRESHOLD = 1024
+    return FileSystemBlobStore(tmp_path)
+
+
+class TestFileSystemBlobStore:
+    def test_put_and_open(self, tmp_path):
+        store = FileSystemBlobStore(tmp_path)
+        key = store.put(b"payload")
+
+        assert store.path(key).exists()
+        assert store.open(key) == b"payload"
+        assert [k for k, _ in store.keys()] == [key]
+
+    def test_identical_payloads_share_a_file(self, tmp_path):
+        store = FileSystemBlobStore(tmp_path)
+        key = store.put(b"payload")
+        os.utime(store.path(key), (0, 0))
+
+        assert store.put(b"payload") == key
+        assert len(list(store.keys())) == 1
+        assert store.path(key).stat().st_mtime > 0
+
+    def test_delete(self, tmp_path):
+        store = FileSystemBlobStore(tmp_path)
+        key = store.put(b"payload")
+        store.delete(key)
+        store.delete(key)
+
+        assert list(store.keys()) == []
+
+
+class TestBlobCodec:
+    def test_large_payload_goes_to_blob(self, blob_store):
+        data = os.urandom(2048)
+        codec, stored = codecs.encode(data)
+
+        assert codec == codecs.BLOB
+        assert stored == f"{codecs.get_blob_key(codec, stored)}:2048".encode()
+        decoded = codecs.decode(codec, stored)
+        assert isinstance(decoded, memoryview)
+        assert decoded == data
+
+    def test_small_payload_stays_in_row(self, blob_store):
+        assert codecs.encode(b"x" * 512)[0] == "zlib"
+
+    def test_apply_update_from_blob(self, blob_store):
+        ydoc = YDoc()
+        with ydoc.begin_transaction() as txn:
+            ydoc.get_text("shared").insert(txn, 0, "x" * 4096)
+        codec, stored = codecs.encode(encode_state_as_update(ydoc), min_size=0)
+
+        target = YDoc()
+        apply_update(target, codecs.decode(codec, stored))
+        assert str(target.get_text("shared")) == "x" * 4096
+
+    def test_length_mismatch(self, blob_store):
+        codec, stored = codecs.encode(os.urandom(2048))
+        with pytest.raises(ValueError):
+            codecs.decode(codec, stored.replace(b":2048", b":2047"))
+
+    def test_not_configured(self, settings):
+        settings.DOCUMENT_BLOB_STORE_DIR = None
+        with pytest.raises(ImproperlyConfigured):
+            codecs.encode(b"payload", codecs.BLOB)
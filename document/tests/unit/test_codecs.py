@@ -0,0 +1,53 @@
+import zlib
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from document import codecs
+from document.models import DocumentUpdate
+
+
+PAYLOAD = b"hello world " * 100
+
+
+class TestCodecs:
+    @pytest.mark.parametrize("codec", ["zlib", "lzma"])
+    def test_roundtrip(self, codec):
+        stored_codec, stored = codecs.encode(PAYLOAD, codec, min_size=0)
+
+        assert stored_codec == codec
+        assert len(stored) < len(PAYLOAD)
+        assert codecs.decode(stored_codec, memoryview(stored)) == PAYLOAD
+
+    def test_small_payload_stays_raw(self):
+        assert codecs.encode(b"tiny", "zlib", min_size=256) == (codecs.RAW, b"tiny")
+
+    def test_incompressible_payload_stays_raw(self):
+        data = bytes(range(256))
+        assert codecs.encode(data, "lzma", min_size=0) == (codecs.RAW, data)
+
+    def test_default_codec_from_settings(self, settings):
+        settings.DOCUMENT_UPDATE_CODEC = "lzma"
+        settings.DOCUMENT_UPDATE_COMPRESS_MIN_SIZE = 0
+        assert codecs.encode(PAYLOAD)[0] == "lzma"
+
+    def test_unknown_codec(self):
+        with pytest.raises(ImproperlyConfigured):
+            codecs.encode(PAYLOAD, "nope", min_size=0)
+
+    def test_register_codec(self, monkeypatch):
+        monkeypatch.setattr(codecs, "CODECS", dict(codecs.CODECS))
+        codecs.register_codec(
+            "zlib-9", lambda d: zlib.compress(d, 9), zlib.decompress
+        )
+
+        stored_codec, stored = codecs.encode(PAYLOAD, "zlib-9", min_size=0)
+        assert stored_codec == "zlib-9"
+        assert codecs.decode(stored_codec, stored) == PAYLOAD
+
+    def test_payload_accessor(self, settings):
+        settings.DOCUMENT_UPDATE_CODEC = "zlib"
+        settings.DOCUMENT_UPDATE_COMPRESS_MIN_SIZE = 0
+        update = DocumentUpdate(payload=PAYLOAD)
+
+        assert update.codec == "zlib"
+        assert bytes(update.update_data) != PAYLOAD
+        assert update.payload == PAYLOAD
@@ -0,0 +1,82 @@
+import json
+import pytest
+from document import metrics
+from document.protocol import InvalidMessage, TextMessageDispatcher
+
+
+class RecordingConsumer:
+    channel_name = "test-channel"
+
+    def __init__(self):
+        self.calls = []
+
+    async def handle_comment(self, message, text_data):
+        self.calls.append(("comment", message, text_data))
+
+    async def handle_default(self, message, text_data):
+        self.calls.append(("default", message, text_data))
+
+
+@pytest.fixture
+def dispatcher():
+    metrics.reset()
+    return TextMessageDispatcher(
+        handlers={"comment_created": "handle_comment"},
+        default="handle_default",
+        max_size=128,
+    )
+
+
+class TestTextMessageDispatcherParse:
+    def test_parse_valid_message(self, dispatcher):
+        assert dispatcher.parse('{"type": "comment_created"}') == {
+            "type": "comment_created"
+        }
+
+    @pytest.mark.parametrize(
+        "text_data",
+        [
+            "{'type': 'comment_created'}",
+            "__import__('os').system('true')",
+            "[1, 2, 3]",
+            '{"data": "no type"}',
+            '{"type": 5}',
+        ],
+    )
+    def test_parse_rejects_malformed_frames(self, dispatcher, text_data):
+        with pytest.raises(InvalidMessage):
+            dispatcher.parse(text_data)
+
+    def test_parse_rejects_oversized_frames(self, dispatcher):
+        with pytest.raises(InvalidMessage):
+            dispatcher.parse(json.dumps({"type": "x", "data": "a" * 200}))
+
+
+@pytest.mark.asyncio
+class TestTextMessageDispatcherDispatch:
+    async def test_routes_by_type_with_raw_frame(self, dispatcher):
+        consumer = RecordingConsumer()
+        text_data = '{"type": "comment_created", "data": 1}'
+
+        await dispatcher.dispatch(consumer, text_data)
+
+        assert consumer.calls == [
+            ("comment", {"type": "comment_created", "data": 1}, text_data)
+        ]
+        assert metrics.counters["text_frames.comment_created"] == 1
+
+    async def test_unknown_type_goes_to_default(self, dispatcher):
+        consumer = RecordingConsumer()
+
+        await dispatcher.dispatch(consumer, '{"type": "cursor"}')
+
+        assert consumer.calls[0][0] == "default"
+        assert metrics.counters["text_frames.default"] == 1
+
+    async def test_invalid_frame_is_dropped(self, dispatcher):
+        consumer = RecordingConsumer()
+
+        await dispatcher.dispatch(consumer, "not json")
+
+        assert consumer.calls == []
+        assert metrics.counters["text_frames.rejected"] == 1
@@ -0,0 +1,317 @@
+import asyncio
+import pytest
+from datetime import timedelta
+from y_py import YDoc, apply_update, encode_state_as_update, encode_state_vector
+from ypy_websocket.yutils import create_update_message, read_message
+from channels.layers import InMemoryChannelLayer
+from document import metrics, persistence
+from document.rooms import (
+    RESYNC_CLOSE_CODE,
+    DocumentRoom,
+    Outbox,
+    RoomRegistry,
+    get_process_id,
+)
+
+
+def get_yjs_update_bytes(text="Hello"):
+    ydoc = YDoc()
+    with ydoc.begin_transaction() as txn:
+        ydoc.get_text("shared").insert(txn, 0, text)
+    return encode_state_as_update(ydoc)
+
+
+class FakeConsumer:
+    channel_layer = None
+
+    def __init__(self, channel_name):
+        self.channel_name = channel_name
+        self.events = []
+
+    async def dispatch(self, event):
+        self.events.append(event)
+
+    async def close(self, code=None):
+        self.close_code = code
+
+
+@pytest.mark.asyncio
+class TestRoomRegistry:
+    async def test_connections_share_one_room(self):
+        registry = RoomRegistry()
+        calls = []
+
+        async def fetch_updates():
+            calls.append(1)
+            return [get_yjs_update_bytes("shared room")]
+
+        room1 = await registry.join("doc", 1, FakeConsumer("channel-1"), fetch_updates)
+        room2 = await registry.join("doc", 1, FakeConsumer("channel-2"), fetch_updates)
+
+        assert room1 is room2
+        assert len(room1) == 2
+        assert len(calls) == 1
+        assert str(room1.ydoc.get_text("shared")) == "shared room"
+
+    async def test_room_closed_after_last_leave(self):
+        registry = RoomRegistry()
+
+        async def fetch_updates():
+            return []
+
+        await registry.join("doc", 1, FakeConsumer("channel-1"), fetch_updates)
+        await registry.join("doc", 1, FakeConsumer("channel-2"), fetch_updates)
+
+        await registry.leave("doc", "channel-1")
+        assert "doc" in registry
+        await registry.leave("doc", "channel-2")
+        assert "doc" not in registry
+
+    async def test_failed_load_releases_connection(self):
+        registry = RoomRegistry()
+
+        async def fetch_updates():
+            raise RuntimeError("database unavailable")
+
+        with pytest.raises(RuntimeError):
+            await registry.join("doc", 1, FakeConsumer("channel-1"), fetch_updates)
+        assert "doc" not in registry
+
+    async def test_broadcast_shares_event_with_local_peers(self):
+        registry = RoomRegistry()
+
+        async def fetch_updates():
+            return []
+
+        consumers = [FakeConsumer(f"channel-{i}") for i in range(3)]
+        for consumer in consumers:
+            room = await registry.join("doc", 1, consumer, fetch_updates)
+        event = {"type": "yjs_update", "bytes": b"update"}
+
+        await room.publish(event, sender_channel="channel-0")
+        await asyncio.sleep(0)
+
+        assert consumers[0].events == []
+        assert all(c.events[0] is event for c in consumers[1:])
+        for consumer in consumers:
+            await registry.leave("doc", consumer.channel_name)
+
+    async def test_relay_delivers_events_from_other_publishers(self):
+        registry = RoomRegistry()
+        layer = InMemoryChannelLayer()
+
+        async def fetch_updates():
+            return []
+
+        consumer = FakeConsumer("channel-1")
+        consumer.channel_layer = layer
+        room = await registry.join("doc", 1, consumer, fetch_updates)
+
+        await layer.group_send(room.group_name, {"type": "yjs_update", "bytes": b"x"})
+        await layer.group_send(
+            room.group_name, {"type": "yjs_update", "origin": get_process_id()}
+        )
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        assert [event["bytes"] for event in consumer.events] == [b"x"]
+        await registry.leave("doc", "channel-1")
+        assert layer.groups.get(room.group_name) in (None, {})
+
+
+@pytest.mark.asyncio
+class TestUpdateCoalescer:
+    async def join_room(self, registry, count):
+        async def fetch_updates():
+            return []
+
+        consumers = [FakeConsumer(f"channel-{i}") for i in range(count)]
+        for consumer in consumers:
+            room = await registry.join("doc", 1, consumer, fetch_updates)
+        return room, consumers
+
+    async def receive_updates(self, room, sender_channel, updates):
+        # Applied like DocumentRoom.apply_update, without persisting them
+        for update in updates:
+            room.coalescer.begin()
+            apply_update(room.ydoc, update)
+            await room.coalescer.add(create_update_message(update), sender_channel)
+
+    def typed_updates(self, *texts):
+        ydoc, updates = YDoc(), []
+        for text in texts:
+            state_vector = encode_state_vector(ydoc)
+            with ydoc.begin_transaction() as txn:
+                shared = ydoc.get_text("shared")
+                shared.extend(txn, text)
+            updates.append(encode_state_as_update(ydoc, state_vector))
+        return updates
+
+    async def test_updates_in_window_fanned_out_as_one_event(self):
+        metrics.reset()
+        registry = RoomRegistry()
+        room, consumers = await self.join_room(registry, 3)
+
+        await self.receive_updates(room, "channel-0", self.typed_updates("a", "b", "c"))
+        await asyncio.sleep(0)
+        assert consumers[1].events == []
+        await asyncio.sleep(room.coalescer.window + 0.05)
+
+        assert consumers[0].events == []
+        for consumer in consumers[1:]:
+            (event,) = consumer.events
+            ydoc = YDoc()
+            apply_update(ydoc, read_message(event["bytes"][2:]))
+            assert str(ydoc.get_text("shared")) == "abc"
+        assert metrics.counters["coalesce.messages_saved"] == 2
+        for consumer in consumers:
+            await registry.leave("doc", consumer.channel_name)
+
+    async def test_window_with_several_senders_reaches_everyone(self):
+        registry = RoomRegistry()
+        room, consumers = await self.join_room(registry, 2)
+        first, second = self.typed_updates("a", "b")
+
+        await self.receive_updates(room, "channel-0", [first])
+        await self.receive_updates(room, "channel-1", [second])
+        await room.coalescer.flush()
+        await asyncio.sleep(0)
+
+        assert len(consumers[0].events) == len(consumers[1].events) == 1
+        assert consumers[0].events[0]["sender_channel"] is None
+        for consumer in consumers:
+            await registry.leave("doc", consumer.channel_name)
+
+    async def test_disabled_window_fans_out_right_away(self, settings):
+        settings.DOCUMENT_UPDATE_COALESCE_WINDOW = timedelta(0)
+        registry = RoomRegistry()
+        room, consumers = await self.join_room(registry, 2)
+        (update,) = self.typed_updates("a")
+
+        await self.receive_updates(room, "channel-0", [update])
+        await asyncio.sleep(0)
+
+        assert consumers[1].events[0]["bytes"] == create_update_message(update)
+        for consumer in consumers:
+            await registry.leave("doc", consumer.channel_name)
+
+
+class StalledConsumer(FakeConsumer):
+    def __init__(self, channel_name):
+        super().__init__(channel_name)
+        self.unblocked = asyncio.Event()
+
+    async def dispatch(self, event):
+        await self.unblocked.wait()
+        await super().dispatch(event)
+
+
+@pytest.mark.asyncio
+class TestOutbox:
+    def queue_updates(self, room, outbox, texts):
+        for text in texts:
+            state_vector = encode_state_vector(room.ydoc)
+            with room.ydoc.begin_transaction() as txn:
+                room.ydoc.get_text("shared").extend(txn, text)
+            update = encode_state_as_update(room.ydoc, state_vector)
+            outbox.put(
+                {
+                    "type": "yjs_update",
+                    "bytes": create_update_message(update),
+                    "state_vector": state_vector,
+                }
+            )
+
+    async def test_full_queue_coalesces_pending_updates(self):
+        metrics.reset()
+        room = DocumentRoom("doc", 1)
+        consumer = StalledConsumer("channel-1")
+        outbox = Outbox(consumer, room, max_size=3, policy="coalesce")
+        outbox.start()
+        await asyncio.sleep(0)
+        outbox.put({"type": "default_send", "text_data": "hi"})
+        self.queue_updates(room, outbox, ["a", "b", "c", "d", "e"])
+
+        assert len(outbox) <= 3
+        consumer.unblocked.set()
+        await asyncio.sleep(0.01)
+
+        ydoc = YDoc()
+        for event in consumer.events:
+            if event["type"] == "yjs_update":
+                apply_update(ydoc, read_message(event["bytes"][2:]))
+        assert str(ydoc.get_text("shared")) == "abcde"
+        assert metrics.counters["outbox.overflows"] >= 1
+        assert metrics.observations["outbox.depth"].max <= 3
+        await outbox.close()
+
+    async def test_full_queue_disconnects_with_resync_code(self):
+        room = DocumentRoom("doc", 1)
+        consumer = StalledConsumer("channel-1")
+        outbox = Outbox(consumer, room, max_size=2, policy="disconnect")
+        outbox.start()
+        await asyncio.sleep(0)
+
+        self.queue_updates(room, outbox, ["a", "b", "c", "d"])
+        await asyncio.sleep(0)
+
+        assert consumer.close_code == RESYNC_CLOSE_CODE
+        assert len(outbox) == 0
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+class TestCompactionTrigger:
+    @pytest.fixture(autouse=True)
+    def scheduled(self, settings, monkeypatch):
+        settings.DOCUMENT_COMPACT_ON_IDLE = True
+        scheduled = []
+        monkeypatch.setattr(
+            persistence,
+            "schedule_compaction",
+            lambda document_id, countdown: scheduled.append((document_id, countdown)),
+        )
+        return scheduled
+
+    def make_room(self):
+        room = DocumentRoom("doc", 7)
+        room.compaction.idle_timeout = 0.05
+        return room
+
+    async def test_idle_room_schedules_compaction(self, scheduled):
+        room = self.make_room()
+
+        room.compaction.touch()
+        await asyncio.sleep(0.03)
+        room.compaction.touch()
+        await asyncio.sleep(0.03)
+        assert scheduled == []
+        await asyncio.sleep(0.06)
+
+        assert len(scheduled) == 1
+        document_id, countdown = scheduled[0]
+        assert document_id == 7
+        assert countdown == pytest.approx(
+            room.buffer.window + persistence.COMPACTION_SLACK, abs=0.02
+        )
+        await room.compaction.close()
+        assert len(scheduled) == 1
+
+    async def test_closing_room_schedules_remaining_idle_time(self, scheduled):
+        room = self.make_room()
+        room.compaction.idle_timeout = 60
+
+        room.compaction.touch()
+        await room.compaction.close()
+
+        (document_id, countdown), = scheduled
+        assert countdown == pytest.approx(
+            60 + room.buffer.window + persistence.COMPACTION_SLACK, abs=0.1
+        )
+
+    async def test_untouched_room_schedules_nothing(self, scheduled):
+        room = self.make_room()
+
+        await room.compaction.close()
+
+        assert scheduled == []
@@ -1,7 +1,7 @@
 import uuid
 import pytest
 from django.urls import reverse
-from unittest.mock import Mock
+from unittest.mock import MagicMock, Mock
 from django.contrib.auth import get_user_model
 from model_bakery import baker
 from django.test import SimpleTestCase
@@ -335,7 +335,12 @@ class TestDocumentUpdateViewSet(SimpleTestCase):
     @patch.object(DocumentUpdateViewSet, "get_serializer")
     @patch.object(DocumentUpdateViewSet, "get_queryset")
     def test_list_documentupdate(self, mock_get_queryset, mock_get_serializer):
-        mock_get_queryset.return_value = [self.document_update, self.document_update]
+        mock_queryset = MagicMock()
+        mock_queryset.order_by.return_value.__getitem__.return_value = [
+            self.document_update,
+            self.document_update,
+        ]
+        mock_get_queryset.return_value = mock_queryset
         mock_serializer_instance = Mock()
         mock_serializer_instance.data = [{"id": 1}, {"id": 2}]
         mock_get_serializer.return_value = mock_serializer_instance
@@ -345,7 +350,7 @@ class TestDocumentUpdateViewSet(SimpleTestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
 
     def test_post_documentupdate_return_405(self):
         response = self.client.post(
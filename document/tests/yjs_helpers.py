@@ -0,0 +1,15 @@
+from y_py import encode_state_as_update, encode_state_vector
+
+
+def edit(ydoc, text, index=None):
+    """
+    Inserts text in the "shared" Y.Text of a client doc, at the end by default.
+
+    Returns:
+        bytes: The update of the edit.
+    """
+    sv = encode_state_vector(ydoc)
+    with ydoc.begin_transaction() as txn:
+        ytext = ydoc.get_text("shared")
+        ytext.insert(txn, len(str(ytext)) if index is None else index, text)
+    return encode_state_as_update(ydoc, sv)
@@ -1,12 +1,26 @@
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework import mixins
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
+from asgiref.sync import async_to_sync
 from django.conf import settings
+from y_py import encode_state_as_update
 
+from .access import (
+    can_manage_permissions,
+    get_access_level,
+    get_document_access,
+    has_access,
+)
+from .diffs import get_version_diff
+from .pagination import VersionKeysetPagination
+from .responses import immutable_payload_response
+from .restore import EMPTY_UPDATE, build_restore_update
+from .rooms import publish_update
+from .snapshots import load_version_ydoc
 from .utility import *
 from .permissions import *
 from .serializers import *
@@ -136,24 +150,12 @@ class DocumentPermissionViewSet(GenericViewSet):
     )
     def get_permission_list(self, request, document=None):
         # document = request.query_params.get('document')
-        try:
-            document = Document.objects.get(pk=document)
-        except Document.DoesNotExist:
+        if get_document_access(document) is None:
             return Response(
                 {"message": "Document not found"}, status=status.HTTP_404_NOT_FOUND
             )
         # making sure share access is public or user is owner or admin
-        if not (
-            document.public_premission_access
-            or (
-                request.user == document.owner
-                or AccessLevel.objects.filter(
-                    user=request.user,
-                    document=document,
-                    access_level__gte=AccessLevel.PERMISSION_MAP["Admin"],
-                ).exists()
-            )
-        ):
+        if not can_manage_permissions(request.user, document):
             return Response(
                 {
                     "message": "You don't have permission to get permissions for this document"
@@ -174,20 +176,11 @@ class DocumentPermissionViewSet(GenericViewSet):
         methods=["GET"], detail=False, url_path="get_user_permission/(?P<document>\d+)"
     )
     def get_user_permission(self, request, document=None):
-        try:
-            document = Document.objects.get(pk=document)
-        except Document.DoesNotExist:
+        access_level = get_access_level(request.user, document)
+        if access_level is None:
             return Response(
                 {"message": "Document not found"}, status=status.HTTP_404_NOT_FOUND
             )
-        access_instance = AccessLevel.objects.filter(
-            document=document, user=request.user
-        ).first()
-        access_level = (
-            access_instance.access_level
-            if access_instance
-            else document.default_access_level
-        )
         data = {
             "access_level": AccessLevel.ACCESS_LEVELS[access_level],
             "can_write": access_level > 1,
@@ -233,18 +226,109 @@ class DocumentUpdateViewSet(
     mixins.ListModelMixin,
     GenericViewSet,
 ):
+    pagination_class = VersionKeysetPagination
+
     def get_queryset(self):
         doc_uuid = self.kwargs["doc_uuid"]
-        queryset = (
-            DocumentUpdate.objects.select_related("document")
-            .filter(document__doc_uuid=doc_uuid, is_compacted=True)
+        queryset = DocumentUpdate.objects.filter(
+            document__doc_uuid=doc_uuid, is_compacted=True
+        )
+        if self.action == "list":
+            # Only what the list shows, never the payloads
+            return queryset.only(
+                "id",
+                "title",
+                "document_id",
+                "processed",
+                "is_compacted",
+                "created_at",
+                "chars_inserted",
+                "chars_deleted",
+                "blocks_touched",
+                "payload_size",
+            ).prefetch_related(
+                Prefetch(
+                    "authors",
+                    queryset=User.objects.only(
+                        "id", "username", "first_name", "last_name"
+                    ),
+                )
+            )
+        if self.action in ["state", "delta"]:
+            # The payload is only read if the client's ETag is stale
+            return queryset.defer("update_data")
+        return (
+            queryset.select_related("document")
             .select_related("author")
             .prefetch_related("authors")
         )
-        return queryset
 
     def get_serializer_class(self):
         if self.action in ["list", "partial_update"]:
             return CompactedDocumentUpdateSerializer
         elif self.action == "retrieve":
             return CompactedDocumentUpdateSerializerRetrieve
+
+    @action(methods=["GET"], detail=True)
+    def state(self, request, doc_uuid=None, pk=None):
+        """
+        Raw Yjs state of the document right after this version.
+        """
+        version = self.get_object()
+        return immutable_payload_response(
+            request,
+            f'"{version.id}-state"',
+            lambda: encode_state_as_update(load_version_ydoc(version)),
+        )
+
+    @action(methods=["GET"], detail=True)
+    def delta(self, request, doc_uuid=None, pk=None):
+        """
+        Raw Yjs update of this version.
+        """
+        version = self.get_object()
+        return immutable_payload_response(
+            request, f'"{version.id}-delta"', lambda: version.payload
+        )
+
+    @action(methods=["POST"], detail=True)
+    def restore(self, request, doc_uuid=None, pk=None):
+        """
+        Brings the document back to this version with a new forward update.
+        """
+        version = self.get_object()
+        if not has_access(
+            request.user, version.document_id, AccessLevel.PERMISSION_MAP["Writer"]
+        ):
+            return Response(
+                {"message": "You don't have permission to edit this document"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        update = build_restore_update(version)
+        if update == EMPTY_UPDATE:
+            return Response(
+                {"version": version.id, "update": None, "size": 0},
+                status=status.HTTP_200_OK,
+            )
+        restored = DocumentUpdate.objects.create(
+            document_id=version.document_id, author=request.user, payload=update
+        )
+        async_to_sync(publish_update)(doc_uuid, update)
+        return Response(
+            {"version": version.id, "update": restored.id, "size": len(update)},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(methods=["GET"], detail=True, url_path=r"diff/(?P<other>\d+)")
+    def diff(self, request, doc_uuid=None, pk=None, other=None):
+        """
+        Text diff from this version to another one of the same document.
+        """
+        version = self.get_object()
+        try:
+            other = self.get_queryset().get(pk=other)
+        except DocumentUpdate.DoesNotExist:
+            return Response(
+                {"message": "Version not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(get_version_diff(version, other), status=status.HTTP_200_OK)
@@ -7,6 +7,7 @@ from iransanad.routing import websocket_urlpatterns
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iransanad.settings")
 app = get_asgi_application()
 from .middlewares.JWTAuthMiddleware import JWTAuthMiddleware
+from .lifespan import LifespanApp
 
 application = ProtocolTypeRouter(
     {
@@ -14,5 +15,6 @@ application = ProtocolTypeRouter(
         "websocket": AuthMiddlewareStack(
             JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
         ),
+        "lifespan": LifespanApp(),
     }
 )
@@ -0,0 +1,24 @@
+import logging
+from document.rooms import room_registry
+
+logger = logging.getLogger(__name__)
+
+
+class LifespanApp:
+    """
+    Handles ASGI lifespan events so buffered document updates are written
+    before the server process exits.
+    """
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await room_registry.close_all()
+                except Exception as e:
+                    logger.error(f"Error closing document rooms: {e}")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -119,11 +119,24 @@ USE_TZ = True
 
 ASGI_APPLICATION = "iransanad.asgi.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# Pub/sub shards shared by all ASGI workers, e.g. "redis://redis:6379/3" or
+# "unix:///tmp/iransanad-broker.sock" (see run_channel_broker). Without any,
+# every worker only reaches the connections it holds itself.
+CHANNEL_LAYER_SHARDS = env.list("CHANNEL_LAYER_SHARDS", default=[])
+
+if CHANNEL_LAYER_SHARDS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "core.layers.ShardedChannelLayer",
+            "CONFIG": {"shards": CHANNEL_LAYER_SHARDS},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
 
 
 STATIC_URL = f"api/v{VERSION}/static/"
@@ -189,6 +202,77 @@ SWAGGER_SETTINGS = {
 
 UPDATE_COMPACTING_THRESHOLD = timedelta(minutes=6)
 
+# Codec new DocumentUpdate payloads are stored with ("raw", "zlib", "lzma" or
+# one added with document.codecs.register_codec). Smaller payloads stay raw.
+DOCUMENT_UPDATE_CODEC = "zlib"
+DOCUMENT_UPDATE_COMPRESS_MIN_SIZE = 256
+
+# Directory of the content-addressed blob store. When set, update and snapshot
+# payloads of DOCUMENT_BLOB_THRESHOLD bytes or more are kept there as files and
+# their rows only hold the hash and length.
+DOCUMENT_BLOB_STORE_DIR = env("DOCUMENT_BLOB_STORE_DIR", default=None)
+DOCUMENT_BLOB_THRESHOLD = 64 * 1024
+
+# Compacted updates between two checkpoints of the version history.
+DOCUMENT_CHECKPOINT_INTERVAL = 50
+
+# Root shared type of the editor, "text" for a Y.Text or "xml" for a
+# Y.XmlElement, read to diff versions.
+DOCUMENT_TEXT_ROOT = "shared"
+DOCUMENT_TEXT_ROOT_TYPE = "text"
+DOCUMENT_DIFF_CACHE_TIMEOUT = timedelta(days=7)
+
+# Resolved document access levels, kept in a per-process LRU in front of the
+# Django cache. Saves and deletes clear both in the process that made them,
+# other processes see the change once their LRU entry expires. The Django
+# cache tier must be shared by every process (CACHE_URL), a per-process one
+# would keep revoked access for DOCUMENT_ACCESS_CACHE_TIMEOUT, so it is only
+# used when DOCUMENT_ACCESS_CACHE_SHARED, set below from CACHES.
+DOCUMENT_ACCESS_CACHE_SIZE = 4096
+DOCUMENT_ACCESS_LOCAL_TTL = timedelta(seconds=5)
+DOCUMENT_ACCESS_CACHE_TIMEOUT = timedelta(minutes=10)
+
+# Update payloads the compaction task holds in memory at once.
+DOCUMENT_COMPACTION_CHUNK_SIZE = 500
+
+# Queue the compaction of a document when its room goes idle or closes. The
+# periodic task then only sweeps up what was missed.
+DOCUMENT_COMPACT_ON_IDLE = env.bool("DOCUMENT_COMPACT_ON_IDLE", default=True)
+
+# How long a document stays claimed by a compaction task that never finished.
+# Claims are database rows, shared by every worker whatever CACHE_URL is.
+DOCUMENT_COMPACTION_CLAIM_TIMEOUT = timedelta(minutes=30)
+
+# Write-behind persistence of incoming document updates. A buffer is flushed
+# when it holds this many updates/bytes or when the durability window elapses.
+DOCUMENT_UPDATE_BUFFER_SIZE = 200
+DOCUMENT_UPDATE_BUFFER_BYTES = 256 * 1024
+DOCUMENT_UPDATE_DURABILITY_WINDOW = timedelta(milliseconds=500)
+
+# Yjs updates a room receives within this window are fanned out to peers as
+# one merged update. Zero sends every update as soon as it arrives.
+DOCUMENT_UPDATE_COALESCE_WINDOW = timedelta(milliseconds=30)
+
+# Awareness (cursor/selection) changes of a client are forwarded to the room at
+# most once per interval, the latest state winning.
+DOCUMENT_AWARENESS_INTERVAL = timedelta(milliseconds=100)
+
+# Events queued for a single connection. When a slow client lets its queue
+# fill up, "coalesce" merges the pending Yjs updates and awareness frames and
+# "disconnect" closes the socket with code 4008 so the client resyncs.
+DOCUMENT_OUTBOX_SIZE = 256
+DOCUMENT_OUTBOX_POLICY = "coalesce"
+
+# Text frames of the document WebSocket larger than this are dropped unparsed.
+DOCUMENT_MAX_TEXT_FRAME_SIZE = 64 * 1024
+
+
+# Shared by the ASGI, WSGI and Celery processes, e.g. "redis://redis:6379/2".
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+DOCUMENT_ACCESS_CACHE_SHARED = not CACHES["default"]["BACKEND"].endswith(
+    ("LocMemCache", "DummyCache")
+)
+
 
 # Celery settings
 CELERY_BROKER_URL = "redis://redis:6379/1"
@@ -199,8 +283,12 @@ CELERY_TIMEZONE = "Asia/Tehran"
 CELERY_BEAT_SCHEDULE = {
     "compact_document_updates": {
         "task": "document.tasks.compact_document_updates",
-        "schedule": crontab(minute="*/5"),  # Every 10 minutes
-    }
+        "schedule": crontab(minute=0),  # Hourly safety net, rooms trigger compaction
+    },
+    "merge_compacted_updates": {
+        "task": "document.tasks.merge_compacted_updates",
+        "schedule": crontab(minute=30, hour=3),  # Daily, off-peak
+    },
 }
 
 GROQ_API_KEY = env("GROQ_API_KEY")
\ No newline at end of file